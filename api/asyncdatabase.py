@@ -0,0 +1,45 @@
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+import asynckivy
+from api.database import Database
+
+# This metaclass is what lets AsyncDatabase mirror the Database API
+# without restating every method: any attribute looked up on the class
+# becomes an awaitable version of the Database classmethod with that name
+class _AsyncDatabaseType(type):
+    def __getattr__(cls, name):
+        method = getattr(Database, name)
+
+        async def call(*args, **kwargs):
+            # identifies this call's sessions, so a cancel only ever reaches the connections it is using
+            token = object()
+
+            def run():
+                with Database.cancellable(token):
+                    return method(*args, **kwargs)
+
+            try:
+                return await asynckivy.run_in_executor(cls._executor, run)
+            except asynckivy.Cancelled:
+                # nobody is waiting for the result anymore, so the server can stop working on it
+                Database.cancel(token)
+                raise
+
+        call.__name__ = name
+        return call
+
+# This is the non-blocking facade the screens and forms use.
+# The query runs on a worker thread (each worker borrows its own pooled connection)
+# and the awaiting task resumes on the Kivy main loop, so the window keeps drawing.
+# Cancelling the awaiting task also cancels the statement the worker is running on the server.
+#
+# USAGE:
+# async def load():
+#     products = await AsyncDatabase.get_product_list()
+# asynckivy.start(load())
+class AsyncDatabase(metaclass = _AsyncDatabaseType):
+    _executor = ThreadPoolExecutor(max_workers = 4, thread_name_prefix = "database")
+
+    @classmethod
+    def shutdown(cls):
+        cls._executor.shutdown(wait = True, cancel_futures = True)
@@ -0,0 +1,61 @@
+import asynckivy
+
+# Collects the lookups that widgets make during the same frame and resolves them
+# with a single call to a batch method, instead of one query per widget.
+# Every caller still awaits its own key and gets back its own row (None when it was not found).
+# When the load itself fails (it raises, or returns None like the Database methods do on an error)
+# every caller of that batch gets a LoadError instead, a row that could not be read is not a missing one.
+#
+# USAGE:
+# tags = BatchLoader(AsyncDatabase.get_tags)
+# tag = await tags.load(7)
+# tags = await tags.load_many([7, 8, 9])
+class BatchLoader:
+    def __init__(self, load_many, key = lambda row: row["id"]):
+        self.__load_many = load_many
+        self.__key = key
+        self.__batch = None
+
+    # the batch still collecting keys, the first key of a frame opens it
+    def __collect(self, keys):
+        if self.__batch is None:
+            self.__batch = ({}, asynckivy.Event(), [])
+            asynckivy.start(self.__dispatch(self.__batch))
+        rows, loaded, errors = self.__batch
+        for key in keys:
+            rows.setdefault(key, None)
+        return rows, loaded, errors
+
+    async def __dispatch(self, batch):
+        rows, loaded, errors = batch
+        # everything asked for before the next frame rides along in this batch
+        await asynckivy.sleep(0)
+        self.__batch = None
+        try:
+            results = await self.__load_many(list(rows.keys()))
+            if results is None:
+                raise LoadError(f"could not load {list(rows.keys())}")
+            for row in results:
+                rows[self.__key(row)] = row
+        except Exception as error:
+            # raised to the callers, not into the main loop that runs this task
+            errors.append(error if isinstance(error, LoadError) else LoadError(str(error)))
+        finally:
+            loaded.set()
+
+    async def __wait(self, keys):
+        rows, loaded, errors = self.__collect(keys)
+        await loaded.wait()
+        if len(errors) != 0:
+            raise errors[0]
+        return rows
+
+    async def load(self, key):
+        return (await self.__wait([key]))[key]
+
+    async def load_many(self, keys: list):
+        rows = await self.__wait(keys)
+        return [rows[key] for key in keys]
+
+class LoadError(Exception):
+    pass
@@ -1,22 +1,61 @@
 import json
 import re
+import base64
+import threading
 from os import system
+from contextlib import contextmanager, nullcontext
 import psycopg2 as postgres
-
-class Pygres:
-    def __init__(self, database: str, user: str, password: str, host: str, port: str, ssl_mode: str):
+from psycopg2.pool import ThreadedConnectionPool
+from psycopg2.extensions import connection as PostgresConnection
+from psycopg2.extras import Json
+from nltk.stem.snowball import EnglishStemmer
+from api.migrations import MIGRATIONS, SEARCH_WEIGHTS, CATALOG_TABLES, search_expression
+from api.entitycache import EntityCache
+from api.tagindex import TagIndex
+from api.facetindex import FacetIndex
+from api.querybuilder import Statement, QueryBuilder
+
+# The pool hands these out instead of plain connections so each one
+# can remember which statements were already prepared on it, and which server process it talks to
+# (read while it is open, a dropped connection can no longer be asked)
+class PygresConnection(PostgresConnection):
+    def __init__(self, *args, **kwargs):
+        super(PygresConnection, self).__init__(*args, **kwargs)
+        self.prepared = set()
+        self.pid = self.get_backend_pid()
+
+# A session wraps one pooled connection and its own cursor.
+# It exposes the same calls the old single connection Pygres did,
+# so every Database method can run its transaction on its own connection
+class PygresSession:
+    def __init__(self, connection):
+        self._connection = connection
+        self._cursor = self._connection.cursor()
+
+    def __call__(self, query: str, parameters = None):
         try:
-            connection_string = f"postgresql://{user}:{password}@{host}:{port}/{database}?sslmode={ssl_mode}"
-            self._connection = postgres.connect(connection_string)
-            self._cursor = self._connection.cursor()
+            self._cursor.execute(query, parameters)
         except Exception as error:
-            raise ConnectionError("Error while connecting to database: " + str(error))
+            raise QueryError("Error while executing query: " + str(error))
 
-    def __call__(self, query: str):
+    def execute(self, statement: Statement, parameters: tuple = ()):
         try:
-            self._cursor.execute(query)
+            if statement.name not in self._connection.prepared:
+                self._cursor.execute(f"PREPARE {statement.name} AS {statement.query}")
+                self._connection.prepared.add(statement.name)
+                statement.prepares += 1
+
+            if len(parameters) > 0:
+                self._cursor.execute(f"EXECUTE {statement.name}({", ".join(["%s"] * len(parameters))});", parameters)
+            else:
+                self._cursor.execute(f"EXECUTE {statement.name};")
+            statement.hits += 1
         except Exception as error:
-            raise QueryError("Error while executing query: " + str(error))
+            raise QueryError(f"Error while executing statement {statement.name}: " + str(error))
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
 
     def fetch(self):
         try:
@@ -38,1024 +77,1572 @@ class Pygres:
             raise CommitError("Error while attempting to commit: " + str(error))
 
     def close(self):
-        self._connection.close()
+        self._cursor.close()
+
+class Pygres:
+    def __init__(self, database: str, user: str, password: str, host: str, port: str, ssl_mode: str,
+        min_connections: int = None, max_connections: int = 5, pre_ping: bool = True):
+        # the pool closes every connection handed back past min_connections idle ones, so by default all of them
+        # are kept, otherwise most calls would open a new connection (and prepare their statements again)
+        if min_connections is None:
+            min_connections = max_connections
+        try:
+            connection_string = f"postgresql://{user}:{password}@{host}:{port}/{database}?sslmode={ssl_mode}"
+            self._pool = ThreadedConnectionPool(min_connections, max_connections, connection_string, connection_factory = PygresConnection)
+        except Exception as error:
+            raise ConnectionError("Error while connecting to database: " + str(error))
+
+        self._connection_string = connection_string
+        self._listeners = []
+        # the connections the sessions of each cancellable call are running on, so another thread can cancel them.
+        # A session is taken out of here, under the lock, before its connection goes back to the pool,
+        # so a cancel can never reach a connection that was handed on to another caller.
+        self._running = {}
+        self._running_lock = threading.Lock()
+        self._scope = threading.local()
+        # the server processes behind the pooled connections, to tell this client's notifications from the others'
+        self._pids = set()
+
+        self._pre_ping = pre_ping
+        # the pool raises when it runs dry, so this makes callers wait for a free connection instead
+        self._available = threading.BoundedSemaphore(max_connections)
+
+    def _checkout(self):
+        connection = self._pool.getconn()
+        if self._pre_ping:
+            # a dropped connection (server restart, idle timeout) gets swapped for a fresh one
+            # the ping opens the transaction that the borrowing operation then continues
+            try:
+                with connection.cursor() as cursor:
+                    cursor.execute("SELECT 1;")
+            except postgres.Error:
+                self._pids.discard(connection.pid)
+                self._pool.putconn(connection, close = True)
+                connection = self._pool.getconn()
+        self._pids.add(connection.pid)
+        return connection
+
+    @contextmanager
+    def session(self):
+        self._available.acquire()
+        try:
+            try:
+                connection = self._checkout()
+            except Exception as error:
+                raise ConnectionError("Error while checking out a connection: " + str(error))
+
+            token = getattr(self._scope, "token", None)
+            if token is not None:
+                with self._running_lock:
+                    self._running.setdefault(token, []).append(connection)
+            session = PygresSession(connection)
+            try:
+                yield session
+            finally:
+                if token is not None:
+                    with self._running_lock:
+                        self._running[token].remove(connection)
+                        if len(self._running[token]) == 0:
+                            del self._running[token]
+                session.close()
+                # the pool rolls back anything the operation left uncommitted
+                self._pool.putconn(connection)
+                # and closes a lost connection (or one past min_connections) instead of keeping it, its pid
+                # may be handed to another client's connection later
+                if connection.closed:
+                    self._pids.discard(connection.pid)
+        finally:
+            self._available.release()
+
+    # A dedicated connection outside the pool that receives the NOTIFY messages sent on a channel.
+    # Calling poll() on it reads whatever has arrived into its notifies list without a round trip.
+    def listen(self, channel: str):
+        try:
+            connection = postgres.connect(self._connection_string)
+            connection.autocommit = True
+            with connection.cursor() as cursor:
+                cursor.execute(f"LISTEN {channel};")
+        except Exception as error:
+            raise ConnectionError(f"Error while listening on {channel}: " + str(error))
+        self._listeners.append(connection)
+        return connection
+
+    # whether a notification was sent by one of this pool's connections
+    def sent(self, notification):
+        return notification.pid in self._pids
+
+    # The sessions opened on this thread inside the block can be cancelled by the token,
+    # any object the caller keeps to identify this one call.
+    @contextmanager
+    def cancellable(self, token):
+        outer = getattr(self._scope, "token", None)
+        self._scope.token = token
+        try:
+            yield
+        finally:
+            self._scope.token = outer
+
+    # Asks the server to stop whatever statement the sessions of a cancellable call are running.
+    # The statement fails with a QueryError on that thread, the way any other failed query does.
+    # A call whose sessions have all ended has nothing left to cancel.
+    def cancel(self, token):
+        with self._running_lock:
+            for connection in self._running.get(token, []):
+                try:
+                    connection.cancel()
+                except postgres.Error:
+                    pass
+
+    def close(self):
+        for listener in self._listeners:
+            listener.close()
+        self._pool.closeall()
 
 class Database:
     _pygres = None
 
+    # the hot single entity lookups, each is prepared once per pooled connection
+    _statements = {statement.name: statement for statement in [
+        Statement("get_tag", "SELECT * FROM tag WHERE id = $1;"),
+        Statement("get_tags", "SELECT id, name, category_id FROM tag WHERE id = ANY($1::INT[]);"),
+        Statement("get_replacements", '''
+            SELECT json_build_object(
+                'id', product_variation.listing_id,
+                'extension', product_variation.extension
+            ) AS id, product_listing.name AS name
+            FROM product_listing INNER JOIN product_variation ON product_listing.id = product_variation.listing_id
+            WHERE (product_variation.listing_id, product_variation.extension) IN (
+                SELECT * FROM unnest($1::VARCHAR[], $2::VARCHAR[])
+            );
+        '''),
+        Statement("get_replacement", '''
+            SELECT json_build_object(
+                'id', product_variation.listing_id,
+                'extension', product_variation.extension
+            ) AS id, product_listing.name AS name
+            FROM product_listing INNER JOIN product_variation ON product_listing.id = product_variation.listing_id
+            WHERE product_listing.id = $1 AND product_variation.extension = $2;
+        '''),
+        Statement("get_product", '''
+            WITH variations AS (
+                SELECT extension, subname, featured, price, display, overview, (
+                    SELECT COALESCE(ARRAY_AGG(tag.id), '{}')
+                    FROM tag INNER JOIN tag_category ON tag.category_id = tag_category.id
+                        INNER JOIN product_variation__tag ON product_variation__tag.tag_id = tag.id
+                    WHERE product_variation__tag.listing_id = $1 AND product_variation__tag.variation_extension = extension
+                ) AS tags
+                FROM product_variation WHERE listing_id = $1
+            )
+            SELECT id, name, description, (
+                SELECT COALESCE(json_agg(json_build_object(
+                    'extension', extension,
+                    'subname', subname,
+                    'featured', featured,
+                    'price', price,
+                    'display', display,
+                    'overview', overview,
+                    'tags', tags
+                )), '[]') FROM variations
+            ) as variations
+            FROM product_listing WHERE id = $1;
+        '''),
+        Statement("get_stock", '''
+            WITH items AS (
+                SELECT serial, display, overview, (
+                    SELECT COALESCE(ARRAY_AGG(tag.id), '{}')
+                    FROM tag INNER JOIN instock_item__tag ON instock_item__tag.tag_id = tag.id
+                    WHERE instock_item__tag.listing_id = $1 AND instock_item__tag.item_serial = serial
+                ) AS tags
+                FROM instock_item WHERE listing_id = $1
+            )
+            SELECT id, sale, price, listing_id, variation_extension, (
+                SELECT COALESCE(json_agg(json_build_object(
+                    'serial',items.serial,
+                    'display', items.display,
+                    'overview', items.overview,
+                    'tags', items.tags
+                )), '[]') FROM items
+            ) AS items
+            FROM instock_listing WHERE id = $1;
+        '''),
+        Statement("get_salvage", '''
+            WITH items AS (
+                SELECT serial, price, display, overview, (
+                    SELECT COALESCE(ARRAY_AGG(tag.id), '{}')
+                    FROM tag INNER JOIN salvage_item__tag ON salvage_item__tag.tag_id = tag.id
+                    WHERE salvage_item__tag.listing_id = $1 AND salvage_item__tag.item_serial = serial
+                ) AS tags
+                FROM salvage_item WHERE listing_id = $1
+            )
+            SELECT id, name, description, (
+                SELECT COALESCE(json_agg(json_build_object(
+                    'serial',items.serial,
+                    'price', items.price,
+                    'display', items.display,
+                    'overview', items.overview,
+                    'tags', items.tags
+                )), '[]') FROM items
+            ) AS items
+            FROM salvage_listing WHERE id = $1;
+        ''')
+    ]}
+
+    # Reference Data
+    # finishes and tag categories almost never change, so each list is read once and then served from memory.
+    # Any write to either table (from any client) NOTIFYs the reference_data channel with the table name,
+    # and the listener is polled before each read, which only checks the socket and sends no query.
+    _reference = {}
+    _reference_generation = 0
+    _reference_listener = None
+    _reference_lock = threading.Lock()
+    _reference_stats = {"hits": 0, "misses": 0}
+
+    # Entities
+    # the documents get_tag, get_product, get_stock and get_salvage build are kept in a bounded LRU cache,
+    # every write through this class drops the entries it makes stale, and the writes of other clients drop
+    # every entity of the kinds read from the tables they changed (see _poll_catalog)
+    _entities = EntityCache()
+
+    # Catalog Data
+    # Any write to a catalog table (from any client) NOTIFYs the catalog_data channel with the table name.
+    # The listener is polled before the cached entities and the in-memory indexes are read, and what was built
+    # from a table another client wrote is dropped. This client's own writes patch them as they go, so the
+    # notifications they send are skipped.
+    _catalog_listener = None
+    _catalog_lock = threading.Lock()
+    # the kinds of entity a write to each table can make stale
+    _catalog_entities = {
+        "product_listing": ["product", "stock"],
+        "product_variation": ["product", "stock"],
+        "product_variation__tag": ["product"],
+        "instock_listing": ["stock"],
+        "instock_item": ["stock"],
+        "instock_item__tag": ["stock"],
+        "salvage_listing": ["salvage"],
+        "salvage_item": ["salvage"],
+        "salvage_item__tag": ["salvage"],
+        "tag": ["tag"]
+    }
+
+    # Tag Index
+    # the tag search boxes are answered from an in-memory index of every tag, read on the first search,
+    # the tag writes through this class patch it and the writes that link tags recount how often each is used.
+    # A write from another client to any table it is read from drops it, the next search reads it again.
+    _tags = TagIndex()
+    _tags_lock = threading.Lock()
+    _tag_index_tables = {"tag", "product_variation__tag", "instock_item__tag", "salvage_item__tag", "custom_item__tag"}
+
+    # Facet Index
+    # the filter panel and the tag filters of the product lists are answered from an in-memory bitset of the
+    # variations on each tag, read on the first filter, the product and tag writes through this class patch it.
+    # A write from another client to any table it is read from drops it, the next filter reads it again.
+    _facets = FacetIndex()
+    _facets_lock = threading.Lock()
+    _facet_index_tables = {"tag", "product_listing", "product_variation", "product_variation__tag"}
+
+    # Unit of Work
+    # the batch open on each thread, see batch
+    _batch = threading.local()
+
+    # these build the column, placeholder and SET lists so values are always sent as bind parameters
+    @staticmethod
+    def _columns(data: dict):
+        return ", ".join(data.keys())
+
+    @staticmethod
+    def _placeholders(data: dict):
+        return ", ".join(["%s"] * len(data))
+
+    @staticmethod
+    def _assignments(data: dict):
+        return ", ".join([f"{key} = %s" for key in data.keys()])
+
+    # A search is a tsquery where every word typed is a prefix (so "loft l" is 'loft':* & 'l':*),
+    # or with fuzzy on the text as typed, which the trigram operators compare
+    @staticmethod
+    def _search_parameters(search: str = "", fuzzy: bool = False):
+        return {"search": search if fuzzy else " & ".join([word + ":*" for word in re.findall(r"\w+", search)])}
+
+    # The database looks up the stem of each word of such a search (lady:* is 'ladi':*) and drops the stop words.
+    # search_stems works out the same stems on the client, with the Snowball stemmer of the english configuration,
+    # so a search can be checked against results already fetched without asking the database. Words with digits
+    # are kept as they are, like the database does, a stop word comes back as None. The database splits the
+    # words on underscores and reads non-ASCII letters by its own encoding, so a search with those is None.
+    _stemmer = EnglishStemmer()
+    # tsearch_data/english.stop
+    _stop_words = frozenset('''
+        i me my myself we our ours ourselves you your yours yourself yourselves he him his himself she her hers herself
+        it its itself they them their theirs themselves what which who whom this that these those am is are was were be
+        been being have has had having do does did doing a an the and but if or because as until while of at by for with
+        about against between into through during before after above below to from up down in out on off over under again
+        further then once here there when where why how all any both each few more most other some such no nor not only
+        own same so than too very s t can will just don should now
+    '''.split())
+
+    @classmethod
+    def search_stems(cls, search: str):
+        words = re.findall(r"\w+", search.lower())
+        if any("_" in word or not word.isascii() for word in words):
+            return None
+        return [
+            None if word in cls._stop_words else word if any(character.isdigit() for character in word) else cls._stemmer.stem(word)
+            for word in words
+        ]
+
+    # Keyset Pagination
+    # A page holds the rows that come after the cursor in the order of a sort key, and the key always
+    # ends in a unique column so the order is total. The cursor token is the sort key of the last row
+    # of the page (opaque to callers), so the next page is an index range scan instead of an OFFSET.
+    @staticmethod
+    def _encode_cursor(values: list):
+        return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+    @staticmethod
+    def _decode_cursor(token: str):
+        return json.loads(base64.urlsafe_b64decode(token.encode()))
+
+    @classmethod
+    def _page(cls, query: QueryBuilder, columns: list, key: list, after: str = None, limit: int = 50):
+        with cls._session() as pygres:
+            try:
+                if after is not None:
+                    query.after(key, cls._decode_cursor(after))
+                pygres.execute(*query.order_by(*key).limit(limit + 1).compile())
+                # key columns that are not shown come right after the shown ones, they are only read for the cursor
+                hidden = [column for column in key if column not in columns]
+                results = [{column: value for column, value in zip(columns + hidden, result)} for result in pygres.fetch()]
+                # one row past the limit is asked for, just to know whether another page exists
+                cursor = cls._encode_cursor([results[limit - 1][column] for column in key]) if len(results) > limit else None
+                for result in results:
+                    for column in hidden:
+                        del result[column]
+                return {"results": results[:limit], "cursor": cursor}
+            except QueryError as error:
+                print("Error while attempting to fetch a page: " + str(error))
+                cls._error(pygres)
+                return {"results": [], "cursor": None}
+
+    # inside a batch every call shares the batch's session instead of borrowing its own
+    @classmethod
+    def _session(cls):
+        session = cls._batch_session()
+        if session is not None:
+            return nullcontext(session)
+        return cls._pygres.session()
+
+    # the session of the batch open on this thread, None outside of one
+    @classmethod
+    def _batch_session(cls):
+        return getattr(cls._batch, "session", None)
+
+    @classmethod
+    def _error(cls, pygres):
+        if pygres is cls._batch_session():
+            cls._batch.failed = True
+        pygres.rollback()
+
+    # a write inside a batch leaves its commit to the end of the batch
+    @classmethod
+    def _complete_action(cls, pygres):
+        if pygres is cls._batch_session():
+            cls._batch.wrote = True
+            return
+        pygres.commit()
+
+    # The materialized views are refreshed once the write they summarize is committed, concurrently so they
+    # can still be read meanwhile. A refresh that fails leaves the view stale, it does not undo the write.
+    @classmethod
+    def _refresh_views(cls, pygres, views: list):
+        if pygres is cls._batch_session():
+            cls._batch.views.extend([view for view in views if view not in cls._batch.views])
+            return
+        try:
+            for view in views:
+                pygres(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {view};")
+                cls._complete_action(pygres)
+        except QueryError as error:
+            print("Error while attempting to refresh a view: " + str(error))
+            cls._error(pygres)
+
+    # The tag index ranks the tags by how many items use them, so the writes that change tag links recount
+    # them once they are committed (inside a batch, once the batch is). A recount that fails drops the index,
+    # the next search reads it again.
+    @classmethod
+    def _recount_tag_uses(cls, pygres):
+        if pygres is cls._batch_session():
+            cls._batch.recount = True
+            return
+        if not cls._tags.loaded:
+            return
+        try:
+            pygres(f"SELECT tag_id, COUNT(*) FROM ({cls.__tag_uses_query}) AS uses GROUP BY tag_id;")
+            cls._tags.set_uses(dict(pygres.fetch()))
+        except QueryError as error:
+            print("Error while attempting to count tag uses: " + str(error))
+            cls._error(pygres)
+            cls._tags.clear()
+
+    # A batch runs every Database call made on this thread inside it in one transaction, so a bulk change
+    # (deleting fifty tags, a product and then its stock) is one commit and either happens whole or not at all.
+    # The writes hold back their commits and the batch commits once when the block ends. An exception in the
+    # block rolls all of it back, and so does a call that failed inside it, which then raises a QueryError at
+    # the end (the methods hand their errors back instead of raising). A batch opened inside another joins it.
+    # The views the writes refresh are refreshed once, after the commit.
+    # AsyncDatabase runs each call on whichever worker is free, so from a screen the work goes through batched,
+    # which runs it on one worker inside a batch.
+    #
+    # USAGE:
+    # with Database.batch():
+    #     for id in ids:
+    #         Database.delete_tag(id)
+    #
+    # await AsyncDatabase.batched(lambda: [Database.delete_tag(id) for id in ids])
     @classmethod
-    def _error(cls):
-        cls._pygres.rollback()
+    @contextmanager
+    def batch(cls):
+        if cls._batch_session() is not None:
+            yield
+            return
+
+        with cls._pygres.session() as pygres:
+            cls._batch.session = pygres
+            cls._batch.failed = False
+            cls._batch.wrote = False
+            cls._batch.views = []
+            cls._batch.recount = False
+            try:
+                yield
+                if cls._batch.failed:
+                    raise QueryError("A call inside the batch failed, none of its writes were committed")
+                pygres.commit()
+            except BaseException:
+                pygres.rollback()
+                if cls._batch.wrote:
+                    # the in-memory indexes were patched with writes that never happened
+                    cls._tags.clear()
+                    cls._facets.clear()
+                raise
+            finally:
+                cls._batch.session = None
+                # another thread may have cached what a write changed before it was committed
+                if cls._batch.wrote:
+                    cls._entities.invalidate()
+            cls._refresh_views(pygres, cls._batch.views)
+            if cls._batch.recount:
+                cls._recount_tag_uses(pygres)
 
     @classmethod
-    def _complete_action(cls):
-        cls._pygres.commit()
+    def batched(cls, work, *args, **kwargs):
+        with cls.batch():
+            return work(*args, **kwargs)
 
     @classmethod
     def connect(cls, env_file):
         try:
             if cls._pygres is None:
                 env = json.load(open(env_file, 'r'))
-                cls._pygres = Pygres(*env.values())
+                # the optional "pool" entry holds the Pygres pool settings
+                pool = env.pop("pool", {})
+                # and the optional "cache" entry the entity cache settings
+                cls._entities = EntityCache(**env.pop("cache", {}))
+                cls._pygres = Pygres(*env.values(), **pool)
         except:
             raise Exception()
 
+    # Drops every table and function the migrations created, the next initialize rebuilds them from version 1
     @classmethod
     def reset(cls):
-        for table in ["finishes", "product_listing", "product_variations", "instock_listing", "instock_items", "salvage_listing", "salvage_items",
-            "custom_items",
-            "tag_categories", "tag", "product_variation__tag", "instock_listing__tag", "salvage_listing__tag", "custom_items__tag"]:
-            cls._pygres(f"DROP TABLE {table} CASCADE;")
+        with cls._session() as pygres:
+            pygres(f'''
+                DROP TABLE IF EXISTS {", ".join([
+                    "schema_version", "finishes", "product_listing", "product_variation", "instock_listing", "instock_item",
+                    "salvage_listing", "salvage_item", "custom_item", "tag_category", "tag",
+                    "product_variation__tag", "instock_item__tag", "salvage_item__tag", "custom_item__tag"
+                ])} CASCADE;
+            ''')
+            pygres(f'''
+                DROP FUNCTION IF EXISTS {", ".join(["merge_instock_listing", "merge_salvage_listing", "notify_reference_data", "notify_catalog_data"] + [f"update_{table}_index" for table in SEARCH_WEIGHTS])};
+            ''')
+            cls._complete_action(pygres)
+        cls.invalidate_reference()
+        cls._entities.invalidate()
+        cls._tags.clear()
+        cls._facets.clear()
 
+    # The version the database schema is at, 0 when no migration has been applied yet
     @classmethod
-    def initialize(cls):
-        cls._pygres("CREATE EXTENSION IF NOT EXISTS pg_trgm;")
-
-        # Product Related Tables
-        cls._pygres('''
-            CREATE TABLE IF NOT EXISTS finishes(
-                id VARCHAR(5),
-                name VARCHAR(255),
-                outdoor BOOL
-            );
-        ''')
-        cls._pygres(f'''
-            INSERT INTO finishes(id, name, outdoor)
-            VALUES {", ".join([f"{value}" for value in [
-                ("PB", "Polished Brass", "YES"),
-                ("PN", "Polished Nickel", "YES"),
-                ("GP", "Green Patina", "YES"),
-                ("BP", "Brown Patina", "YES"),
-                ("AB", "Antique Brass", "YES"),
-                ("SN", "Satin Nickel", "YES"),
-                ("LP", "Light Pewter", "YES"),
-                ("STBR", "Statuary Brown", "NO"),
-                ("STBL", "Statuary Black", "NO"),
-                ("PC", "Polished Chrome", "YES"),
-                ("BN", "Black Nickel", "YES")
-            ]])};
-        ''')
+    def schema_version(cls):
+        with cls._session() as pygres:
+            try:
+                pygres("SELECT COALESCE(MAX(version), 0) FROM schema_version;")
+                return pygres.fetch()[0][0]
+            except QueryError:
+                # a database from before the migrations has no version table
+                cls._error(pygres)
+                return 0
+
+    # Brings the schema up to the latest migration. When the database is already current
+    # this is a single version lookup, so it is cheap enough to run on every start.
+    # With dry_run the pending migrations are printed instead of applied.
+    @classmethod
+    def initialize(cls, dry_run: bool = False):
+        version = cls.schema_version()
+        pending = [migration for migration in MIGRATIONS if migration.version > version]
+        if len(pending) == 0:
+            return version
+
+        if dry_run:
+            for migration in pending:
+                print(str(migration) + "\n")
+            return version
+
+        for migration in pending:
+            with cls._session() as pygres:
+                try:
+                    pygres('''
+                        CREATE TABLE IF NOT EXISTS schema_version(
+                            version INT PRIMARY KEY,
+                            name VARCHAR(255),
+                            applied_at TIMESTAMPTZ DEFAULT now()
+                        );
+                    ''')
+                    # a second dashboard starting at the same time waits here, then skips what it already applied
+                    pygres("SELECT pg_advisory_xact_lock(hashtext('schema_version'));")
+                    pygres("SELECT 1 FROM schema_version WHERE version = %s;", (migration.version,))
+                    if len(pygres.fetch()) == 0:
+                        for statement in migration.statements:
+                            pygres(statement)
+                        pygres("INSERT INTO schema_version(version, name) VALUES (%s, %s);", (migration.version, migration.name))
+                    cls._complete_action(pygres)
+                    version = migration.version
+                except QueryError as error:
+                    print(f"Error while attempting to apply migration {migration.version} ({migration.name}): ", error)
+                    cls._error(pygres)
+                    return version
+
+        cls.invalidate_reference()
+        cls._entities.invalidate()
+        cls._tags.clear()
+        cls._facets.clear()
+        cls.backfill_indexes()
+        return version
+
+    # Recomputes the search indexes that are missing or out of date, one batch per transaction
+    # so a large table is never locked or rewritten in one go. The UPDATE only fires the trigger.
+    @classmethod
+    def backfill_indexes(cls, batch_size: int = 500):
+        for table, weights in SEARCH_WEIGHTS.items():
+            updated = batch_size
+            while updated == batch_size:
+                with cls._session() as pygres:
+                    try:
+                        pygres(f'''
+                            UPDATE {table} SET index = NULL
+                            WHERE ctid = ANY(ARRAY(
+                                SELECT ctid FROM {table}
+                                WHERE index IS DISTINCT FROM {search_expression(weights)}
+                                LIMIT %s
+                            ));
+                        ''', (batch_size,))
+                        updated = pygres.rowcount
+                        cls._complete_action(pygres)
+                    except QueryError as error:
+                        print("Error while attempting to backfill search indexes: ", error)
+                        cls._error(pygres)
+                        return error
+
+    # reads the pending notifications and drops the lists of the tables they name
+    @classmethod
+    def _poll_reference(cls):
+        with cls._reference_lock:
+            try:
+                if cls._reference_listener is None:
+                    cls._reference_listener = cls._pygres.listen("reference_data")
+                cls._reference_listener.poll()
+            except (ConnectionError, postgres.Error) as error:
+                # without a listener nothing can be trusted to still be current
+                print("Error while polling reference data notifications: ", error)
+                cls._reference_listener = None
+                cls._reference.clear()
+                cls._reference_generation += 1
+                cls._tags.clear()
+                return
+
+            for notification in cls._reference_listener.notifies:
+                cls._reference.pop(notification.payload, None)
+                cls._reference_generation += 1
+                # the tag index keeps the category of each tag by name
+                if notification.payload == "tag_category":
+                    cls._tags.clear()
+            cls._reference_listener.notifies.clear()
+
+    # Reads the pending notifications and drops what was built from the tables other clients wrote.
+    # With listen off a missing listener is not opened (that waits on a new connection), and with wait off
+    # nothing is read while another thread is polling (it may be opening the listener) and False comes back,
+    # so the callers on the main loop only check what already arrived. Without a listener every table counts as written.
+    @classmethod
+    def _poll_catalog(cls, listen: bool = True, wait: bool = True):
+        if not cls._catalog_lock.acquire(blocking = wait):
+            return False
+        try:
+            if cls._catalog_listener is None:
+                if not listen:
+                    return True
+                cls._catalog_listener = cls._pygres.listen("catalog_data")
+                # anything written before the listener existed was never announced
+                written = set(CATALOG_TABLES)
+            else:
+                cls._catalog_listener.poll()
+                written = {notification.payload for notification in cls._catalog_listener.notifies if not cls._pygres.sent(notification)}
+                cls._catalog_listener.notifies.clear()
+        except (ConnectionError, postgres.Error) as error:
+            print("Error while polling catalog notifications: ", error)
+            cls._catalog_listener = None
+            written = set(CATALOG_TABLES)
+        finally:
+            cls._catalog_lock.release()
+        cls._drop_written(written)
+        return True
 
-        cls._pygres('''
-            CREATE TABLE IF NOT EXISTS product_listing(
-                id VARCHAR(10) PRIMARY KEY,
-                name VARCHAR(255),
-                description TEXT
-            );
-        ''')
-        cls._pygres("ALTER TABLE IF EXISTS product_listing ADD COLUMN IF NOT EXISTS index tsvector;")
-        cls._pygres("CREATE INDEX IF NOT EXISTS product_listing_index ON product_listing USING GIN(index);")
-
-        cls._pygres('''
-            CREATE TABLE IF NOT EXISTS product_variation(
-                extension VARCHAR(10),
-                subname VARCHAR(255),
-                featured BOOL,
-                price INT,
-                display BOOL,
-                overview JSONB,
-                listing_id VARCHAR(10) REFERENCES product_listing(id) ON DELETE CASCADE ON UPDATE CASCADE
-            );
-        ''')
-        cls._pygres("ALTER TABLE IF EXISTS product_variation ADD COLUMN IF NOT EXISTS index tsvector;")
-        cls._pygres("CREATE INDEX IF NOT EXISTS product_variation_index ON product_variation USING GIN(index);")
-
-        cls._pygres('''
-            CREATE TABLE IF NOT EXISTS instock_listing(
-                id SERIAL PRIMARY KEY,
-                sale BOOL,
-                price INT,
-                listing_id VARCHAR(7) REFERENCES product_listing(id) ON DELETE CASCADE ON UPDATE CASCADE,
-                variation_extension VARCHAR(10)
-            );
-        ''')
-        cls._pygres('''
-            CREATE TABLE IF NOT EXISTS instock_items(
-                serial INT,
-                display BOOL,
-                overview JSONB,
-                listing_id INT REFERENCES instock_listing(id) ON DELETE CASCADE ON UPDATE CASCADE
-            );
-        ''')
+    @classmethod
+    def _drop_written(cls, tables: set):
+        for kind in {kind for table in tables for kind in cls._catalog_entities.get(table, [])}:
+            cls._entities.invalidate(kind)
+        if len(tables & cls._tag_index_tables) != 0:
+            cls._tags.clear()
+        if len(tables & cls._facet_index_tables) != 0:
+            cls._facets.clear()
+
+    # The returned list is shared by every caller, so it is read but never modified
+    @classmethod
+    def _reference_list(cls, table: str, load):
+        cls._poll_reference()
+        with cls._reference_lock:
+            if table in cls._reference:
+                cls._reference_stats["hits"] += 1
+                return cls._reference[table]
+            cls._reference_stats["misses"] += 1
+            generation = cls._reference_generation
+
+        results = load()
+        with cls._reference_lock:
+            # a change that landed while loading may not be in these rows, so they are not kept
+            if results is not None and generation == cls._reference_generation:
+                cls._reference[table] = results
+        return results if results is not None else []
 
-        cls._pygres('''
-            CREATE TABLE IF NOT EXISTS salvage_listing(
-                id VARCHAR(10) PRIMARY KEY,
-                name VARCHAR(255),
-                description TEXT
-            );
-        ''')
-        cls._pygres("ALTER TABLE IF EXISTS salvage_listing ADD COLUMN IF NOT EXISTS index tsvector;")
-        cls._pygres("CREATE INDEX IF NOT EXISTS salvage_listing_index ON salvage_listing USING GIN(index);")
-
-        cls._pygres('''
-            CREATE TABLE IF NOT EXISTS salvage_item(
-                serial INT,
-                price INT,
-                display BOOL,
-                overview JSONB,
-                listing_id VARCHAR(10) REFERENCES salvage_listing(id) ON DELETE CASCADE ON UPDATE CASCADE
-            );
-        ''')
+    @classmethod
+    def invalidate_reference(cls, table: str = None):
+        with cls._reference_lock:
+            if table is None:
+                cls._reference.clear()
+            else:
+                cls._reference.pop(table, None)
+            cls._reference_generation += 1
 
-        # Gallery Related Tables
-        cls._pygres('''
-            CREATE TABLE IF NOT EXISTS custom_item(
-                id SERIAL PRIMARY KEY,
-                name VARCHAR(255),
-                description TEXT,
-                customer VARCHAR(255),
-                display BOOL,
-                listing_id VARCHAR(10),
-                variation_extension VARCHAR(10)
-            );
-        ''')
-        cls._pygres("ALTER TABLE IF EXISTS custom_item ADD COLUMN IF NOT EXISTS index tsvector;")
-        cls._pygres("CREATE INDEX IF NOT EXISTS custom_item_index ON custom_item USING GIN(index);")
-
-        # Tag Related Tables
-        cls._pygres('''
-            CREATE TABLE IF NOT EXISTS tag_category(
-                id SERIAL PRIMARY KEY,
-                name VARCHAR(255),
-                description TEXT
-            );
-        ''')
-        cls._pygres(f'''
-            INSERT INTO tag_category(name, description)
-            VALUES {", ".join([f"{value}" for value in [
-                ("Class", "Whether the item is a(n) Lighting, Bathroom, Washstands, Furnishing, Mirrors, Cabinets, Display, Hardware, Tile"),
-                ("Category", "The order of the classification, such as sconce, hanging, flushmount, etc."),
-                ("Style", "The artistic period that the item is from."),
-                ("Family", "The stuctural grouping of the item, such as \"torch\" for Loft Light, Urban Torch, etc."),
-                ("Designer", "The name of the designer who created the piece."),
-                ("Material", "The type of materials used to create the item, such as alabaster, marble, aluminum, brass, etc."),
-                ("Distinction", "Specifically for lighting used to distinguish exterior and interior."),
-                ("Environmental", "Specifies any environmental conditions the item can be used in, such as waterproof.")
-            ]])};
-        ''')
+    @classmethod
+    def reference_stats(cls):
+        with cls._reference_lock:
+            return {**cls._reference_stats, "cached": list(cls._reference.keys())}
 
-        cls._pygres('''
-            CREATE TABLE IF NOT EXISTS tag(
-                id SERIAL PRIMARY KEY,
-                name VARCHAR(255),
-                category_id INT REFERENCES tag_category(id) ON DELETE CASCADE ON UPDATE CASCADE
-            );
-        ''')
-        cls._pygres("ALTER TABLE IF EXISTS tag ADD COLUMN IF NOT EXISTS index tsvector;")
-        cls._pygres("CREATE INDEX IF NOT EXISTS tag_index ON tag USING GIN(index);")
-
-        cls._pygres('''
-            CREATE TABLE IF NOT EXISTS product_variation__tag(
-                listing_id VARCHAR(10) REFERENCES product_listing(id) ON DELETE CASCADE ON UPDATE CASCADE,
-                variation_extension VARCHAR(10),
-                tag_id INT REFERENCES tag(id) ON DELETE CASCADE ON UPDATE CASCADE
-            );
-        ''')
-        cls._pygres('''
-            CREATE TABLE IF NOT EXISTS instock_item__tag(
-                listing_id INT REFERENCES instock_listing(id) ON DELETE CASCADE ON UPDATE CASCADE,
-                item_serial INT,
-                tag_id INT REFERENCES tag(id) ON DELETE CASCADE ON UPDATE CASCADE
-            );
-        ''')
-        cls._pygres('''
-            CREATE TABLE IF NOT EXISTS salvage_item__tag(
-                listing_id VARCHAR(10) REFERENCES salvage_listing(id) ON DELETE CASCADE ON UPDATE CASCADE,
-                item_serial INT,
-                tag_id INT REFERENCES tag(id) ON DELETE CASCADE ON UPDATE CASCADE
-            );
-        ''')
-        cls._pygres('''
-            CREATE TABLE IF NOT EXISTS custom_item__tag(
-                item_id INT REFERENCES custom_item(id) ON DELETE CASCADE ON UPDATE CASCADE,
-                tag_id INT REFERENCES tag(id) ON DELETE CASCADE ON UPDATE CASCADE
-            );
-        ''')
+    @classmethod
+    def _entity(cls, kind: str, id, load):
+        cls._poll_catalog()
+        entity = cls._entities.get(kind, id)
+        if entity is not None:
+            return entity
+
+        generation = cls._entities.generation
+        entity = load(id)
+        # errors come back as an empty list or the error itself, only real documents are kept
+        if isinstance(entity, dict):
+            cls._entities.put(kind, id, entity, generation)
+        return entity
 
-        cls._complete_action()
+    @classmethod
+    def entity_stats(cls):
+        return cls._entities.stats()
 
     @classmethod
     def get_metal_finishes_list(cls):
-        try:
-            cls._pygres("SELECT * FROM finishes;")
-            results = cls._pygres.fetch()
-            return [{key: value for key, value in zip(["id", "name", "outdoor"], result)} for result in results]
-        except QueryError as error:
-            print("Error while attempting to search database: " + str(error))
-            cls._error()
-            return []
+        return cls._reference_list("finishes", cls.__load_metal_finishes_list)
+
+    @classmethod
+    def __load_metal_finishes_list(cls):
+        with cls._session() as pygres:
+            try:
+                pygres("SELECT id, name, outdoor FROM finishes ORDER BY position NULLS LAST, id;")
+                results = pygres.fetch()
+                return [{key: value for key, value in zip(["id", "name", "outdoor"], result)} for result in results]
+            except QueryError as error:
+                print("Error while attempting to search database: " + str(error))
+                cls._error(pygres)
+                return None
 
     @classmethod
     def get_tag_category_list(cls):
-        try:
-            cls._pygres("SELECT * FROM tag_category;")
-            results = cls._pygres.fetch()
-            return [{key: value for key, value in zip(["id", "name", "description"], result)} for result in results]
-        except QueryError as error:
-            print("Error while attempting to search database: " + str(error))
-            cls._error()
-            return []
+        return cls._reference_list("tag_category", cls.__load_tag_category_list)
+
+    @classmethod
+    def __load_tag_category_list(cls):
+        with cls._session() as pygres:
+            try:
+                pygres("SELECT * FROM tag_category ORDER BY id;")
+                results = pygres.fetch()
+                return [{key: value for key, value in zip(["id", "name", "description"], result)} for result in results]
+            except QueryError as error:
+                print("Error while attempting to search database: " + str(error))
+                cls._error(pygres)
+                return None
 
     # TAG METHODS
+    # Every tag category with the tags on the variations that match the search and the filters (and every tag
+    # of the Class category), each with how many of those variations it is on. The filters map a category to
+    # the tag ids picked in it, a variation has to have one of the tags of every category. Only the search
+    # is sent to the database, the filters and the counts are worked out on the facet index. Before anything
+    # narrows the panel, the counts are read from the tag_facet_count view instead, which sees every client's writes.
     @classmethod
     def get_filter_list(cls, of = "products", search: str = "", filters: dict = {}):
-        try:
-            cls._pygres(f'''
-                {
-                    f'''
-                        WITH search_filtered AS (
-                            SELECT DISTINCT product_variation.listing_id AS listing_id, product_variation.extension as variation_extension
-                            FROM product_listing INNER JOIN product_variation ON product_variation.listing_id = product_listing.id
-                            WHERE product_listing.index @@ to_tsquery('{search + ':*'}') OR product_variation.index @@ to_tsquery('{search + ':*'}')
-                        ),
-                    ''' if search != ""
-                    else ""
-                }
-                {
-                    f'''
-                        {"WITH" if search == "" else ""} tag_filtered AS (
-                            {" INTERSECT ".join([
-                                f'''
-                                    SELECT DISTINCT listing_id, variation_extension
-                                    FROM product_variation__tag
-                                    WHERE tag_id = ANY ARRAY[{", ".join([f"'{id}'" for id in ids])}]
-                                '''
-                            ] for ids in filters.values())}
-                        ),
-                    ''' if len(filters) != 0
-                    else ""
-                }
-                {"WITH" if search == "" and len(filters) == 0 else ""} variations AS (
-                    SELECT DISTINCT listing_id, variation_extension
-                    FROM product_variation__tag
-                        {"INNER JOIN search_filtered USING(listing_id, variation_extension)" if search != "" else ""}
-                        {"INNER JOIN tag_filtered USING(listing_id, variation_extension)" if len(filters) != 0 else ""}
-                )
-                SELECT id, name, (
-                    SELECT COALESCE(json_agg(json_build_object(
-                        'id', CAST(tag.id AS TEXT),
-                        'name', tag.name,
-                        'category', tag_category.name
-                    )), '[]') FROM tag
-                    WHERE tag.category_id = tag_category.id AND (tag.id IN (
-                        SELECT DISTINCT tag_id 
-                        FROM product_variation__tag
-                        WHERE (listing_id, variation_extension) IN (SELECT listing_id, variation_extension FROM variations)
-                    ) OR tag_category.name = 'Class')
-                ) AS tags
-                FROM tag_category;
-            ''')
-            results = cls._pygres.fetch()
-            return [{key: value for key, value in zip(["id", "name", "tags"], result)} for result in results]
-        except QueryError as error:
-            print("Error while attempting to search database: " + str(error))
-            cls._error()
+        if search == "" and len(filters) == 0:
+            return cls.__facet_counts()
+        if not cls.__load_facet_index():
             return []
+        within = None
+        if search != "":
+            variations = cls.__search_variations(search)
+            if variations is None:
+                return []
+            within = cls._facets.mask(variations)
+
+        counts = cls._facets.counts(cls._facets.filter(filters, within))
+        categories = cls.get_tag_category_list()
+        # in the order the view lists them, where a tag without a name sorts last
+        tags = sorted(cls._facets.tags(), key = lambda tag: (tag["name"] is None, tag["name"] or "", tag["id"]))
+        return [{
+            "id": category["id"],
+            "name": category["name"],
+            "tags": [{
+                "id": str(tag["id"]),
+                "name": tag["name"],
+                "category": category["name"],
+                "count": counts.get(tag["id"], 0)
+            } for tag in tags if tag["category_id"] == category["id"] and (tag["id"] in counts or category["name"] == "Class")]
+        } for category in categories]
 
     @classmethod
-    def get_tag_list(cls, search: str = ""):
-        try:
-            cls._pygres(f'''
-                {
-                    f'''
-                        WITH search_filtered AS (
-                            SELECT DISTINCT id FROM tag WHERE index @@ to_tsquery('{search + ':*'}')
-                        )
-                    ''' if search != ""
-                    else ""
-                }
-                SELECT tag.id AS id, tag.name AS name, tag_category.name AS category
-                FROM tag INNER JOIN tag_category ON tag.category_id = tag_category.id
-                {"WHERE tag.id IN (SELECT * FROM search_filtered)" if search != "" else ""};
-            ''')
-            results = cls._pygres.fetch()
-            return [{key: value for key, value in zip(["id", "name", "category"], result)} for result in results]
-        except QueryError as error:
-            print("Error while attempting to search database: " + str(error))
-            cls._error()
-            return []
+    def __facet_counts(cls):
+        with cls._session() as pygres:
+            try:
+                pygres('''
+                    SELECT tag_category.id, tag_category.name, COALESCE(json_agg(json_build_object(
+                        'id', CAST(tag_facet_count.tag_id AS TEXT),
+                        'name', tag_facet_count.name,
+                        'category', tag_category.name,
+                        'count', tag_facet_count.variations
+                    ) ORDER BY tag_facet_count.name, tag_facet_count.tag_id) FILTER (WHERE tag_facet_count.tag_id IS NOT NULL), '[]')
+                    FROM tag_category LEFT JOIN tag_facet_count ON tag_facet_count.category_id = tag_category.id
+                        AND (tag_facet_count.variations > 0 OR tag_category.name = 'Class')
+                    GROUP BY tag_category.id
+                    ORDER BY tag_category.id;
+                ''')
+                results = pygres.fetch()
+                return [{key: value for key, value in zip(["id", "name", "tags"], result)} for result in results]
+            except QueryError as error:
+                print("Error while attempting to search database: " + str(error))
+                cls._error(pygres)
+                return []
+
+    # the (listing id, extension) of the variations that match a search, on their own or through their listing
+    @classmethod
+    def __search_variations(cls, search: str):
+        with cls._session() as pygres:
+            try:
+                pygres.execute(*QueryBuilder("search_variations").select('''
+                    SELECT listing_id, extension
+                    FROM product_variation
+                    WHERE listing_id IN (SELECT id FROM product_listing WHERE index @@ to_tsquery(%(search)s))
+                    UNION
+                    SELECT listing_id, extension
+                    FROM product_variation WHERE index @@ to_tsquery(%(search)s)
+                ''', **cls._search_parameters(search)).compile())
+                return pygres.fetch()
+            except QueryError as error:
+                print("Error while attempting to search database: " + str(error))
+                cls._error(pygres)
+                return None
+
+    # reads every tag and tag link into the facet index the first time it is needed, False when that failed
+    @classmethod
+    def __load_facet_index(cls):
+        cls._poll_catalog()
+        with cls._facets_lock:
+            if cls._facets.loaded:
+                return True
+            generation = cls._facets.generation
+            with cls._session() as pygres:
+                try:
+                    pygres("SELECT id, name, category_id FROM tag;")
+                    tags = [{key: value for key, value in zip(["id", "name", "category_id"], result)} for result in pygres.fetch()]
+                    pygres("SELECT listing_id, variation_extension, tag_id FROM product_variation__tag;")
+                    links = pygres.fetch()
+                except QueryError as error:
+                    print("Error while attempting to search database: " + str(error))
+                    cls._error(pygres)
+                    return False
+            cls._facets.load(tags, links, generation)
+            return True
+
+    # the ids of the listings the filters let through, None without filters, the facet index is loaded by the caller
+    @classmethod
+    def __filtered_listings(cls, filters: dict):
+        if len(filters) == 0:
+            return None
+        return list(cls._facets.filter_listings(filters))
+
+    # A search ranks the tags it finds by ts_rank_cd, best first, and only the limit best come back
+    # (None for all of them). With fuzzy on, tag names are matched and ranked by trigram word similarity
+    # instead of by prefix, so typos still match. Without a search every tag is listed by name, the limit only caps searches.
+    @classmethod
+    def get_tag_list(cls, search: str = "", fuzzy: bool = False, limit: int = 20):
+        with cls._session() as pygres:
+            try:
+                query = cls.__tag_list_query(search, fuzzy)
+                pygres.execute(*query.order_by(*(["rank DESC"] if search != "" else []), "sort_name", "id").limit(limit if search != "" else None).compile())
+                results = pygres.fetch()
+                return [{key: value for key, value in zip(["id", "name", "category"], result)} for result in results]
+            except QueryError as error:
+                print("Error while attempting to search database: " + str(error))
+                cls._error(pygres)
+                return []
+
+    # tags are paged by name (a NULL one sorts as empty), the id breaks ties between equal names
+    @classmethod
+    def get_tag_page(cls, after: str = None, limit: int = 50, search: str = ""):
+        return cls._page(cls.__tag_list_query(search), ["id", "name", "category"], ["sort_name", "id"], after, limit)
+
+    # the name the tags sort by comes after the shown columns, and a search adds the rank of each tag it finds as the last one
+    @classmethod
+    def __tag_list_query(cls, search: str = "", fuzzy: bool = False):
+        query = QueryBuilder("tag_list").select_from("tag", "tag.id AS id", "tag.name AS name", "tag_category.name AS category",
+            "COALESCE(tag.name, '') AS sort_name")
+        query.join("INNER JOIN tag_category ON tag.category_id = tag_category.id")
+        if search != "" and fuzzy:
+            query.with_query("search_filtered", '''
+                SELECT id, word_similarity(%(search)s, name) AS rank FROM tag WHERE %(search)s <%% name
+            ''', **cls._search_parameters(search, fuzzy))
+        elif search != "":
+            query.with_query("search_filtered", '''
+                SELECT id, ts_rank_cd(index, to_tsquery(%(search)s)) AS rank FROM tag WHERE index @@ to_tsquery(%(search)s)
+            ''', **cls._search_parameters(search))
+        if search != "":
+            query.column("search_filtered.rank AS rank").join("INNER JOIN search_filtered ON search_filtered.id = tag.id")
+        return query
 
     @classmethod
     def get_tag(cls, id):
-        try:
-            cls._pygres(f"SELECT * FROM tag WHERE id = '{id}';")
-            result = cls._pygres.fetch()[0]
-            return {key: value for key, value in zip(["id", "name", "category_id"], result)}
-        except QueryError as error:
-            print("Error while attempting to search database: " + str(error))
-            cls._error()
+        return cls._entity("tag", id, cls.__load_tag)
+
+    @classmethod
+    def __load_tag(cls, id):
+        with cls._session() as pygres:
+            try:
+                pygres.execute(cls._statements["get_tag"], (id,))
+                result = pygres.fetch()[0]
+                return {key: value for key, value in zip(["id", "name", "category_id"], result)}
+            except QueryError as error:
+                print("Error while attempting to search database: " + str(error))
+                cls._error(pygres)
+                return []
+
+    # the batch form of get_tag, one query for any number of ids (rows come back in no particular order)
+    # None means the query failed, which is not the same as none of the ids being found
+    @classmethod
+    def get_tags(cls, ids: list):
+        if len(ids) == 0:
             return []
+        with cls._session() as pygres:
+            try:
+                pygres.execute(cls._statements["get_tags"], (list(ids),))
+                results = pygres.fetch()
+                return [{key: value for key, value in zip(["id", "name", "category_id"], result)} for result in results]
+            except QueryError as error:
+                print("Error while attempting to search database: " + str(error))
+                cls._error(pygres)
+                return None
+
+    # Tags are searched by the words of their names, ranked by how many items use them,
+    # only the limit most used come back. The first search reads every tag into the index.
+    @classmethod
+    def search_tags(cls, search: str = "", limit: int = 20):
+        cls._poll_catalog()
+        with cls._tags_lock:
+            if not cls._tags.loaded:
+                generation = cls._tags.generation
+                tags = cls.__load_tag_index()
+                if tags is None:
+                    return cls.get_tag_list(search, limit = limit)
+                cls._tags.load(tags, generation)
+        return cls._tags.search(search, limit)
+
+    # The search_tags the main loop can call: it only reads the notifications already there and an index that is
+    # already loaded, and never waits on a worker. None when it cannot answer, the awaitable search_tags does then.
+    @classmethod
+    def search_loaded_tags(cls, search: str = "", limit: int = 20):
+        if not cls._poll_catalog(listen = False, wait = False):
+            return None
+        # an index dropped halfway through the search answers with nothing, so that search is not kept
+        generation = cls._tags.generation
+        if not cls._tags.loaded:
+            return None
+        tags = cls._tags.search(search, limit)
+        return tags if cls._tags.generation == generation else None
+
+    @classmethod
+    def __load_tag_index(cls):
+        with cls._session() as pygres:
+            try:
+                pygres(f'''
+                    WITH uses AS ({cls.__tag_uses_query})
+                    SELECT tag.id, tag.name, tag_category.name, (SELECT COUNT(*) FROM uses WHERE uses.tag_id = tag.id)
+                    FROM tag INNER JOIN tag_category ON tag.category_id = tag_category.id;
+                ''')
+                results = pygres.fetch()
+                return [{key: value for key, value in zip(["id", "name", "category", "uses"], result)} for result in results]
+            except QueryError as error:
+                print("Error while attempting to search database: " + str(error))
+                cls._error(pygres)
+                return None
+
+    # one row per item a tag is on
+    __tag_uses_query = '''
+        SELECT tag_id FROM product_variation__tag
+        UNION ALL
+        SELECT tag_id FROM instock_item__tag
+        UNION ALL
+        SELECT tag_id FROM salvage_item__tag
+        UNION ALL
+        SELECT tag_id FROM custom_item__tag
+    '''
+
+    # the tag index keeps the category by name, the facet index by id
+    @classmethod
+    def __index_tag(cls, id, name, category_id):
+        categories = {category["id"]: category["name"] for category in cls.get_tag_category_list()}
+        cls._tags.put({"id": id, "name": name, "category": categories.get(category_id, "")})
+        cls._facets.put_tag({"id": id, "name": name, "category_id": category_id})
 
-    # REGIN f'''
-    #   UPDATE {}} 
-    #   SET index = to_tsvector('english', {" || ' ' || ".join([f"COALESCE({column}, '')" for column in []])})
-    #   WHERE id = {};
-    # '''
     @classmethod
     def create_tag(cls, data: dict):
-        try:
-            columns = ", ".join(data.keys())
-            values = tuple(data.values())
-
-            cls._pygres(f"INSERT INTO tag({columns}) VALUES {values} RETURNING id;")
-            id = cls._pygres.fetch()[0][0]
-            cls._pygres(f'''
-                UPDATE tag
-                SET index = to_tsvector('english', {" || ' ' || ".join([f"COALESCE({column}, '')" for column in ["name"]])})
-                WHERE id = '{id}';
-            ''')
-            cls._complete_action()
-        except QueryError as error:
-            print("Error while attempting to search database: " + str(error))
-            cls._error()
-            return []
+        with cls._session() as pygres:
+            try:
+                pygres(f"INSERT INTO tag({cls._columns(data)}) VALUES ({cls._placeholders(data)}) RETURNING id, name, category_id;", tuple(data.values()))
+                tag = pygres.fetch()[0]
+                cls._complete_action(pygres)
+                cls._refresh_views(pygres, ["tag_facet_count"])
+            except QueryError as error:
+                print("Error while attempting to search database: " + str(error))
+                cls._error(pygres)
+                return []
+        cls.__index_tag(*tag)
 
     @classmethod
     def update_tag(cls, id, data):
-        try: 
-            cls._pygres(f'''
-                UPDATE tag
-                SET {", ".join([f"{key} = '{value}'" for key, value in data.items()])}
-                WHERE id = '{id}' RETURNING id;
-            ''')
-            id = cls._pygres.fetch()[0][0]
-            cls._pygres(f'''
-                UPDATE tag
-                SET index = to_tsvector('english', {" || ' ' || ".join([f"COALESCE({column}, '')" for column in ["name"]])})
-                WHERE id = '{id}';
-            ''')
-            cls._complete_action()
-        except QueryError as error:
-            print("Error while attempting to search database: " + str(error))
-            cls._error()
-            return []
+        with cls._session() as pygres:
+            try:
+                pygres(f'''
+                    UPDATE tag
+                    SET {cls._assignments(data)}
+                    WHERE id = %s
+                    RETURNING id, name, category_id;
+                ''', (*data.values(), id))
+                tags = pygres.fetch()
+                cls._complete_action(pygres)
+                cls._refresh_views(pygres, ["tag_facet_count", "product_summary"])
+                cls._entities.invalidate("tag", id)
+            except QueryError as error:
+                print("Error while attempting to search database: " + str(error))
+                cls._error(pygres)
+                return []
+        for tag in tags:
+            cls.__index_tag(*tag)
 
     @classmethod
     def delete_tag(cls, id):
-        try:
-            cls._pygres(f"DELETE FROM tag WHERE id = '{id}';")
-            cls._complete_action()
-        except QueryError as error:
-            print("Error while attempting to search database: " + str(error))
-            cls._error()
-            return []
+        with cls._session() as pygres:
+            try:
+                pygres("DELETE FROM tag WHERE id = %s;", (id,))
+                cls._complete_action(pygres)
+                cls._refresh_views(pygres, ["tag_facet_count", "product_summary"])
+                cls._entities.invalidate("tag", id)
+                cls._tags.remove(int(id))
+                cls._facets.remove_tag(int(id))
+                # the tag links it had are gone, and any document may have listed it
+                for kind in ["product", "stock", "salvage"]:
+                    cls._entities.invalidate(kind)
+            except QueryError as error:
+                print("Error while attempting to search database: " + str(error))
+                cls._error(pygres)
+                return []
 
     # PRODUCT METHODS
+    # A search ranks the replacements it finds by ts_rank_cd, best first, and only the limit best come back
+    # (None for all of them). With fuzzy on, product ids, names and variation names are matched and ranked
+    # by trigram word similarity instead of by prefix, so typos still match. Each replacement carries the
+    # terms its listing and its variation are indexed by, so a narrower search can be checked against it
+    # without another query.
+    # Without a search every replacement is listed, the limit only caps searches.
     @classmethod
-    def get_replacement_list(cls, search: str = ""):
-        try:
-            cls._pygres(f'''
-                {
-                    f'''
-                        WITH search_filtered AS (
-                            SELECT DISTINCT product_variation.listing_id AS id, product_variation.extension AS extension
-                            FROM product_listing INNER JOIN product_variation ON product_variation.listing_id = product_listing.id
-                            WHERE product_listing.index @@ to_tsquery('{search + ':*'}') OR product_variation.index @@ to_tsquery('{search + ':*'}')
-                        )
-                    ''' if search != "" 
-                    else ""
-                }
-                SELECT DISTINCT json_build_object(
-                    'id', product_variation.listing_id,
-                    'extension', product_variation.extension
-                ) AS id, product_listing.name AS name, product_variation.subname AS subname
-                FROM product_listing INNER JOIN product_variation ON product_variation.listing_id = product_listing.id
-                    INNER JOIN product_variation__tag ON product_variation__tag.listing_id = product_variation.listing_id
-                        AND product_variation__tag.variation_extension = product_variation.extension
-                    INNER JOIN tag ON tag.id = product_variation__tag.tag_id
-                    {"INNER JOIN search_filtered USING(id, extension)" if search != "" else ""}
-                WHERE tag.name = 'Replacement';
-            ''')
-
-            results = cls._pygres.fetch()
-            return [{key: value for key, value in zip(["id", "name", "subname"], result)} for result in results]
-        except QueryError as error:
-            print("Error while attempting to search database: " + str(error))
-            cls._error()
-            return []
+    def get_replacement_list(cls, search: str = "", fuzzy: bool = False, limit: int = 20):
+        fuzzy = fuzzy and search != ""
+        with cls._session() as pygres:
+            try:
+                query = QueryBuilder("replacement_list").select_from("product_listing",
+                    "jsonb_build_object('id', product_variation.listing_id, 'extension', product_variation.extension) AS id",
+                    "product_listing.name AS name",
+                    "product_variation.subname AS subname",
+                    "tsvector_to_array(COALESCE(product_listing.index, '')) AS listing_terms",
+                    "tsvector_to_array(COALESCE(product_variation.index, '')) AS variation_terms",
+                    "product_variation.listing_id AS listing_id",
+                    "product_variation.extension AS extension"
+                )
+                query.join("INNER JOIN product_variation ON product_variation.listing_id = product_listing.id")
+                # only the variations tagged as replacements are listed
+                query.where('''
+                    EXISTS (
+                        SELECT 1 FROM product_variation__tag INNER JOIN tag ON tag.id = product_variation__tag.tag_id
+                        WHERE product_variation__tag.listing_id = results.listing_id
+                            AND product_variation__tag.variation_extension = results.extension
+                            AND tag.name = 'Replacement'
+                    )
+                ''')
+                if fuzzy:
+                    query.with_query("search_ranked", '''
+                        SELECT listing_id AS id, extension,
+                            GREATEST(word_similarity(%(search)s, product_listing.id), word_similarity(%(search)s, product_listing.name)) AS rank
+                        FROM product_listing INNER JOIN product_variation ON product_variation.listing_id = product_listing.id
+                        WHERE %(search)s <%% product_listing.id OR %(search)s <%% product_listing.name
+                        UNION ALL
+                        SELECT listing_id AS id, extension, word_similarity(%(search)s, subname) AS rank
+                        FROM product_variation WHERE %(search)s <%% subname
+                    ''', **cls._search_parameters(search, fuzzy))
+                elif search != "":
+                    query.with_query("search_ranked", '''
+                        SELECT listing_id AS id, extension, ts_rank_cd(product_listing.index, to_tsquery(%(search)s)) AS rank
+                        FROM product_listing INNER JOIN product_variation ON product_variation.listing_id = product_listing.id
+                        WHERE product_listing.index @@ to_tsquery(%(search)s)
+                        UNION ALL
+                        SELECT listing_id AS id, extension, ts_rank_cd(index, to_tsquery(%(search)s)) AS rank
+                        FROM product_variation WHERE index @@ to_tsquery(%(search)s)
+                    ''', **cls._search_parameters(search))
+                if search != "":
+                    query.with_query("search_filtered", "SELECT id, extension, MAX(rank) AS rank FROM search_ranked GROUP BY id, extension")
+                    query.column("search_filtered.rank AS rank").join(
+                        "INNER JOIN search_filtered ON search_filtered.id = product_variation.listing_id AND search_filtered.extension = product_variation.extension"
+                    )
+                pygres.execute(*query.order_by(*(["rank DESC"] if search != "" else []), "listing_id", "extension").limit(limit if search != "" else None).compile())
+
+                results = pygres.fetch()
+                return [{key: value for key, value in zip(["id", "name", "subname", "listing_terms", "variation_terms"], result)} for result in results]
+            except QueryError as error:
+                print("Error while attempting to search database: " + str(error))
+                cls._error(pygres)
+                return []
 
     @classmethod
     def get_replacement(cls, id, extension):
-        try:
-            cls._pygres(f'''
-                SELECT json_build_object(
-                    'id', product_variation.listing_id, 
-                    'extension', product_variation.extension
-                ) AS id, product_listing.name AS name
-                FROM product_listing INNER JOIN product_variation ON product_listing.id = product_variation.listing_id
-                WHERE product_listing.id = '{id}' AND product_variation.extension = '{extension}';
-            ''')
-            result = cls._pygres.fetch()[0]
-            return {key: value for key, value in zip(["id", "name"], result)}
-        except QueryError as error:
-            print("Error while attempting to search database: " + str(error))
-            cls._error()
+        with cls._session() as pygres:
+            try:
+                pygres.execute(cls._statements["get_replacement"], (id, extension))
+                result = pygres.fetch()[0]
+                return {key: value for key, value in zip(["id", "name"], result)}
+            except QueryError as error:
+                print("Error while attempting to search database: " + str(error))
+                cls._error(pygres)
+                return []
+
+    # the batch form of get_replacement, takes (id, extension) pairs, None when the query failed
+    @classmethod
+    def get_replacements(cls, keys: list):
+        if len(keys) == 0:
             return []
-
+        with cls._session() as pygres:
+            try:
+                pygres.execute(cls._statements["get_replacements"], ([id for id, _ in keys], [extension for _, extension in keys]))
+                results = pygres.fetch()
+                return [{key: value for key, value in zip(["id", "name"], result)} for result in results]
+            except QueryError as error:
+                print("Error while attempting to search database: " + str(error))
+                cls._error(pygres)
+                return None
+
+    # A search ranks the products it finds by ts_rank_cd, best first, and only the limit best come back
+    # (None for all of them). With fuzzy on, product ids, names and variation names are matched and ranked
+    # by trigram word similarity instead of by prefix, so typos still match. Without a search every product
+    # is listed by id, the limit only caps searches.
     @classmethod
-    def get_product_list(cls, search: str = "", filters: dict = {}):
-        try:
-            cls._pygres(f'''
-                {
-                    f'''
-                        WITH search_filtered AS (
-                            SELECT DISTINCT product_variation.listing_id AS id
-                            FROM product_listing INNER JOIN product_variation ON product_variation.listing_id = product_listing.id
-                            WHERE product_listing.index @@ to_tsquery('{search + ':*'}') OR product_variation.index @@ to_tsquery('{search + ':*'}')
-                        ),
-                    ''' if search != "" 
-                    else ""
-                }
-                {
-                    f'''
-                        {"WITH" if search == "" else ""} tag_filtered AS (
-                            {" INTERSECT ".join([
-                                f'''
-                                    SELECT DISTINCT product_variation__tag.listing_id AS id
-                                    FROM product_variation__tag
-                                    WHERE tag_id = ANY ARRAY[{", ".join([f"'{id}'" for id in ids])}]
-                                ''' for ids in filters.values()
-                            ])}
-                        ),
-                    ''' if len(filters) != 0
-                    else ""
-                }
-                {"WITH" if search == "" and len(filters) == 0 else ""} results AS (
-                    SELECT id, name, description
-                    FROM product_listing
-                        {"INNER JOIN search_filtered USING(id)" if search != "" else ""}
-                        {"INNER JOIN tag_filtered USING(id)" if len(filters) != 0 else ""}
-                )
-                SELECT DISTINCT * FROM results;
-            ''')
-            results = cls._pygres.fetch()
-            return [{key: value for key, value in zip(["id", "name", "category"], result)} for result in results]
-        except QueryError as error:
-            print("Error while attempting to search database: " + str(error))
-            cls._error()
+    def get_product_list(cls, search: str = "", filters: dict = {}, fuzzy: bool = False, limit: int = 20):
+        if len(filters) != 0 and not cls.__load_facet_index():
             return []
+        filtered = cls.__filtered_listings(filters)
+        with cls._session() as pygres:
+            try:
+                query = cls.__product_list_query(search, filtered, fuzzy)
+                pygres.execute(*query.order_by(*(["rank DESC"] if search != "" else []), "id").limit(limit if search != "" else None).compile())
+                results = pygres.fetch()
+                return [{key: value for key, value in zip(cls.__product_list_columns, result)} for result in results]
+            except QueryError as error:
+                print("Error while attempting to search database: " + str(error))
+                cls._error(pygres)
+                return []
 
+    @classmethod
+    def get_product_page(cls, after: str = None, limit: int = 50, search: str = "", filters: dict = {}):
+        if len(filters) != 0 and not cls.__load_facet_index():
+            return {"results": [], "cursor": None}
+        filtered = cls.__filtered_listings(filters)
+        return cls._page(cls.__product_list_query(search, filtered), cls.__product_list_columns, ["id"], after, limit)
+
+    # The listings are read from the product_summary view, which carries their variation counts, price range,
+    # display flags and category (their Class tags), so a list is one scan with no joins against the variations.
+    # The search and the tag filters only ever narrow the listings down, each listing is in the results once.
+    # The tag filters come in already worked out on the facet index, as the ids of the listings they let through.
+    # A search adds the best rank of each listing (over the listing and its variations) as the last column.
+    __product_list_columns = ["id", "name", "category", "description", "variations", "displayed", "featured", "min_price", "max_price"]
 
     @classmethod
-    def get_product(cls, id):
-        try:
-            cls._pygres(f'''
-                WITH variations AS (
-                    SELECT extension, subname, featured, price, display, overview, (
-                        SELECT COALESCE(ARRAY_AGG(tag.id), '{{}}')
-                        FROM tag INNER JOIN tag_category ON tag.category_id = tag_category.id
-                            INNER JOIN product_variation__tag ON product_variation__tag.tag_id = tag.id
-                        WHERE product_variation__tag.listing_id = '{id}' AND product_variation__tag.variation_extension = extension
-                    ) AS tags
-                    FROM product_variation WHERE listing_id = '{id}'
-                )
-                SELECT id, name, description, (
-                    SELECT COALESCE(json_agg(json_build_object(
-                        'extension', extension,
-                        'subname', subname,
-                        'featured', featured,
-                        'price', price,
-                        'display', display,
-                        'overview', overview,
-                        'tags', tags
-                    )), '[]') FROM variations
-                ) as variations
-                FROM product_listing WHERE id = '{id}';
-            ''')
+    def __product_list_query(cls, search: str = "", filtered: list = None, fuzzy: bool = False):
+        query = QueryBuilder("product_list").select_from("product_summary", *cls.__product_list_columns)
+        if search != "" and fuzzy:
+            query.with_query("search_ranked", '''
+                SELECT id, GREATEST(word_similarity(%(search)s, id), word_similarity(%(search)s, name)) AS rank
+                FROM product_listing WHERE %(search)s <%% id OR %(search)s <%% name
+                UNION ALL
+                SELECT listing_id AS id, word_similarity(%(search)s, subname) AS rank
+                FROM product_variation WHERE %(search)s <%% subname
+            ''', **cls._search_parameters(search, fuzzy))
+        elif search != "":
+            query.with_query("search_ranked", '''
+                SELECT id, ts_rank_cd(index, to_tsquery(%(search)s)) AS rank
+                FROM product_listing WHERE index @@ to_tsquery(%(search)s)
+                UNION ALL
+                SELECT listing_id AS id, ts_rank_cd(index, to_tsquery(%(search)s)) AS rank
+                FROM product_variation WHERE index @@ to_tsquery(%(search)s)
+            ''', **cls._search_parameters(search))
+        if search != "":
+            query.with_query("search_filtered", "SELECT id, MAX(rank) AS rank FROM search_ranked GROUP BY id")
+            query.column("rank").join("INNER JOIN search_filtered USING(id)")
+        if filtered is not None:
+            query.where("id = ANY(%(filtered)s::VARCHAR[])", filtered = filtered)
+        return query
 
-            result = cls._pygres.fetch()[0]
-            return {key: value for key, value in zip(["id", "name", "description", "variations"], result)}
-        except QueryError as error:
-            print("Error while attempting to search database: " + str(error))
-            cls._error()
-            return []
+    @classmethod
+    def get_product(cls, id):
+        return cls._entity("product", id, cls.__load_product)
 
+    @classmethod
+    def __load_product(cls, id):
+        with cls._session() as pygres:
+            try:
+                pygres.execute(cls._statements["get_product"], (id,))
+                result = pygres.fetch()[0]
+                return {key: value for key, value in zip(["id", "name", "description", "variations"], result)}
+            except QueryError as error:
+                print("Error while attempting to search database: " + str(error))
+                cls._error(pygres)
+                return []
+
+    # The listing, its variations and their tag links are written by one statement,
+    # the children arrive as JSON documents and are expanded server side,
+    # so a product costs the same round trips no matter how many variations it has
     @classmethod
     def create_product(cls, data):
-        try:
-            variations = data.pop("variations")
-
-            columns = ", ".join(data.keys())
-            values = tuple(data.values())
-            cls._pygres(f"INSERT INTO product_listing({columns}) VALUES {values} RETURNING id;")
-            id = cls._pygres.fetch()[0][0]
-            cls._pygres(f'''
-                UPDATE product_listing
-                SET index = to_tsvector('english', {" || ' ' || ".join([f"COALESCE({column}, '')" for column in ["id", "name", "description"]])})
-                WHERE id = '{id}';
-            ''')
-
-            for variation in variations:
-                tags = variation.pop("tags")
-
-                variation['listing_id'] = id
-                variation["overview"] = json.dumps(variation["overview"])
-
-                columns = ", ".join(variation.keys())
-                values = tuple(variation.values())
-                cls._pygres(f"INSERT INTO product_variation({columns}) VALUES {values} RETURNING extension;")
-                extension = cls._pygres.fetch()[0][0]
-                cls._pygres(f'''
-                    UPDATE product_variation
-                    SET index = to_tsvector('english', {" || ' ' || ".join([f"COALESCE({column}, '')" for column in ["subname"]])})
-                    WHERE listing_id = '{id}' AND extension = '{extension}';
-                ''')
-
-                for tag in tags:
-                    cls._pygres(f'''
-                        INSERT INTO product_variation__tag(listing_id, variation_extension, tag_id) 
-                        VALUES {(id, variation['extension'], tag)};
-                    ''')
-
-            cls._complete_action()
-        except QueryError as error:
-            print("Error while attempting to create product: ", error)
-            cls._error()
-            return error
-
+        with cls._session() as pygres:
+            try:
+                variations = data.pop("variations")
+                tags = [{"extension": variation["extension"], "tag_id": tag} for variation in variations for tag in variation.pop("tags")]
+
+                pygres('''
+                    WITH listing AS (
+                        INSERT INTO product_listing(id, name, description)
+                        SELECT id, name, description
+                        FROM jsonb_populate_record(NULL::product_listing, %(listing)s)
+                        RETURNING id
+                    ), variations AS (
+                        INSERT INTO product_variation(listing_id, extension, subname, featured, price, display, overview)
+                        SELECT listing.id, extension, subname, featured, price, display, overview
+                        FROM listing, jsonb_populate_recordset(NULL::product_variation, %(variations)s)
+                    )
+                    INSERT INTO product_variation__tag(listing_id, variation_extension, tag_id)
+                    SELECT listing.id, tag.extension, tag.tag_id
+                    FROM listing, jsonb_to_recordset(%(tags)s) AS tag(extension VARCHAR(10), tag_id INT);
+                ''', {"listing": Json(data), "variations": Json(variations), "tags": Json(tags)})
+
+                cls._complete_action(pygres)
+                cls._refresh_views(pygres, ["tag_facet_count", "product_summary"])
+                cls._recount_tag_uses(pygres)
+                cls._entities.invalidate("product", data["id"])
+                cls._facets.set_listing(data["id"], cls.__variation_tags(variations, tags))
+            except QueryError as error:
+                print("Error while attempting to create product: ", error)
+                cls._error(pygres)
+                return error
+
+    # The listing row is updated first so a changed id cascades to its variations and tag links,
+    # then one statement reconciles the variations and tags against the submitted ones
     @classmethod
     def update_product(cls, old_id, data):
-        try:
-            variations = data.pop("variations")
-
-            cls._pygres(f'''
-                UPDATE product_listing
-                SET {", ".join([f"{key} = '{value}'" for key, value in data.items()])}
-                WHERE id = '{old_id}' RETURNING id;
-            ''')
-            new_id = cls._pygres.fetch()[0][0]
-            cls._pygres(f'''
-                UPDATE product_listing
-                SET index = to_tsvector('english', {" || ' ' || ".join([f"COALESCE({column}, '')" for column in ["id", "name", "description"]])})
-                WHERE id = '{new_id}';
-            ''')
-
-            extensions = set()
-            for variation in variations:
-                tags = variation.pop("tags")
-                extensions.add(variation["extension"])
-
-                variation['listing_id'] = new_id
-                variation["overview"] = json.dumps(variation["overview"])
-
-                cls._pygres(f'''
-                    SELECT * FROM product_variation 
-                    WHERE listing_id = '{old_id}' AND extension = '{variation["extension"]}';
-                ''')
-                if len(cls._pygres.fetch()) > 0:
-                    cls._pygres(f'''
-                        UPDATE product_variation
-                        SET {", ".join([f"{key} = '{value}'" for key, value in variation.items()])}
-                        WHERE listing_id = '{old_id}' AND extension = '{variation["extension"]}'
-                        RETURNING extension;
-                    ''')
-                else:
-                    columns = ", ".join(variation.keys())
-                    values = tuple(variation.values())
-                    cls._pygres(f"INSERT INTO product_variation({columns}) VALUES {values} RETURNING extension;")
-
-                extension =  cls._pygres.fetch()[0][0]
-                cls._pygres(f'''
-                    UPDATE product_variation
-                    SET index = to_tsvector('english', {" || ' ' || ".join([f"COALESCE({column}, '')" for column in ["subname"]])})
-                    WHERE listing_id = '{new_id}' AND extension = '{extension}';
-                ''')
-
-                for tag in tags:
-                    cls._pygres(f'''
-                        SELECT * FROM product_variation__tag
-                        WHERE listing_id = '{old_id}' AND variation_extension = '{variation['extension']}' AND tag_id = '{tag}';
-                    ''')
-                    if len(cls._pygres.fetch()) == 0:
-                        cls._pygres(f'''
-                            INSERT INTO product_variation__tag(listing_id, variation_extension, tag_id) 
-                            VALUES {(new_id, variation['extension'], tag)};
-                        ''')
-                cls._pygres(f'''
-                    UPDATE product_variation__tag
-                    SET listing_id = '{new_id}'
-                    WHERE listing_id = '{old_id}';
-                ''')
-                cls._pygres(f'''
-                    DELETE FROM product_variation__tag
-                    WHERE listing_id = '{new_id}' AND variation_extension = '{extension}'
-                        AND tag_id NOT IN ({", ".join([f"'{tag}'" for tag in tags])});
-                ''')
-
-            # clean up if extensions get updated
-            # this wouldn't be required if rows have a unique identifier that could be used to update the row rather than accidentally inserting new data
-            # but i like to make things hard i guess
-            cls._pygres(f'''
-                DELETE FROM product_variation
-                WHERE listing_id = '{old_id}' AND NOT extension = ANY ARRAY[{", ".join([f"'{extension}'" for extension in extensions])}];
-            ''')
-            cls._pygres(f'''
-                DELETE FROM product_variation__tag
-                WHERE listing_id = '{new_id}' AND NOT variation_extension = ANY ARRAY[{", ".join([f"'{extension}'" for extension in extensions])}];
-            ''')
-
-            cls._complete_action()
-        except QueryError as error:
-            print("Error while attempting to update product: ", error)
-            cls._error()
-            return error
+        with cls._session() as pygres:
+            try:
+                variations = data.pop("variations")
+                tags = [{"extension": variation["extension"], "tag_id": tag} for variation in variations for tag in variation.pop("tags")]
+
+                pygres(f'''
+                    UPDATE product_listing
+                    SET {cls._assignments(data)}
+                    WHERE id = %s RETURNING id;
+                ''', (*data.values(), old_id))
+                new_id = pygres.fetch()[0][0]
+
+                pygres('''
+                    WITH variations AS (
+                        INSERT INTO product_variation(listing_id, extension, subname, featured, price, display, overview)
+                        SELECT %(id)s, extension, subname, featured, price, display, overview
+                        FROM jsonb_populate_recordset(NULL::product_variation, %(variations)s)
+                        ON CONFLICT (listing_id, extension) DO UPDATE
+                        SET subname = EXCLUDED.subname, featured = EXCLUDED.featured, price = EXCLUDED.price,
+                            display = EXCLUDED.display, overview = EXCLUDED.overview
+                    ), removed_variations AS (
+                        DELETE FROM product_variation
+                        WHERE listing_id = %(id)s AND NOT extension = ANY(%(extensions)s)
+                    ), removed_tags AS (
+                        DELETE FROM product_variation__tag
+                        WHERE listing_id = %(id)s AND (variation_extension, tag_id) NOT IN (
+                            SELECT extension, tag_id FROM jsonb_to_recordset(%(tags)s) AS tag(extension VARCHAR(10), tag_id INT)
+                        )
+                    )
+                    INSERT INTO product_variation__tag(listing_id, variation_extension, tag_id)
+                    SELECT %(id)s, extension, tag_id FROM jsonb_to_recordset(%(tags)s) AS tag(extension VARCHAR(10), tag_id INT)
+                    ON CONFLICT DO NOTHING;
+                ''', {
+                    "id": new_id,
+                    "variations": Json(variations),
+                    "extensions": [variation["extension"] for variation in variations],
+                    "tags": Json(tags)
+                })
+
+                cls._complete_action(pygres)
+                cls._refresh_views(pygres, ["tag_facet_count", "product_summary"])
+                cls._recount_tag_uses(pygres)
+                cls._entities.invalidate("product", old_id)
+                cls._facets.set_listing(new_id, cls.__variation_tags(variations, tags), old_id if new_id != old_id else None)
+                if new_id != old_id:
+                    cls._entities.invalidate("product", new_id)
+                    # stock listings point at the product id, which just cascaded
+                    cls._entities.invalidate("stock")
+            except QueryError as error:
+                print("Error while attempting to update product: ", error)
+                cls._error(pygres)
+                return error
+
+    # the tags of each variation, as the facet index takes them
+    @staticmethod
+    def __variation_tags(variations: list, tags: list):
+        variation_tags = {variation["extension"]: [] for variation in variations}
+        for tag in tags:
+            variation_tags[tag["extension"]].append(int(tag["tag_id"]))
+        return variation_tags
 
     @classmethod
     def delete_product(cls, id):
-        try:
-            cls._pygres(f"DELETE FROM product_listing WHERE id = '{id}';")
-            cls._complete_action()
-        except QueryError as error:
-            print("Error while attempting to update product: ", error)
-            cls._error()
-            return error
+        with cls._session() as pygres:
+            try:
+                pygres("DELETE FROM product_listing WHERE id = %s;", (id,))
+                cls._complete_action(pygres)
+                cls._refresh_views(pygres, ["tag_facet_count", "product_summary"])
+                cls._recount_tag_uses(pygres)
+                cls._entities.invalidate("product", id)
+                cls._facets.remove_listing(id)
+                cls._entities.invalidate("stock")
+            except QueryError as error:
+                print("Error while attempting to update product: ", error)
+                cls._error(pygres)
+                return error
 
     # STOCK METHODS
     @classmethod
     def get_stock_list(cls):
-        try:
-            cls._pygres(f"SELECT listing_id, variation_extension, sale FROM instock_listing;")
-            results = cls._pygres.fetch()
-            return [{key: value for key, value in zip(["id", "extension", "sale"], result)} for result in results]
-        except QueryError as error:
-            print("Error while attempting to get stock list: ", error)
-            cls._error()
-            return error
+        with cls._session() as pygres:
+            try:
+                pygres(cls.__stock_list_query + ";")
+                results = pygres.fetch()
+                return [{key: value for key, value in zip(cls.__stock_list_columns, result)} for result in results]
+            except QueryError as error:
+                print("Error while attempting to get stock list: ", error)
+                cls._error(pygres)
+                return error
 
     @classmethod
-    def get_stock(cls, id):
-        try:
-            cls._pygres(f'''
-                WITH items AS (
-                    SELECT serial, display, overview, (
-                        SELECT COALESCE(ARRAY_AGG(tag.id), '{{}}')
-                        FROM tag INNER JOIN instock_item__tag ON instock_item__tag.tag_id = tag.id
-                        WHERE instock_item__tag.listing_id = '{id}' AND instock_item__tag.item_serial = serial
-                    ) AS tags
-                    FROM instock_item WHERE listing_id = '{id}'
-                )
-                SELECT id, sale, price, listing_id, variation_extension, (
-                    SELECT COALESCE(json_agg(json_build_object(
-                        'serial',items.serial,
-                        'display', items.display,
-                        'overview', items.overview,
-                        'tags', items.tags
-                    )), '[]') FROM items
-                ) AS items
-                FROM instock_listing WHERE id = '{id}';
-            ''')
-            result = cls._pygres.fetch()
-            return {key: value for key, value in zip(["id", "sale", "price", "listing_id", "variation_extension", "items"], result)}
-        except QueryError as error:
-            print("Error while attempting to get stock listing: ", error)
-            cls._error()
-            return error
+    def get_stock_page(cls, after: str = None, limit: int = 50):
+        return cls._page(QueryBuilder("stock_list").select(cls.__stock_list_query), cls.__stock_list_columns, ["id"], after, limit)
 
-    @classmethod
-    def create_stock(cls, data):
-        try:
-            items = data.pop("items")
+    # a stock listing is shown with the name and description of the product it is a variation of
+    __stock_list_columns = ["id", "name", "description", "stock_listing", "variation_extension"]
+    __stock_list_query = '''
+        SELECT instock_listing.id AS id, product_listing.name AS name, product_listing.description AS description,
+            instock_listing.listing_id AS stock_listing, instock_listing.variation_extension AS variation_extension
+        FROM instock_listing LEFT JOIN product_listing ON product_listing.id = instock_listing.listing_id
+    '''
 
-            columns = ", ".join(data.keys())
-            values = tuple(data.values())
-            cls._pygres(f"INSERT INTO instock_listing({columns}) VALUES {values} RETURNING id;")
-            id = cls._pygres.fetch()[0][0]
-
-            for item in items:
-                tags = item.pop("tags")
-
-                item['listing_id'] = id
-                item["overview"] = json.dumps(item["overview"])
-
-                columns = ', '.join(item.keys())
-                values = tuple(item.values())
-                cls._pygres(f"INSERT INTO instock_item({columns}) VALUES {values};")
+    @classmethod
+    def get_stock(cls, id):
+        return cls._entity("stock", id, cls.__load_stock)
 
-                for tag in tags:
-                    cls._pygres(f'''
-                        INSERT INTO instock_item__tag(listing_id, item_serial, tag_id) 
-                        VALUES {(id, item['serial'], tag)};
-                    ''')
+    @classmethod
+    def __load_stock(cls, id):
+        with cls._session() as pygres:
+            try:
+                pygres.execute(cls._statements["get_stock"], (id,))
+                result = pygres.fetch()[0]
+                return {key: value for key, value in zip(["id", "sale", "price", "listing_id", "variation_extension", "items"], result)}
+            except QueryError as error:
+                print("Error while attempting to get stock listing: ", error)
+                cls._error(pygres)
+                return error
 
-            cls._complete_action()
-        except QueryError as error:
-            print("Error while attempting to create instock listing: ", error)
-            cls._error()
-            return error
+    @classmethod
+    def create_stock(cls, data):
+        with cls._session() as pygres:
+            try:
+                items = data.pop("items")
+                tags = [{"serial": item["serial"], "tag_id": tag} for item in items for tag in item.pop("tags")]
+
+                pygres('''
+                    WITH listing AS (
+                        INSERT INTO instock_listing(sale, price, listing_id, variation_extension)
+                        SELECT sale, price, listing_id, variation_extension
+                        FROM jsonb_populate_record(NULL::instock_listing, %(listing)s)
+                        RETURNING id
+                    ), items AS (
+                        INSERT INTO instock_item(listing_id, serial, display, overview)
+                        SELECT listing.id, serial, display, overview
+                        FROM listing, jsonb_populate_recordset(NULL::instock_item, %(items)s)
+                    )
+                    INSERT INTO instock_item__tag(listing_id, item_serial, tag_id)
+                    SELECT listing.id, tag.serial, tag.tag_id
+                    FROM listing, jsonb_to_recordset(%(tags)s) AS tag(serial INT, tag_id INT);
+                ''', {"listing": Json(data), "items": Json(items), "tags": Json(tags)})
+
+                cls._complete_action(pygres)
+                cls._recount_tag_uses(pygres)
+            except QueryError as error:
+                print("Error while attempting to create instock listing: ", error)
+                cls._error(pygres)
+                return error
 
     @classmethod
     def update_stock(cls, id, data):
-        try:
-            items = data.pop("items")
-
-            cls._pygres(f'''
-                UPDATE instock_listing
-                SET {", ".join([f"{key} = '{value}'" for key, value in data.items()])}
-                WHERE id = '{id}';
-            ''')
-
-            serials = set()
-            for item in items:
-                tags = item.pop("tags")
-                serials.add(item["serial"])
-
-                item['listing_id'] = id
-                item["overview"] = json.dumps(item["overview"])
-
-                cls._pygres(f'''
-                    SELECT * FROM instock_items
-                    WHERE listing_id = '{id}' AND serial = '{item["serial"]};
-                ''')
-                if len(cls._pygres.fetch()) > 0:
-                    cls._pygres(f'''
-                        UPDATE instock_item
-                        SET {", ".join([f"{key} = {value}" for key, value in item.items()])}
-                        WHERE listing_id = '{item['listing_id']}' AND serial = '{item['serial']}';
-                    ''')
-                else:
-                    columns = ", ".join(item.keys())
-                    values = tuple(item.values())
-                    cls._pygres(f"INSERT INTO instock_item({columns}) VALUES {values};")
-
-                for tag in tags:
-                    cls._pygres(f'''
-                        SELECT * FROM instock_item__tag
-                        WHERE listing_id = '{id}' AND item_serial = '{item['serial']}' AND tag_id = '{tag}';
-                    ''')
-                    if len(cls._pygres.fetch()) == 0:
-                        cls._pygres(f'''
-                            INSERT INTO instock_item__tag(listing_id, item_serial, tag_id) 
-                            VALUES {(id, item['serial'], tag)};
-                        ''')
-                cls._pygres(f'''
-                    DELETE FROM instock_item__tag
-                    WHERE listing_id = '{id}' AND item_serial = '{item["serial"]}'
-                        AND tag_id NOT IN ({", ".join([f"'{tag}'" for tag in tags])});
-                ''')
-
-            # clean up if extensions get updated
-            # this wouldn't be required if rows have a unique identifier that could be used to update the row rather than accidentally inserting new data
-            # but i like to make things hard i guess
-            cls._pygres(f'''
-                DELETE FROM instock_item
-                WHERE listing_id = '{id}' AND serial != ANY ARRAY[{", ".join([f"'{serial}'" for serial in serials])}];
-            ''')
-            cls._pygres(f'''
-                DELETE FROM instock_item__tag
-                WHERE listing_id = '{id}' AND item_serial != ANY ARRAY[{", ".join([f"'{serial}'" for serial in serials])}];
-            ''')
-
-            cls._complete_action()
-        except QueryError as error:
-            print("Error while attempting to update instock listings: ", error)
-            cls._error()
-            return error
+        with cls._session() as pygres:
+            try:
+                pygres("SELECT merge_instock_listing(%s, %s);", (id, Json(data)))
+                cls._complete_action(pygres)
+                cls._recount_tag_uses(pygres)
+                cls._entities.invalidate("stock", id)
+            except QueryError as error:
+                print("Error while attempting to update instock listings: ", error)
+                cls._error(pygres)
+                return error
 
     @classmethod
     def delete_stock(cls, id):
-        try:   
-            cls._pygres(f"DELETE FROM instock_listing WHERE id = '{id}';")
-            cls._complete_action()
-        except QueryError as error:
-            print("Error while attempting to delete instock listings: ", error)
-            cls._error()
-            return error
+        with cls._session() as pygres:
+            try:
+                pygres("DELETE FROM instock_listing WHERE id = %s;", (id,))
+                cls._complete_action(pygres)
+                cls._recount_tag_uses(pygres)
+                cls._entities.invalidate("stock", id)
+            except QueryError as error:
+                print("Error while attempting to delete instock listings: ", error)
+                cls._error(pygres)
+                return error
 
     # SALVAGE METHODS
     @classmethod
     def get_salvage_list(cls):
-        try:
-            cls._pygres(f"SELECT id, name, description FROM salvage_listing;")
-            results = cls._pygres.fetch()
-            return [{key: value for key, value in zip(["id", "name", "description"], result)} for result in results]
-        except QueryError as error:
-            print("Error while attempting to get stock list: ", error)
-            cls._error()
-            return error
+        with cls._session() as pygres:
+            try:
+                pygres(cls.__salvage_list_query + ";")
+                results = pygres.fetch()
+                return [{key: value for key, value in zip(["id", "name", "description"], result)} for result in results]
+            except QueryError as error:
+                print("Error while attempting to get stock list: ", error)
+                cls._error(pygres)
+                return error
 
     @classmethod
-    def get_salvage(cls, id):
-        try:
-            cls._pygres(f'''
-                WITH items AS (
-                    SELECT serial, price, display, overview, (
-                        SELECT COALESCE(ARRAY_AGG(tag.id), '{{}}')
-                        FROM tag INNER JOIN salvage_item__tag ON salvage_item__tag.tag_id = tag.id
-                        WHERE salvage_item__tag.listing_id = '{id}' AND salvage_item__tag.item_serial = serial
-                    ) AS tags
-                    FROM salvage_item WHERE listing_id = '{id}'
-                )
-                SELECT id, name, description, (
-                    SELECT COALESCE(json_agg(json_build_object(
-                        'serial',items.serial,
-                        'price', items.price,
-                        'display', items.display,
-                        'overview', items.overview,
-                        'tags', items.tags
-                    )), '[]') FROM items
-                ) AS items
-                FROM salvage_listing WHERE id = '{id}';
-            ''')
-            result = cls._pygres.fetch()[0]
-            return {key: value for key, value in zip(["id", "name", "description", "items"], result)}
-        except QueryError as error:
-            print("Error while attempting to get stock listing: ", error)
-            cls._error()
-            return error
+    def get_salvage_page(cls, after: str = None, limit: int = 50):
+        return cls._page(QueryBuilder("salvage_list").select(cls.__salvage_list_query), ["id", "name", "description"], ["id"], after, limit)
 
-    @classmethod
-    def create_salvage(cls, data):
-        try:
-            items = data.pop("items")
-
-            columns = ", ".join(data.keys())
-            values = tuple(data.values())
-            cls._pygres(f"INSERT INTO salvage_listing({columns}) VALUES {values} RETURNING id;")
-            id = cls._pygres.fetch()[0][0]
-            cls._pygres(f'''
-                UPDATE salvage_listing
-                SET index = to_tsvector('english', {" || ' ' || ".join([f"COALESCE({column}, '')" for column in ["id", "name", "description"]])})
-                WHERE id = '{id}';
-            ''')
+    __salvage_list_query = "SELECT id, name, description FROM salvage_listing"
 
-            for item in items:
-                tags = item.pop("tags")
-
-                item['listing_id'] = data['id']
-                item["overview"] = json.dumps(item["overview"])
-                
-                columns = ", ".join(item.keys())
-                values = tuple(item.values())
-                cls._pygres(f"INSERT INTO salvage_item({columns}) VALUES {values};")
+    @classmethod
+    def get_salvage(cls, id):
+        return cls._entity("salvage", id, cls.__load_salvage)
 
-                for tag in tags:
-                    cls._pygres(f'''
-                        INSERT INTO salvage_item__tag(listing_id, item_serial, tag_id) 
-                        VALUES {(data['id'], item['serial'], tag)};
-                    ''')
+    @classmethod
+    def __load_salvage(cls, id):
+        with cls._session() as pygres:
+            try:
+                pygres.execute(cls._statements["get_salvage"], (id,))
+                result = pygres.fetch()[0]
+                return {key: value for key, value in zip(["id", "name", "description", "items"], result)}
+            except QueryError as error:
+                print("Error while attempting to get stock listing: ", error)
+                cls._error(pygres)
+                return error
 
-            cls._complete_action()
-        except QueryError as error:
-            print("Error while attempting to create product: ", error)
-            cls._error()
-            return error
+    @classmethod
+    def create_salvage(cls, data):
+        with cls._session() as pygres:
+            try:
+                items = data.pop("items")
+                tags = [{"serial": item["serial"], "tag_id": tag} for item in items for tag in item.pop("tags")]
+
+                pygres('''
+                    WITH listing AS (
+                        INSERT INTO salvage_listing(id, name, description)
+                        SELECT id, name, description
+                        FROM jsonb_populate_record(NULL::salvage_listing, %(listing)s)
+                        RETURNING id
+                    ), items AS (
+                        INSERT INTO salvage_item(listing_id, serial, price, display, overview)
+                        SELECT listing.id, serial, price, display, overview
+                        FROM listing, jsonb_populate_recordset(NULL::salvage_item, %(items)s)
+                    )
+                    INSERT INTO salvage_item__tag(listing_id, item_serial, tag_id)
+                    SELECT listing.id, tag.serial, tag.tag_id
+                    FROM listing, jsonb_to_recordset(%(tags)s) AS tag(serial INT, tag_id INT);
+                ''', {"listing": Json(data), "items": Json(items), "tags": Json(tags)})
+
+                cls._complete_action(pygres)
+                cls._recount_tag_uses(pygres)
+                cls._entities.invalidate("salvage", data["id"])
+            except QueryError as error:
+                print("Error while attempting to create product: ", error)
+                cls._error(pygres)
+                return error
 
     @classmethod
     def update_salvage(cls, id, data):
-        try:
-            items = data.pop("items")
-
-            cls._pygres(f'''
-                UPDATE salvage_listing
-                SET {", ".join([f"{key} = '{value}'" for key, value in data.items()])}
-                WHERE id = '{id}' RETURNING id;
-            ''')
-            id = cls._pygres.fetch()[0][0]
-            cls._pygres(f'''
-                UPDATE salvage_listing
-                SET index = to_tsvector('english', {" || ' ' || ".join([f"COALESCE({column}, '')" for column in ["id", "name", "description"]])})
-                WHERE id = '{id}';
-            ''')
-
-            serials = set()
-            for item in items:
-                tags = item.pop("tags")
-                serials.add(item["serial"])
-
-                item['listing_id'] = data['id']
-                item["overview"] = json.dumps(item["overview"])
-
-                cls._pygres(f'''
-                    SELECT * FROM salvage_item
-                    WHERE listing_id = '{id}' AND serial = '{item["serial"]}';
-                ''')
-                if len(cls._pygres.fetch()) > 0:
-                    cls._pygres(f'''
-                        UPDATE salvage_item
-                        SET {", ".join([f"{key} = '{value}'" for key, value in item.items()])}
-                        WHERE listing_id = '{item['listing_id']}' AND serial = '{item['serial']}';
-                    ''')
-                else:
-                    columns = ", ".join(item.keys())
-                    values = tuple(item.values())
-                    cls._pygres(f"INSERT INTO salvage_item({columns}) VALUES {values};")
-
-                for tag in tags:
-                    cls._pygres(f'''
-                        SELECT * FROM salvage_item__tag
-                        WHERE listing_id = '{id}' AND item_serial = '{item['serial']}' AND tag_id = '{tag}';
-                    ''')
-                    if len(cls._pygres.fetch()) == 0:
-                        cls._pygres(f'''
-                            INSERT INTO salvage_item__tag(listing_id, item_serial, tag_id) 
-                            VALUES {(id, item['serial'], tag)};
-                        ''')
-                cls._pygres(f'''
-                    DELETE FROM salvage_item__tag
-                    WHERE listing_id = '{id}' AND item_serial = '{item["serial"]}'
-                        AND tag_id NOT IN ({", ".join([f"'{tag}'" for tag in tags])});
-                ''')
-
-            # clean up if extensions get updated
-            # this wouldn't be required if rows have a unique identifier that could be used to update the row rather than accidentally inserting new data
-            # but i like to make things hard i guess
-            cls._pygres(f'''
-                DELETE FROM salvage_item
-                WHERE listing_id = '{data["id"]}' AND serial != ANY ARRAY[{", ".join([f"'{serial}'" for serial in serials])}];
-            ''')
-            cls._pygres(f'''
-                DELETE FROM salvage_item__tag
-                WHERE listing_id = '{data["id"]}' AND item_serial != ANY ARRAY[{", ".join([f"'{serial}'" for serial in serials])}];
-            ''')
-
-            cls._complete_action()
-        except QueryError as error:
-            print("Error while attempting to update product: ", error)
-            cls._error()
-            return error
+        with cls._session() as pygres:
+            try:
+                pygres("SELECT merge_salvage_listing(%s, %s);", (id, Json(data)))
+                cls._complete_action(pygres)
+                cls._recount_tag_uses(pygres)
+                cls._entities.invalidate("salvage", id)
+                cls._entities.invalidate("salvage", data.get("id", id))
+            except QueryError as error:
+                print("Error while attempting to update product: ", error)
+                cls._error(pygres)
+                return error
 
     @classmethod
     def delete_salvage(cls, id):
-        try:
-            cls._pygres(f"DELETE FROM salvage_listing WHERE id = {id};")
-            cls._complete_action()
-        except QueryError as error:
-            print("Error while attempting to update product: ", error)
-            cls._error()
-            return error
+        with cls._session() as pygres:
+            try:
+                pygres("DELETE FROM salvage_listing WHERE id = %s;", (id,))
+                cls._complete_action(pygres)
+                cls._recount_tag_uses(pygres)
+                cls._entities.invalidate("salvage", id)
+            except QueryError as error:
+                print("Error while attempting to update product: ", error)
+                cls._error(pygres)
+                return error
 
     # CUSTOM METHODS
     @classmethod
     def get_custom_list(cls):
-        try:
-            cls._pygres(f"SELECT id, listing_id, name, description FROM custom_item;")
-            results = cls._pygres.fetch()
-            return [{key: value for key, value in zip(["id", "listing_id", "name", "description"], result)} for result in results]
-        except QueryError as error:
-            print("Error while attempting to update product: ", error)
-            cls._error()
-            return error
+        with cls._session() as pygres:
+            try:
+                pygres(cls.__custom_list_query + ";")
+                results = pygres.fetch()
+                return [{key: value for key, value in zip(["id", "listing_id", "name", "description"], result)} for result in results]
+            except QueryError as error:
+                print("Error while attempting to update product: ", error)
+                cls._error(pygres)
+                return error
+
+    @classmethod
+    def get_custom_page(cls, after: str = None, limit: int = 50):
+        return cls._page(QueryBuilder("custom_list").select(cls.__custom_list_query), ["id", "listing_id", "name", "description"], ["id"], after, limit)
+
+    __custom_list_query = "SELECT id, listing_id, name, description FROM custom_item"
 
     @classmethod
     def get_custom(cls, id):
-        try:
-            cls._pygres(f"SELECT id, listing_id, name, description, customer FROM custom_item WHERE id = {id};")
-            result = cls._pygres.fetch()[0]
-            return {key: value for key, value in zip(["id", "listing_id", "name", "description", "customer"], result)}
-        except QueryError as error:
-            print("Error while attempting to update product: ", error)
-            cls._error()
-            return error
+        with cls._session() as pygres:
+            try:
+                pygres("SELECT id, listing_id, name, description, customer FROM custom_item WHERE id = %s;", (id,))
+                result = pygres.fetch()[0]
+                return {key: value for key, value in zip(["id", "listing_id", "name", "description", "customer"], result)}
+            except QueryError as error:
+                print("Error while attempting to update product: ", error)
+                cls._error(pygres)
+                return error
 
     @classmethod
     def create_custom(cls, data):
-        try:
-            columns = ", ".join(data.keys())
-            values = tuple(data.values())
-            cls._pygres(f"INSERT INTO custom_item({columns}) VALUES {values} RETURNING id;")
-            id = cls._pygres.fetch()[0][0]
-            cls._pygres(f'''
-                UPDATE custom_item
-                SET index = to_tsvector('english', {" || ' ' || ".join([f"COALESCE({column}, '')" for column in ["listing_id", "name", "description", "customer"]])})
-                WHERE id = '{id}';
-            ''')
-            cls._complete_action()
-        except QueryError as error:
-            print("Error while attempting to update product: ", error)
-            cls._error()
-            return error
-        
+        with cls._session() as pygres:
+            try:
+                pygres(f"INSERT INTO custom_item({cls._columns(data)}) VALUES ({cls._placeholders(data)});", tuple(data.values()))
+                cls._complete_action(pygres)
+            except QueryError as error:
+                print("Error while attempting to update product: ", error)
+                cls._error(pygres)
+                return error
+
 
     @classmethod
     def update_custom(cls, id, data):
-        try:
-            cls._pygres(f'''
-                UPDATE custom_item
-                SET {", ".join([f"{key} = '{value}'" for key, value in data.items()])}
-                WHERE id = '{id}' RETURNING id;
-            ''')
-            id = cls._pygres.fetch()[0][0]
-            cls._pygres(f'''
-                UPDATE custom_item
-                SET index = to_tsvector('english', {" || ' ' || ".join([f"COALESCE({column}, '')" for column in ["listing_id", "name", "description", "customer"]])})
-                WHERE id = '{id}';
-            ''')
-            cls._complete_action()
-        except QueryError as error:
-            print("Error while attempting to update product: ", error)
-            cls._error()
-            return error
+        with cls._session() as pygres:
+            try:
+                pygres(f'''
+                    UPDATE custom_item
+                    SET {cls._assignments(data)}
+                    WHERE id = %s;
+                ''', (*data.values(), id))
+                cls._complete_action(pygres)
+            except QueryError as error:
+                print("Error while attempting to update product: ", error)
+                cls._error(pygres)
+                return error
 
     @classmethod
     def delete_custom(cls, id):
-        try:
-            cls._pygres(f"DELETE FROM custom_item WHERE id = {id};")
-            cls._complete_action()
-        except QueryError as error:
-            print("Error while attempting to update product: ", error)
-            cls._error()
-            return error
+        with cls._session() as pygres:
+            try:
+                pygres("DELETE FROM custom_item WHERE id = %s;", (id,))
+                cls._complete_action(pygres)
+                cls._recount_tag_uses(pygres)
+            except QueryError as error:
+                print("Error while attempting to update product: ", error)
+                cls._error(pygres)
+                return error
+
+    @classmethod
+    def statement_stats(cls):
+        statements = list(cls._statements.values()) + QueryBuilder.statements()
+        return {statement.name: {"hits": statement.hits, "prepares": statement.prepares} for statement in statements}
+
+    # the queries run inside the block can be stopped with cancel(token), see Pygres.cancellable
+    @classmethod
+    def cancellable(cls, token):
+        return cls._pygres.cancellable(token) if cls._pygres is not None else nullcontext()
+
+    # stops the statement a cancellable call is running, see Pygres.cancel
+    @classmethod
+    def cancel(cls, token):
+        if cls._pygres is not None:
+            cls._pygres.cancel(token)
 
     @classmethod
     def disconnect(cls):
@@ -0,0 +1,85 @@
+import json
+import threading
+from collections import OrderedDict
+
+# A least recently used cache of hydrated entities, the nested documents the get_* methods build,
+# keyed by their kind and id (as text, so 7 and "7" are the same entry). Each entry is kept as JSON text:
+# its length is what the memory cap counts, and every hit hands back a fresh copy,
+# so a form can change what it got without touching the cache.
+#
+# USAGE:
+# cache = EntityCache(max_bytes = 8 * 1024 * 1024)
+# cache.put("product", "UA0040", product)
+# cache.get("product", "UA0040")       # None on a miss
+# cache.invalidate("product", "UA0040")
+class EntityCache:
+    def __init__(self, max_bytes: int = 16 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.__entries = OrderedDict()
+        self.__bytes = 0
+        self.__lock = threading.Lock()
+        # bumped by every invalidation, a load that started before one is not kept
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, kind: str, id):
+        with self.__lock:
+            entry = self.__entries.get((kind, str(id)))
+            if entry is None:
+                self.misses += 1
+                return None
+            self.__entries.move_to_end((kind, str(id)))
+            self.hits += 1
+        return json.loads(entry)
+
+    def put(self, kind: str, id, entity, generation: int = None):
+        try:
+            entry = json.dumps(entity)
+        except (TypeError, ValueError):
+            return
+
+        with self.__lock:
+            if generation is not None and generation != self.generation:
+                return
+            self.__discard((kind, str(id)))
+            if len(entry) > self.max_bytes:
+                return
+            self.__entries[(kind, str(id))] = entry
+            self.__bytes += len(entry)
+            while self.__bytes > self.max_bytes:
+                _, evicted = self.__entries.popitem(last = False)
+                self.__bytes -= len(evicted)
+                self.evictions += 1
+
+    def __discard(self, key):
+        entry = self.__entries.pop(key, None)
+        if entry is not None:
+            self.__bytes -= len(entry)
+
+    # drops one entity, every entity of a kind, or everything
+    def invalidate(self, kind: str = None, id = None):
+        with self.__lock:
+            self.generation += 1
+            if kind is None:
+                self.__entries.clear()
+                self.__bytes = 0
+            elif id is None:
+                for key in [key for key in self.__entries if key[0] == kind]:
+                    self.__discard(key)
+            else:
+                self.__discard((kind, str(id)))
+
+    def stats(self):
+        with self.__lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups > 0 else 0,
+                "evictions": self.evictions,
+                "entries": len(self.__entries),
+                "bytes": self.__bytes,
+                "max_bytes": self.max_bytes
+            }
@@ -0,0 +1,180 @@
+import threading
+
+# An in-memory index of the tags on every product variation, for the filter panel and the tag filtered
+# product lists. Each tagged variation gets an ordinal, and each tag keeps a bitset (a plain int) with the
+# bit of every variation it is on, so the tags picked in one category are OR'd together, the categories are
+# AND'ed, and how many of the matching variations carry a tag is the bit count of the two AND'ed.
+# It is loaded once and then kept current by the product and tag writes instead of being read again.
+#
+# USAGE:
+# index = FacetIndex()
+# index.load([{"id": 4, "name": "Brass", "category_id": 2}], [("UA00042", "B", 4)])
+# matching = index.filter({"Finish": [4]})     # the bits of the variations with any of those tags
+# index.counts(matching)                        # {4: 1}
+# index.listings(matching)                      # {"UA00042"}
+# index.set_listing("UA00042", {"B": [4, 7]})
+# index.remove_listing("UA00042")
+class FacetIndex:
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__reset()
+        self.loaded = False
+        # bumped by every change, a load that started before one is not kept
+        self.generation = 0
+
+    def __reset(self):
+        self.__tags = {}
+        self.__bits = {}
+        # ordinal -> (listing id, extension), a None is a free ordinal waiting to be reused
+        self.__variations = []
+        self.__ordinals = {}
+        self.__variation_tags = {}
+        self.__listings = {}
+        self.__free = []
+        self.__all = 0
+
+    def load(self, tags: list[dict], links: list[tuple], generation: int = None):
+        with self.__lock:
+            if generation is not None and generation != self.generation:
+                return
+            self.__reset()
+            for tag in tags:
+                self.__tags[tag["id"]] = tag
+                self.__bits[tag["id"]] = 0
+            variations = {}
+            for listing_id, extension, tag_id in links:
+                variations.setdefault((listing_id, extension), []).append(tag_id)
+            for (listing_id, extension), tag_ids in variations.items():
+                self.__link(listing_id, extension, tag_ids)
+            self.loaded = True
+
+    def clear(self):
+        with self.__lock:
+            self.__reset()
+            self.loaded = False
+            self.generation += 1
+
+    def tags(self):
+        with self.__lock:
+            return list(self.__tags.values())
+
+    # the bits of the given (listing id, extension) pairs, untagged variations have none
+    def mask(self, variations: list[tuple]):
+        with self.__lock:
+            # set in a byte array first, OR'ing the bits into an int one by one copies it every time
+            bits = bytearray(len(self.__variations) // 8 + 1)
+            for variation in variations:
+                ordinal = self.__ordinals.get(tuple(variation))
+                if ordinal is not None:
+                    bits[ordinal >> 3] |= 1 << (ordinal & 7)
+            return int.from_bytes(bits, "little")
+
+    # Filters map a category to the tag ids picked in it, a variation matches when it has one of the
+    # tags of every category. Without filters every tagged variation matches, within narrows them further.
+    def filter(self, filters: dict = {}, within: int = None):
+        with self.__lock:
+            mask = self.__all if within is None else self.__all & within
+            for ids in filters.values():
+                mask &= self.__any(ids)
+            return mask
+
+    # For the product lists a listing matches when each category is matched by one of its variations,
+    # not necessarily the same one
+    def filter_listings(self, filters: dict):
+        with self.__lock:
+            listings = None
+            for ids in filters.values():
+                matched = self.__listings_of(self.__any(ids))
+                listings = matched if listings is None else listings & matched
+            return listings if listings is not None else set(self.__listings)
+
+    # how many of the variations in mask carry each tag, tags on none of them are left out
+    def counts(self, mask: int):
+        with self.__lock:
+            counts = {}
+            for id, bits in self.__bits.items():
+                count = (bits & mask).bit_count()
+                if count != 0:
+                    counts[id] = count
+            return counts
+
+    def listings(self, mask: int):
+        with self.__lock:
+            return self.__listings_of(mask)
+
+    # Replaces the tags of every variation of a listing with the given ones (extension -> tag ids).
+    # A listing whose id changed passes the old one, so its variations are dropped first.
+    def set_listing(self, listing_id: str, variations: dict, old_id: str = None):
+        with self.__lock:
+            self.generation += 1
+            if not self.loaded:
+                return
+            self.__unlink(old_id if old_id is not None else listing_id)
+            if old_id is not None:
+                self.__unlink(listing_id)
+            for extension, tag_ids in variations.items():
+                if len(tag_ids) != 0:
+                    self.__link(listing_id, extension, tag_ids)
+
+    def remove_listing(self, listing_id: str):
+        with self.__lock:
+            self.generation += 1
+            self.__unlink(listing_id)
+
+    # adds a tag or changes one, a changed tag keeps the variations it is on
+    def put_tag(self, tag: dict):
+        with self.__lock:
+            self.generation += 1
+            if not self.loaded:
+                return
+            self.__tags[tag["id"]] = tag
+            self.__bits.setdefault(tag["id"], 0)
+
+    def remove_tag(self, id):
+        with self.__lock:
+            self.generation += 1
+            self.__tags.pop(id, None)
+            bits = self.__bits.pop(id, 0)
+            for ordinal in self.__ordinals_of(bits):
+                self.__variation_tags[ordinal].discard(id)
+
+    def __any(self, ids: list):
+        mask = 0
+        for id in ids:
+            mask |= self.__bits.get(int(id), 0)
+        return mask
+
+    @staticmethod
+    def __ordinals_of(mask: int):
+        return [ordinal for ordinal, bit in enumerate(reversed(bin(mask)[2:])) if bit == "1"]
+
+    def __listings_of(self, mask: int):
+        return {self.__variations[ordinal][0] for ordinal in self.__ordinals_of(mask & self.__all)}
+
+    def __link(self, listing_id: str, extension: str, tag_ids: list):
+        if len(self.__free) != 0:
+            ordinal = self.__free.pop()
+            self.__variations[ordinal] = (listing_id, extension)
+        else:
+            ordinal = len(self.__variations)
+            self.__variations.append((listing_id, extension))
+        self.__ordinals[(listing_id, extension)] = ordinal
+        self.__listings.setdefault(listing_id, set()).add(ordinal)
+        self.__variation_tags[ordinal] = set()
+        bit = 1 << ordinal
+        self.__all |= bit
+        for tag_id in tag_ids:
+            # links to a tag the index has not seen (made by another client) are skipped
+            if tag_id in self.__bits:
+                self.__bits[tag_id] |= bit
+                self.__variation_tags[ordinal].add(tag_id)
+
+    def __unlink(self, listing_id: str):
+        for ordinal in self.__listings.pop(listing_id, set()):
+            bit = 1 << ordinal
+            for tag_id in self.__variation_tags.pop(ordinal):
+                self.__bits[tag_id] &= ~bit
+            self.__all &= ~bit
+            del self.__ordinals[self.__variations[ordinal]]
+            self.__variations[ordinal] = None
+            self.__free.append(ordinal)
@@ -0,0 +1,558 @@
+from textwrap import dedent
+
+# A migration takes the database from the version before it to its own version.
+# Its statements run in one transaction together with the schema_version row that records it,
+# so a failed migration leaves nothing behind and the database is always at exactly one version.
+# Migrations that have shipped are never edited, a schema change is a new migration at the end of MIGRATIONS.
+class Migration:
+    def __init__(self, version: int, name: str, statements: list[str]):
+        self.version = version
+        self.name = name
+        self.statements = statements
+
+    # the SQL the migration runs, this is what a dry run prints
+    def __str__(self):
+        return f"-- {self.version}: {self.name}\n" + "\n".join([dedent(statement).strip() for statement in self.statements])
+
+# the columns each table's search index is built from, the database keeps the index in sync through triggers
+INDEXED_COLUMNS = {
+    "product_listing": ["id", "name", "description"],
+    "product_variation": ["subname"],
+    "salvage_listing": ["id", "name", "description"],
+    "custom_item": ["listing_id", "name", "description", "customer"],
+    "tag": ["name"]
+}
+
+# The weighted text of each table's search index, ranked by ts_rank_cd from A down to D: ids and names
+# above descriptions and variation names, above notes, above specifications. An entry is a column of the row,
+# or an expression over it with {row} where the row goes (the overview ones pull the strings and numbers
+# out of a key of the variation's overview document).
+def _overview_text(key: str):
+    return "jsonb_path_query_array({row}overview -> '" + key + "', 'strict $.** ? (@.type() == \"string\" || @.type() == \"number\")')::TEXT"
+
+SEARCH_WEIGHTS = {
+    "product_listing": {"A": ["id", "name"], "B": ["description"]},
+    "product_variation": {"A": [_overview_text("real_id")], "B": ["subname"], "C": [_overview_text("notes")], "D": [_overview_text("specifications"), _overview_text("bulb")]},
+    "salvage_listing": {"A": ["id", "name"], "B": ["description"]},
+    "custom_item": {"A": ["listing_id", "name"], "B": ["description"], "C": ["customer"]},
+    "tag": {"A": ["name"]}
+}
+
+def search_expression(weights: dict, row: str = ""):
+    return " || ".join([
+        f"setweight(to_tsvector('english', {" || ' ' || ".join([f"COALESCE({column.format(row = row) if "{row}" in column else row + column}, '')" for column in columns])}), '{weight}')"
+        for weight, columns in weights.items()
+    ])
+
+# the names and ids the fuzzy searches match against, each table gets one trigram index over them
+TRIGRAM_COLUMNS = {
+    "product_listing": ["id", "name"],
+    "product_variation": ["subname"],
+    "salvage_listing": ["id", "name"],
+    "custom_item": ["name"],
+    "tag": ["name"]
+}
+
+# the tables the dashboards cache what they read from, a write to any of them is announced to the others
+CATALOG_TABLES = [
+    "product_listing", "product_variation", "product_variation__tag", "instock_listing", "instock_item", "instock_item__tag",
+    "salvage_listing", "salvage_item", "salvage_item__tag", "custom_item", "custom_item__tag", "tag"
+]
+
+def index_expression(columns: list, row: str = ""):
+    return f"to_tsvector('english', {" || ' ' || ".join([f"COALESCE({row}{column}, '')" for column in columns])})"
+
+# the reference rows every database starts with, they are only inserted when missing
+FINISHES = [
+    ("PB", "Polished Brass", "YES"),
+    ("PN", "Polished Nickel", "YES"),
+    ("GP", "Green Patina", "YES"),
+    ("BP", "Brown Patina", "YES"),
+    ("AB", "Antique Brass", "YES"),
+    ("SN", "Satin Nickel", "YES"),
+    ("LP", "Light Pewter", "YES"),
+    ("STBR", "Statuary Brown", "NO"),
+    ("STBL", "Statuary Black", "NO"),
+    ("PC", "Polished Chrome", "YES"),
+    ("BN", "Black Nickel", "YES")
+]
+TAG_CATEGORIES = [
+    ("Class", "Whether the item is a(n) Lighting, Bathroom, Washstands, Furnishing, Mirrors, Cabinets, Display, Hardware, Tile"),
+    ("Category", "The order of the classification, such as sconce, hanging, flushmount, etc."),
+    ("Style", "The artistic period that the item is from."),
+    ("Family", "The stuctural grouping of the item, such as \"torch\" for Loft Light, Urban Torch, etc."),
+    ("Designer", "The name of the designer who created the piece."),
+    ("Material", "The type of materials used to create the item, such as alabaster, marble, aluminum, brass, etc."),
+    ("Distinction", "Specifically for lighting used to distinguish exterior and interior."),
+    ("Environmental", "Specifies any environmental conditions the item can be used in, such as waterproof.")
+]
+
+def _literal(value: str):
+    return "'" + value.replace("'", "''") + "'"
+
+MIGRATIONS = [
+    # Every statement here is safe to run against a database the old initialize built,
+    # so those databases are adopted at version 1 without being dropped
+    Migration(1, "baseline tables", [
+        "CREATE EXTENSION IF NOT EXISTS pg_trgm;",
+
+        # Product Related Tables
+        '''
+            CREATE TABLE IF NOT EXISTS finishes(
+                id VARCHAR(5),
+                name VARCHAR(255),
+                outdoor BOOL
+            );
+        ''',
+        '''
+            CREATE TABLE IF NOT EXISTS product_listing(
+                id VARCHAR(10) PRIMARY KEY,
+                name VARCHAR(255),
+                description TEXT
+            );
+        ''',
+        "ALTER TABLE IF EXISTS product_listing ADD COLUMN IF NOT EXISTS index tsvector;",
+        "CREATE INDEX IF NOT EXISTS product_listing_index ON product_listing USING GIN(index);",
+        '''
+            CREATE TABLE IF NOT EXISTS product_variation(
+                extension VARCHAR(10),
+                subname VARCHAR(255),
+                featured BOOL,
+                price INT,
+                display BOOL,
+                overview JSONB,
+                listing_id VARCHAR(10) REFERENCES product_listing(id) ON DELETE CASCADE ON UPDATE CASCADE
+            );
+        ''',
+        "ALTER TABLE IF EXISTS product_variation ADD COLUMN IF NOT EXISTS index tsvector;",
+        "CREATE INDEX IF NOT EXISTS product_variation_index ON product_variation USING GIN(index);",
+        '''
+            CREATE TABLE IF NOT EXISTS instock_listing(
+                id SERIAL PRIMARY KEY,
+                sale BOOL,
+                price INT,
+                listing_id VARCHAR(7) REFERENCES product_listing(id) ON DELETE CASCADE ON UPDATE CASCADE,
+                variation_extension VARCHAR(10)
+            );
+        ''',
+        # every query reads instock_item, older databases created it as instock_items
+        "ALTER TABLE IF EXISTS instock_items RENAME TO instock_item;",
+        '''
+            CREATE TABLE IF NOT EXISTS instock_item(
+                serial INT,
+                display BOOL,
+                overview JSONB,
+                listing_id INT REFERENCES instock_listing(id) ON DELETE CASCADE ON UPDATE CASCADE
+            );
+        ''',
+        '''
+            CREATE TABLE IF NOT EXISTS salvage_listing(
+                id VARCHAR(10) PRIMARY KEY,
+                name VARCHAR(255),
+                description TEXT
+            );
+        ''',
+        "ALTER TABLE IF EXISTS salvage_listing ADD COLUMN IF NOT EXISTS index tsvector;",
+        "CREATE INDEX IF NOT EXISTS salvage_listing_index ON salvage_listing USING GIN(index);",
+        '''
+            CREATE TABLE IF NOT EXISTS salvage_item(
+                serial INT,
+                price INT,
+                display BOOL,
+                overview JSONB,
+                listing_id VARCHAR(10) REFERENCES salvage_listing(id) ON DELETE CASCADE ON UPDATE CASCADE
+            );
+        ''',
+
+        # Gallery Related Tables
+        '''
+            CREATE TABLE IF NOT EXISTS custom_item(
+                id SERIAL PRIMARY KEY,
+                name VARCHAR(255),
+                description TEXT,
+                customer VARCHAR(255),
+                display BOOL,
+                listing_id VARCHAR(10),
+                variation_extension VARCHAR(10)
+            );
+        ''',
+        "ALTER TABLE IF EXISTS custom_item ADD COLUMN IF NOT EXISTS index tsvector;",
+        "CREATE INDEX IF NOT EXISTS custom_item_index ON custom_item USING GIN(index);",
+
+        # Tag Related Tables
+        '''
+            CREATE TABLE IF NOT EXISTS tag_category(
+                id SERIAL PRIMARY KEY,
+                name VARCHAR(255),
+                description TEXT
+            );
+        ''',
+        '''
+            CREATE TABLE IF NOT EXISTS tag(
+                id SERIAL PRIMARY KEY,
+                name VARCHAR(255),
+                category_id INT REFERENCES tag_category(id) ON DELETE CASCADE ON UPDATE CASCADE
+            );
+        ''',
+        "ALTER TABLE IF EXISTS tag ADD COLUMN IF NOT EXISTS index tsvector;",
+        "CREATE INDEX IF NOT EXISTS tag_index ON tag USING GIN(index);",
+        '''
+            CREATE TABLE IF NOT EXISTS product_variation__tag(
+                listing_id VARCHAR(10) REFERENCES product_listing(id) ON DELETE CASCADE ON UPDATE CASCADE,
+                variation_extension VARCHAR(10),
+                tag_id INT REFERENCES tag(id) ON DELETE CASCADE ON UPDATE CASCADE
+            );
+        ''',
+        '''
+            CREATE TABLE IF NOT EXISTS instock_item__tag(
+                listing_id INT REFERENCES instock_listing(id) ON DELETE CASCADE ON UPDATE CASCADE,
+                item_serial INT,
+                tag_id INT REFERENCES tag(id) ON DELETE CASCADE ON UPDATE CASCADE
+            );
+        ''',
+        '''
+            CREATE TABLE IF NOT EXISTS salvage_item__tag(
+                listing_id VARCHAR(10) REFERENCES salvage_listing(id) ON DELETE CASCADE ON UPDATE CASCADE,
+                item_serial INT,
+                tag_id INT REFERENCES tag(id) ON DELETE CASCADE ON UPDATE CASCADE
+            );
+        ''',
+        '''
+            CREATE TABLE IF NOT EXISTS custom_item__tag(
+                item_id INT REFERENCES custom_item(id) ON DELETE CASCADE ON UPDATE CASCADE,
+                tag_id INT REFERENCES tag(id) ON DELETE CASCADE ON UPDATE CASCADE
+            );
+        '''
+    ]),
+
+    # the old initialize inserted the seed rows again on every call,
+    # the copies are folded back into the first row before the missing seeds are added
+    Migration(2, "reference data", [
+        '''
+            DELETE FROM finishes AS duplicate USING finishes AS kept
+            WHERE duplicate.id = kept.id AND duplicate.ctid > kept.ctid;
+        ''',
+        '''
+            UPDATE tag SET category_id = kept.id
+            FROM tag_category AS duplicate, (SELECT name, MIN(id) AS id FROM tag_category GROUP BY name) AS kept
+            WHERE tag.category_id = duplicate.id AND duplicate.name = kept.name AND duplicate.id <> kept.id;
+        ''',
+        '''
+            DELETE FROM tag_category AS duplicate USING tag_category AS kept
+            WHERE duplicate.name = kept.name AND duplicate.id > kept.id;
+        ''',
+        f'''
+            INSERT INTO finishes(id, name, outdoor)
+            SELECT seed.id, seed.name, seed.outdoor::BOOL
+            FROM (VALUES {", ".join([f"({", ".join([_literal(value) for value in finish])})" for finish in FINISHES])}) AS seed(id, name, outdoor)
+            WHERE NOT EXISTS (SELECT 1 FROM finishes WHERE finishes.id = seed.id);
+        ''',
+        f'''
+            INSERT INTO tag_category(name, description)
+            SELECT seed.name, seed.description
+            FROM (VALUES {", ".join([f"({", ".join([_literal(value) for value in category])})" for category in TAG_CATEGORIES])}) AS seed(name, description)
+            WHERE NOT EXISTS (SELECT 1 FROM tag_category WHERE tag_category.name = seed.name);
+        '''
+    ]),
+
+    # the old select-then-write updates could leave duplicate rows behind,
+    # those are dropped before the keys the upserts conflict on are created
+    Migration(3, "row identity", [statement for table, columns in [
+        ("product_variation", ["listing_id", "extension"]),
+        ("instock_item", ["listing_id", "serial"]),
+        ("salvage_item", ["listing_id", "serial"]),
+        ("product_variation__tag", ["listing_id", "variation_extension", "tag_id"]),
+        ("instock_item__tag", ["listing_id", "item_serial", "tag_id"]),
+        ("salvage_item__tag", ["listing_id", "item_serial", "tag_id"]),
+        ("custom_item__tag", ["item_id", "tag_id"])
+    ] for statement in [
+        f'''
+            DELETE FROM {table} AS duplicate USING {table} AS kept
+            WHERE duplicate.ctid < kept.ctid AND {" AND ".join([f"duplicate.{column} = kept.{column}" for column in columns])};
+        ''',
+        f"CREATE UNIQUE INDEX IF NOT EXISTS {table}_key ON {table}({", ".join(columns)});"
+    ]]),
+
+    # the index column is filled in by a BEFORE trigger, so every write touches its row only once
+    Migration(4, "search index triggers", [statement for table, columns in INDEXED_COLUMNS.items() for statement in [
+        f'''
+            CREATE OR REPLACE FUNCTION update_{table}_index() RETURNS TRIGGER AS $$
+            BEGIN
+                NEW.index := {index_expression(columns, "NEW.")};
+                RETURN NEW;
+            END;
+            $$ LANGUAGE plpgsql;
+        ''',
+        f"DROP TRIGGER IF EXISTS {table}_index_update ON {table};",
+        f'''
+            CREATE TRIGGER {table}_index_update
+            BEFORE INSERT OR UPDATE ON {table}
+            FOR EACH ROW EXECUTE FUNCTION update_{table}_index();
+        '''
+    ]]),
+
+    # these take a whole listing document (the listing fields plus an "items" array, each item
+    # carrying its "tags") and reconcile the items and their tag links in one call
+    Migration(5, "listing merges", [
+        '''
+            CREATE OR REPLACE FUNCTION merge_instock_listing(merge_id INT, merge_document JSONB) RETURNS INT AS $$
+            BEGIN
+                UPDATE instock_listing AS listing
+                SET (sale, price, listing_id, variation_extension) = (
+                    SELECT merged.sale, merged.price, merged.listing_id, merged.variation_extension
+                    FROM jsonb_populate_record(listing, merge_document - 'id') AS merged
+                )
+                WHERE listing.id = merge_id;
+
+                INSERT INTO instock_item(listing_id, serial, display, overview)
+                SELECT merge_id, serial, display, overview
+                FROM jsonb_populate_recordset(NULL::instock_item, merge_document->'items')
+                ON CONFLICT (listing_id, serial) DO UPDATE
+                SET display = EXCLUDED.display, overview = EXCLUDED.overview;
+
+                DELETE FROM instock_item
+                WHERE listing_id = merge_id AND serial NOT IN (
+                    SELECT (item->>'serial')::INT FROM jsonb_array_elements(merge_document->'items') AS item
+                );
+
+                DELETE FROM instock_item__tag
+                WHERE listing_id = merge_id AND (item_serial, tag_id) NOT IN (
+                    SELECT (item->>'serial')::INT, tag::INT
+                    FROM jsonb_array_elements(merge_document->'items') AS item, jsonb_array_elements_text(item->'tags') AS tag
+                );
+
+                INSERT INTO instock_item__tag(listing_id, item_serial, tag_id)
+                SELECT merge_id, (item->>'serial')::INT, tag::INT
+                FROM jsonb_array_elements(merge_document->'items') AS item, jsonb_array_elements_text(item->'tags') AS tag
+                ON CONFLICT DO NOTHING;
+
+                RETURN merge_id;
+            END;
+            $$ LANGUAGE plpgsql;
+        ''',
+        '''
+            CREATE OR REPLACE FUNCTION merge_salvage_listing(merge_id VARCHAR, merge_document JSONB) RETURNS VARCHAR AS $$
+            DECLARE
+                new_id VARCHAR;
+            BEGIN
+                -- a changed id cascades to the items and their tag links
+                UPDATE salvage_listing AS listing
+                SET (id, name, description) = (
+                    SELECT merged.id, merged.name, merged.description
+                    FROM jsonb_populate_record(listing, merge_document) AS merged
+                )
+                WHERE listing.id = merge_id
+                RETURNING listing.id INTO new_id;
+
+                INSERT INTO salvage_item(listing_id, serial, price, display, overview)
+                SELECT new_id, serial, price, display, overview
+                FROM jsonb_populate_recordset(NULL::salvage_item, merge_document->'items')
+                ON CONFLICT (listing_id, serial) DO UPDATE
+                SET price = EXCLUDED.price, display = EXCLUDED.display, overview = EXCLUDED.overview;
+
+                DELETE FROM salvage_item
+                WHERE listing_id = new_id AND serial NOT IN (
+                    SELECT (item->>'serial')::INT FROM jsonb_array_elements(merge_document->'items') AS item
+                );
+
+                DELETE FROM salvage_item__tag
+                WHERE listing_id = new_id AND (item_serial, tag_id) NOT IN (
+                    SELECT (item->>'serial')::INT, tag::INT
+                    FROM jsonb_array_elements(merge_document->'items') AS item, jsonb_array_elements_text(item->'tags') AS tag
+                );
+
+                INSERT INTO salvage_item__tag(listing_id, item_serial, tag_id)
+                SELECT new_id, (item->>'serial')::INT, tag::INT
+                FROM jsonb_array_elements(merge_document->'items') AS item, jsonb_array_elements_text(item->'tags') AS tag
+                ON CONFLICT DO NOTHING;
+
+                RETURN new_id;
+            END;
+            $$ LANGUAGE plpgsql;
+        '''
+    ]),
+
+    # The row identity keys become primary keys, and the tag links point at the exact variation or item they tag.
+    # Rows with a NULL key column could never be read back and are dropped first, same for links to missing rows.
+    # The primary keys lead with the columns the reads join on, tag_id gets its own index for the lookups from the tag side.
+    Migration(6, "keys and join indexes", [
+        "DELETE FROM finishes WHERE id IS NULL;",
+        "ALTER TABLE finishes ADD PRIMARY KEY (id);"
+    ] + [statement for table, columns in [
+        ("product_variation", ["listing_id", "extension"]),
+        ("instock_item", ["listing_id", "serial"]),
+        ("salvage_item", ["listing_id", "serial"]),
+        ("product_variation__tag", ["listing_id", "variation_extension", "tag_id"]),
+        ("instock_item__tag", ["listing_id", "item_serial", "tag_id"]),
+        ("salvage_item__tag", ["listing_id", "item_serial", "tag_id"]),
+        ("custom_item__tag", ["item_id", "tag_id"])
+    ] for statement in [
+        f"DELETE FROM {table} WHERE {" OR ".join([f"{column} IS NULL" for column in columns])};",
+        f"ALTER TABLE {table} ADD CONSTRAINT {table}_pkey PRIMARY KEY USING INDEX {table}_key;"
+    ]] + [statement for table, item, columns, references in [
+        ("product_variation__tag", "product_variation", ["listing_id", "variation_extension"], ["listing_id", "extension"]),
+        ("instock_item__tag", "instock_item", ["listing_id", "item_serial"], ["listing_id", "serial"]),
+        ("salvage_item__tag", "salvage_item", ["listing_id", "item_serial"], ["listing_id", "serial"])
+    ] for statement in [
+        f'''
+            DELETE FROM {table} AS link WHERE NOT EXISTS (
+                SELECT 1 FROM {item} WHERE {" AND ".join([f"{item}.{reference} = link.{column}" for column, reference in zip(columns, references)])}
+            );
+        ''',
+        f'''
+            ALTER TABLE {table} ADD CONSTRAINT {table}_{item}_fkey
+            FOREIGN KEY ({", ".join(columns)}) REFERENCES {item}({", ".join(references)}) ON DELETE CASCADE ON UPDATE CASCADE;
+        '''
+    ]] + [
+        f"CREATE INDEX IF NOT EXISTS {table}_tag_id ON {table}(tag_id);"
+        for table in ["product_variation__tag", "instock_item__tag", "salvage_item__tag", "custom_item__tag"]
+    ] + [
+        "CREATE INDEX IF NOT EXISTS tag_category_id ON tag(category_id);",
+        "CREATE INDEX IF NOT EXISTS instock_listing_listing_id ON instock_listing(listing_id, variation_extension);"
+    ]),
+
+    # every write to the reference tables tells the listening dashboards which cached list went stale
+    Migration(7, "reference data notifications", [
+        '''
+            CREATE OR REPLACE FUNCTION notify_reference_data() RETURNS TRIGGER AS $$
+            BEGIN
+                PERFORM pg_notify('reference_data', TG_TABLE_NAME);
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql;
+        '''
+    ] + [statement for table in ["finishes", "tag_category"] for statement in [
+        f"DROP TRIGGER IF EXISTS {table}_reference_data ON {table};",
+        f'''
+            CREATE TRIGGER {table}_reference_data
+            AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON {table}
+            FOR EACH STATEMENT EXECUTE FUNCTION notify_reference_data();
+        '''
+    ]]),
+
+    # the list screens page through tags by name, the other lists page by their primary keys
+    Migration(8, "list sort keys", [
+        "CREATE INDEX IF NOT EXISTS tag_name ON tag(name, id);"
+    ]),
+
+    # the fuzzy searches filter with the pg_trgm word similarity operators, which these indexes serve
+    Migration(9, "trigram indexes", [
+        f"CREATE INDEX IF NOT EXISTS {table}_trigram ON {table} USING GIN ({", ".join([f"{column} gin_trgm_ops" for column in columns])});"
+        for table, columns in TRIGRAM_COLUMNS.items()
+    ]),
+
+    # the triggers build weighted vectors from here on, backfill_indexes rewrites the rows indexed before
+    Migration(10, "weighted search indexes", [
+        f'''
+            CREATE OR REPLACE FUNCTION update_{table}_index() RETURNS TRIGGER AS $$
+            BEGIN
+                NEW.index := {search_expression(weights, "NEW.")};
+                RETURN NEW;
+            END;
+            $$ LANGUAGE plpgsql;
+        '''
+        for table, weights in SEARCH_WEIGHTS.items()
+    ]),
+
+    # How many product variations and listings carry each tag, for the filter panel before anything narrows it.
+    # The writes through Database refresh it concurrently, which needs the unique index.
+    Migration(11, "facet counts", [
+        '''
+            CREATE MATERIALIZED VIEW IF NOT EXISTS tag_facet_count AS
+            SELECT tag.id AS tag_id, tag.name, tag.category_id,
+                COUNT(product_variation__tag.tag_id) AS variations, COUNT(DISTINCT product_variation__tag.listing_id) AS listings
+            FROM tag LEFT JOIN product_variation__tag ON product_variation__tag.tag_id = tag.id
+            GROUP BY tag.id;
+        ''',
+        "CREATE UNIQUE INDEX IF NOT EXISTS tag_facet_count_tag_id ON tag_facet_count(tag_id);",
+        "CREATE INDEX IF NOT EXISTS tag_facet_count_category_id ON tag_facet_count(category_id, name, tag_id);"
+    ]),
+
+    # One row per product listing with what the product lists show of its variations, the category being the
+    # names of its Class tags. The lists sort by id, and the unique index also lets it be refreshed concurrently.
+    Migration(12, "product summary", [
+        '''
+            CREATE MATERIALIZED VIEW IF NOT EXISTS product_summary AS
+            SELECT product_listing.id, product_listing.name, COALESCE(classes.names, '') AS category, product_listing.description,
+                COALESCE(variations.count, 0) AS variations, COALESCE(variations.displayed, 0) AS displayed,
+                COALESCE(variations.featured, FALSE) AS featured, variations.min_price, variations.max_price
+            FROM product_listing
+                LEFT JOIN (
+                    SELECT listing_id, COUNT(*) AS count, COUNT(*) FILTER (WHERE display) AS displayed,
+                        bool_or(featured) AS featured, MIN(price) AS min_price, MAX(price) AS max_price
+                    FROM product_variation
+                    GROUP BY listing_id
+                ) AS variations ON variations.listing_id = product_listing.id
+                LEFT JOIN (
+                    SELECT product_variation__tag.listing_id, string_agg(DISTINCT tag.name, ', ' ORDER BY tag.name) AS names
+                    FROM product_variation__tag
+                        INNER JOIN tag ON tag.id = product_variation__tag.tag_id
+                        INNER JOIN tag_category ON tag_category.id = tag.category_id
+                    WHERE tag_category.name = 'Class'
+                    GROUP BY product_variation__tag.listing_id
+                ) AS classes ON classes.listing_id = product_listing.id;
+        ''',
+        "CREATE UNIQUE INDEX IF NOT EXISTS product_summary_id ON product_summary(id);"
+    ]),
+
+    # Tag names can be NULL, and a row compares as NULL against a cursor holding one, so the tags are paged
+    # by COALESCE(name, '') instead, which is what the index now holds.
+    Migration(13, "tag sort key", [
+        "DROP INDEX IF EXISTS tag_name;",
+        "CREATE INDEX IF NOT EXISTS tag_sort_name ON tag((COALESCE(name, '')), id);"
+    ]),
+
+    # Every write to the catalog tables tells the listening dashboards which table changed, so what they
+    # cached from it can be dropped. Like the reference data notifications, one per table and transaction.
+    Migration(14, "catalog notifications", [
+        '''
+            CREATE OR REPLACE FUNCTION notify_catalog_data() RETURNS TRIGGER AS $$
+            BEGIN
+                PERFORM pg_notify('catalog_data', TG_TABLE_NAME);
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql;
+        '''
+    ] + [statement for table in CATALOG_TABLES for statement in [
+        f"DROP TRIGGER IF EXISTS {table}_catalog_data ON {table};",
+        f'''
+            CREATE TRIGGER {table}_catalog_data
+            AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON {table}
+            FOR EACH STATEMENT EXECUTE FUNCTION notify_catalog_data();
+        '''
+    ]]),
+
+    # Migration 2 inserted the seed rows in whatever order its anti join produced them, so on a new database
+    # the tag categories got their ids (the order they are listed in) out of the order of TAG_CATEGORIES.
+    # The ids the seed categories hold are handed back out to them in list order, through a pass over negative
+    # ids so no two rows ever hold the same one, and their tags follow through ON UPDATE CASCADE. The finishes
+    # have no ids to order by, so they keep their place in FINISHES as a position (NULL for any added later).
+    Migration(15, "reference data order", [
+        f'''
+            UPDATE tag_category SET id = -id
+            WHERE name IN ({", ".join([_literal(name) for name, _ in TAG_CATEGORIES])});
+        ''',
+        f'''
+            UPDATE tag_category SET id = ordered.id
+            FROM (
+                SELECT ids.id, names.name
+                FROM (SELECT -id AS id, ROW_NUMBER() OVER (ORDER BY -id) AS slot FROM tag_category WHERE id < 0) AS ids
+                INNER JOIN (
+                    SELECT seed.name, ROW_NUMBER() OVER (ORDER BY seed.ordinality) AS slot
+                    FROM unnest(ARRAY[{", ".join([_literal(name) for name, _ in TAG_CATEGORIES])}]) WITH ORDINALITY AS seed(name, ordinality)
+                    INNER JOIN tag_category ON tag_category.name = seed.name AND tag_category.id < 0
+                ) AS names USING(slot)
+            ) AS ordered
+            WHERE tag_category.name = ordered.name;
+        ''',
+        "ALTER TABLE finishes ADD COLUMN IF NOT EXISTS position INT;",
+        f'''
+            UPDATE finishes SET position = seed.ordinality
+            FROM unnest(ARRAY[{", ".join([_literal(id) for id, _, _ in FINISHES])}]) WITH ORDINALITY AS seed(id, ordinality)
+            WHERE finishes.id = seed.id;
+        ''',
+        # the views hold the category ids of the tags
+        "REFRESH MATERIALIZED VIEW tag_facet_count;",
+        "REFRESH MATERIALIZED VIEW product_summary;"
+    ])
+]
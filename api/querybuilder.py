@@ -0,0 +1,130 @@
+import re
+import threading
+
+# A statement the Database class runs often enough to be worth preparing.
+# The query is written with $1, $2, ... placeholders and it is PREPAREd once per
+# connection, after that only an EXECUTE with the bind values goes to the server
+class Statement:
+    def __init__(self, name: str, query: str):
+        self.name = name
+        self.query = query
+        self.hits = 0
+        self.prepares = 0
+
+# Builds a list query out of clauses instead of one f-string: the WITH queries it needs, the SELECT that
+# makes the rows, and the conditions, sort and limit applied to those rows (the SELECT is wrapped, so they
+# name its output columns and never have to tell which table a column came from). The SELECT is either
+# given whole, or composed from a source table, the columns read and the joins they need, so a branch that
+# needs one more column or join adds it instead of splicing it into the SQL. Clauses are written with
+# %(name)s parameters like the rest of the Database class, with the values passed next to them.
+# compile turns the query into a prepared Statement and the values in the order it binds them. The SQL only
+# depends on which clauses were added, never on the values, so it is compiled once per shape (and prepared
+# once per connection), and the same filters searched again reuse both the string and the server's plan.
+# The shapes are the branches of the list methods, so there are only ever a handful and they are kept for good.
+#
+# USAGE:
+# query = QueryBuilder("tag_list")
+# query.with_query("search_filtered", "SELECT id FROM tag WHERE index @@ to_tsquery(%(search)s)", search = "'loft':*")
+# query.select_from("tag", "tag.id AS id", "tag.name AS name")
+# query.column("search_filtered.rank AS rank").join("INNER JOIN search_filtered USING(id)")
+# query.after(["name", "id"], ["Loft", 12]).order_by("name", "id").limit(20)
+# statement, values = query.compile()
+# pygres.execute(statement, values)
+class QueryBuilder:
+    __shapes = {}
+    __lock = threading.Lock()
+
+    def __init__(self, name: str):
+        self.name = name
+        self.__with = []
+        self.__select = None
+        self.__source = None
+        self.__columns = []
+        self.__joins = []
+        self.__where = []
+        self.__order = []
+        self.__limit = False
+        self.__values = {}
+
+    def with_query(self, name: str, query: str, **values):
+        self.__with.append((name, query))
+        self.__values.update(values)
+        return self
+
+    def select(self, query: str, **values):
+        self.__select = query
+        self.__values.update(values)
+        return self
+
+    def select_from(self, source: str, *columns: str, **values):
+        self.__source = source
+        self.__columns.extend(columns)
+        self.__values.update(values)
+        return self
+
+    def column(self, column: str, **values):
+        self.__columns.append(column)
+        self.__values.update(values)
+        return self
+
+    def join(self, join: str, **values):
+        self.__joins.append(join)
+        self.__values.update(values)
+        return self
+
+    def where(self, condition: str, **values):
+        self.__where.append(condition)
+        self.__values.update(values)
+        return self
+
+    # keeps the rows that sort after the given values of the key, for the keyset pages
+    def after(self, key: list, values: list):
+        parameters = {f"after_{index}": value for index, value in enumerate(values)}
+        return self.where(f"({", ".join(key)}) > ({", ".join([f"%({name})s" for name in parameters])})", **parameters)
+
+    def order_by(self, *columns: str):
+        self.__order.extend(columns)
+        return self
+
+    # a None limit keeps every row
+    def limit(self, limit: int):
+        self.__limit = True
+        self.__values["limit"] = limit
+        return self
+
+    def compile(self):
+        shape = (self.name, tuple(self.__with), self.__select, self.__source, tuple(self.__columns), tuple(self.__joins),
+            tuple(self.__where), tuple(self.__order), self.__limit)
+        with QueryBuilder.__lock:
+            compiled = QueryBuilder.__shapes.get(shape)
+            if compiled is None:
+                compiled = self.__compile(f"{self.name}_{len(QueryBuilder.__shapes)}")
+                QueryBuilder.__shapes[shape] = compiled
+        statement, names = compiled
+        return statement, tuple(self.__values[name] for name in names)
+
+    def __compile(self, name: str):
+        select = self.__select
+        if select is None:
+            select = f"SELECT {", ".join(self.__columns)} FROM {self.__source} {" ".join(self.__joins)}"
+        query = f'''
+            {"WITH " + ", ".join([f"{alias} AS ({subquery})" for alias, subquery in self.__with]) if len(self.__with) != 0 else ""}
+            SELECT * FROM ({select}) AS results
+            {"WHERE " + " AND ".join(self.__where) if len(self.__where) != 0 else ""}
+            {"ORDER BY " + ", ".join(self.__order) if len(self.__order) != 0 else ""}
+            {"LIMIT %(limit)s" if self.__limit else ""}
+        '''
+        # each parameter becomes $n, numbered in the order they first appear, and %% a plain %
+        names = []
+        def placeholder(match):
+            if match.group(1) is None:
+                return "%"
+            if match.group(1) not in names:
+                names.append(match.group(1))
+            return f"${names.index(match.group(1)) + 1}"
+        return Statement(name, re.sub(r"%\((\w+)\)s|%%", placeholder, query)), names
+
+    @classmethod
+    def statements(cls):
+        with cls.__lock:
+            return [statement for statement, names in cls.__shapes.values()]
@@ -0,0 +1,101 @@
+import re
+import threading
+from bisect import bisect_left, insort
+
+# An in-memory index of every tag, for the tag search boxes. Each word of a tag's name is kept
+# lowercased in one sorted list, so the tags with a word starting with what was typed are found
+# with a bisect, and they are ranked by how many items use them (the most used first). A tag without
+# a name has no words, it is only listed by the empty search.
+# It is loaded once and then kept current by the writes instead of being read again.
+#
+# USAGE:
+# index = TagIndex()
+# index.load([{"id": 4, "name": "Wall Sconce", "category": "Category", "uses": 12}])
+# index.search("wall sco")     # [{"id": 4, "name": "Wall Sconce", "category": "Category"}]
+# index.put({"id": 4, "name": "Sconce", "category": "Category"})
+# index.set_uses({4: 13})
+# index.remove(4)
+class TagIndex:
+    def __init__(self):
+        self.__tags = {}
+        self.__words = []
+        self.__lock = threading.Lock()
+        self.loaded = False
+        # bumped by every change, a load that started before one is not kept
+        self.generation = 0
+
+    @staticmethod
+    def __split(text: str):
+        return re.findall(r"\w+", text.lower())
+
+    def load(self, tags: list[dict], generation: int = None):
+        with self.__lock:
+            if generation is not None and generation != self.generation:
+                return
+            self.__tags = {tag["id"]: tag for tag in tags}
+            self.__words = sorted((word, tag["id"]) for tag in tags for word in self.__split(tag["name"] or ""))
+            self.loaded = True
+
+    def clear(self):
+        with self.__lock:
+            self.__tags = {}
+            self.__words = []
+            self.loaded = False
+            self.generation += 1
+
+    # the ids of the tags with a word starting with prefix
+    def __matching(self, prefix: str):
+        ids = set()
+        index = bisect_left(self.__words, (prefix,))
+        while index < len(self.__words) and self.__words[index][0].startswith(prefix):
+            ids.add(self.__words[index][1])
+            index += 1
+        return ids
+
+    # every word typed has to start one of the tag's words, an empty search lists the most used tags
+    def search(self, text: str, limit: int = 20):
+        with self.__lock:
+            words = self.__split(text)
+            if len(words) == 0:
+                ids = set(self.__tags)
+            else:
+                ids = self.__matching(words[0])
+                for word in words[1:]:
+                    ids &= self.__matching(word)
+
+            tags = sorted((self.__tags[id] for id in ids), key = lambda tag: (-tag["uses"], tag["name"] or "", tag["id"]))
+            return [{"id": tag["id"], "name": tag["name"], "category": tag["category"]} for tag in tags[:limit]]
+
+    # adds a tag or changes one, a changed tag keeps its use count
+    def put(self, tag: dict):
+        with self.__lock:
+            self.generation += 1
+            if not self.loaded:
+                return
+            old = self.__tags.get(tag["id"])
+            if old is not None:
+                self.__unlink(old)
+            tag = {"uses": old["uses"] if old is not None else 0, **tag}
+            self.__tags[tag["id"]] = tag
+            for word in self.__split(tag["name"] or ""):
+                insort(self.__words, (word, tag["id"]))
+
+    # sets how many items use each tag, the tags left out are used by none
+    def set_uses(self, uses: dict):
+        with self.__lock:
+            self.generation += 1
+            for id, tag in self.__tags.items():
+                tag["uses"] = uses.get(id, 0)
+
+    def remove(self, id):
+        with self.__lock:
+            self.generation += 1
+            tag = self.__tags.pop(id, None)
+            if tag is not None:
+                self.__unlink(tag)
+
+    def __unlink(self, tag: dict):
+        for word in self.__split(tag["name"] or ""):
+            index = bisect_left(self.__words, (word, tag["id"]))
+            if index < len(self.__words) and self.__words[index] == (word, tag["id"]):
+                del self.__words[index]
@@ -1,6 +1,12 @@
+import sys
 from api.database import Database
 
+# USAGE:
+# python databaseinit.py             applies the pending migrations
+# python databaseinit.py --dry-run   prints the SQL of the pending migrations without running it
+# python databaseinit.py --reset     drops everything and migrates from scratch
 Database.connect("./sessions/database-env.json")
-# Database.reset()
-# Database.initialize()
-Database.disconnect()
\ No newline at end of file
+if "--reset" in sys.argv and "--dry-run" not in sys.argv:
+    Database.reset()
+print("Schema version:", Database.initialize(dry_run = "--dry-run" in sys.argv))
+Database.disconnect()
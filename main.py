@@ -2,6 +2,7 @@ from kivy.core.window import Window
 from kivymd.app import MDApp
 from api.appbuilder import AppBuilder
 from api.database import Database
+from api.asyncdatabase import AsyncDatabase
 
 class DashApp(MDApp):
     def __init__(self, **kwargs):
@@ -9,6 +10,8 @@ class DashApp(MDApp):
 
         # initializing the database connection
         Database.connect("./sessions/database-env.json")
+        # only a version check unless the schema is behind
+        Database.initialize()
 
         # theming dash
         self.theme_cls.theme_style = "Dark"
@@ -25,6 +28,7 @@ class DashApp(MDApp):
         return AppBuilder()
 
     def on_request_close(self, *args):
+        AsyncDatabase.shutdown()
         Database.disconnect()
         self.stop()
 
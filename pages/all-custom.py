@@ -1,10 +1,11 @@
+import asynckivy
 from kivy.core.window import Window
 from kivymd.uix.screen import MDScreen
 from kivymd.uix.boxlayout import MDBoxLayout
 from kivymd.uix.label import MDLabel
 from kivymd.uix.button import MDIconButton, MDFabButton
 from kivymd.uix.dialog import MDDialog, MDDialogHeadlineText, MDDialogSupportingText, MDDialogButtonContainer
-from api.database import Database
+from api.asyncdatabase import AsyncDatabase
 from widgets.datawindow import DataWindow, DataHeader
 
 class AllCustom(MDScreen):
@@ -69,22 +70,21 @@ class AllCustom(MDScreen):
                 )
             )
 
-            def delete():
-                Database.delete_custom(id)
+            async def delete():
                 dialog.dismiss()
-                update()
+                if await AsyncDatabase.delete_custom(id) is None:
+                    self.data_window.remove(id)
 
             cancel.bind(on_press = lambda *args: dialog.dismiss())
-            confirm.bind(on_release = lambda *args: delete())
+            confirm.bind(on_release = lambda *args: asynckivy.start(delete()))
 
             dialog.open()
 
         def update():
-            self.data_window.update(
-                Database.get_custom_list(), 
+            self.data_window.paginate(
+                AsyncDatabase.get_custom_page,
                 lambda data: edit_custom(data["id"]) if "id" in data.keys() else self._switch("home"),
                 lambda data: delete_custom(data["id"]) if "id" in data.keys() else self._switch("home")
             )
 
         update()
-
@@ -1,10 +1,11 @@
+import asynckivy
 from kivy.core.window import Window
 from kivymd.uix.screen import MDScreen
 from kivymd.uix.boxlayout import MDBoxLayout
 from kivymd.uix.label import MDLabel
 from kivymd.uix.button import MDIconButton, MDFabButton
 from kivymd.uix.dialog import MDDialog, MDDialogHeadlineText, MDDialogSupportingText, MDDialogButtonContainer
-from api.database import Database
+from api.asyncdatabase import AsyncDatabase
 from widgets.datawindow import DataWindow, DataHeader
 
 class AllSalvage(MDScreen):
@@ -69,21 +70,21 @@ class AllSalvage(MDScreen):
                 )
             )
 
-            def delete():
-                Database.delete_salvage(id)
+            async def delete():
                 dialog.dismiss()
-                update()
+                if await AsyncDatabase.delete_salvage(id) is None:
+                    self.data_window.remove(id)
 
             cancel.bind(on_press = lambda *args: dialog.dismiss())
-            confirm.bind(on_release = lambda *args: delete())
+            confirm.bind(on_release = lambda *args: asynckivy.start(delete()))
 
             dialog.open()
 
         def update():
-            self.data_window.update(
-                Database.get_salvage_list(), 
+            self.data_window.paginate(
+                AsyncDatabase.get_salvage_page,
                 lambda data: edit_salvage(data["id"]) if "id" in data.keys() else self._switch("home"),
                 lambda data: delete_salvage(data["id"]) if "id" in data.keys() else self._switch("home")
             )
 
-        update()
\ No newline at end of file
+        update()
@@ -1,3 +1,4 @@
+import asynckivy
 from kivy.core.window import Window
 from kivymd.uix.screen import MDScreen
 from kivymd.uix.boxlayout import MDBoxLayout
@@ -5,7 +6,7 @@ from kivymd.uix.label import MDLabel
 from kivymd.uix.textfield import MDTextFieldHintText, MDTextFieldHelperText
 from kivymd.uix.button import MDIconButton, MDFabButton
 from kivymd.uix.dialog import MDDialog, MDDialogHeadlineText, MDDialogSupportingText, MDDialogContentContainer, MDDialogButtonContainer
-from api.database import Database
+from api.asyncdatabase import AsyncDatabase
 from widgets.datawindow import DataWindow, DataHeader
 from widgets.forms.form import FormStructure, Form, TextInput, DropdownInput
 from widgets.forms.createtagform import CreateTagForm
@@ -15,7 +16,7 @@ class AllTags(MDScreen):
         super(AllTags, self).__init__(**kwargs)
         self.name = "all-tags"
 
-        self.tag_form = CreateTagForm(on_submit = lambda: self.update())
+        self.tag_form = CreateTagForm(on_submit = self.saved)
 
         home = MDIconButton(
             icon = "home",
@@ -72,21 +73,31 @@ class AllTags(MDScreen):
                 )
             )
 
-            def delete():
-                Database.delete_tag(id)
+            async def delete():
                 dialog.dismiss()
-                self.update()
+                if await AsyncDatabase.delete_tag(id) is None:
+                    self.data_window.remove(id)
 
             cancel.bind(on_press = lambda *args: dialog.dismiss())
-            confirm.bind(on_release = lambda *args: delete())
+            confirm.bind(on_release = lambda *args: asynckivy.start(delete()))
 
             dialog.open()
 
-        self.data_window.update(
-            Database.get_tag_list(),
+        self.data_window.paginate(
+            AsyncDatabase.get_tag_page,
             lambda data: edit_tag(data["id"]) if "id" in data.keys() else self._switch("home"),
             lambda data: delete_tag(data["id"]) if "id" in data.keys() else self._switch("home")
         )
 
+    # an edited tag is relabelled in place, a new one needs its id from the database so the list is fetched again
+    def saved(self, id, data):
+        if id is None:
+            return self.update()
+        asynckivy.start(self.__relabel(id, data))
+
+    async def __relabel(self, id, data):
+        categories = {category["id"]: category["name"] for category in await AsyncDatabase.get_tag_category_list()}
+        self.data_window.patch({"id": id, "name": data["name"], "category": categories.get(data["category_id"], "")})
+
     def on_pre_enter(self):
         self.update()
\ No newline at end of file
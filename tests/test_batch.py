@@ -0,0 +1,116 @@
+import pytest
+from contextlib import contextmanager
+from api.database import Database, QueryError
+from api.entitycache import EntityCache
+from api.tagindex import TagIndex
+from api.facetindex import FacetIndex
+
+# Runs Database.batch against a stand-in pool, whose sessions log the statements, commits and rollbacks
+# they were sent, so no server is needed.
+#
+# USAGE:
+# python -m pytest tests   (from the project root)
+
+# fails every statement sent with one of the given ids
+class LoggedSession:
+    def __init__(self, failing: set):
+        self.failing = failing
+        self.log = []
+
+    def __call__(self, query: str, parameters = None):
+        if parameters is not None and any(parameter in self.failing for parameter in parameters):
+            raise QueryError("Error while executing query: failing id")
+        self.log.append(" ".join(query.split()))
+
+    def fetch(self):
+        return []
+
+    def commit(self):
+        self.log.append("COMMIT")
+
+    def rollback(self):
+        self.log.append("ROLLBACK")
+
+class LoggedPool:
+    def __init__(self, failing: set = set()):
+        self.failing = failing
+        self.sessions = []
+
+    @contextmanager
+    def session(self):
+        session = LoggedSession(self.failing)
+        self.sessions.append(session)
+        yield session
+
+@pytest.fixture
+def pool(monkeypatch):
+    pool = LoggedPool({"broken"})
+    monkeypatch.setattr(Database, "_pygres", pool)
+    monkeypatch.setattr(Database, "_entities", EntityCache())
+    tags = TagIndex()
+    tags.load([{"id": 1, "name": "Brass", "category": "Finish", "uses": 0}])
+    monkeypatch.setattr(Database, "_tags", tags)
+    facets = FacetIndex()
+    facets.load([{"id": 1, "name": "Brass", "category_id": 1}], [])
+    monkeypatch.setattr(Database, "_facets", facets)
+    return pool
+
+REFRESHES = ["REFRESH MATERIALIZED VIEW CONCURRENTLY tag_facet_count;", "COMMIT", "REFRESH MATERIALIZED VIEW CONCURRENTLY product_summary;", "COMMIT"]
+
+def test_without_a_batch_every_write_commits_on_its_own_session(pool):
+    Database.delete_tag(1)
+    Database.delete_tag(2)
+    assert len(pool.sessions) == 2
+    assert pool.sessions[0].log == ["DELETE FROM tag WHERE id = %s;", "COMMIT"] + REFRESHES
+
+def test_a_batch_commits_its_writes_once_and_refreshes_the_views_after(pool):
+    with Database.batch():
+        Database.delete_tag(1)
+        Database.delete_tag(2)
+    assert len(pool.sessions) == 1
+    assert pool.sessions[0].log == ["DELETE FROM tag WHERE id = %s;", "DELETE FROM tag WHERE id = %s;", "COMMIT"] + REFRESHES
+    assert Database._batch_session() is None
+
+def test_a_failed_call_rolls_the_batch_back_and_raises(pool):
+    with pytest.raises(QueryError):
+        with Database.batch():
+            Database.delete_tag(1)
+            Database.delete_tag("broken")
+            Database.delete_tag(2)
+    log = pool.sessions[0].log
+    assert "COMMIT" not in log
+    assert log[-1] == "ROLLBACK"
+    assert Database._batch_session() is None
+
+def test_an_exception_in_the_block_rolls_back_and_drops_the_indexes(pool):
+    Database._entities.put("tag", 3, {"id": 3})
+    with pytest.raises(ValueError):
+        with Database.batch():
+            Database.delete_tag(1)
+            raise ValueError()
+    assert pool.sessions[0].log == ["DELETE FROM tag WHERE id = %s;", "ROLLBACK"]
+    # the delete already patched them, the rollback undid it
+    assert not Database._tags.loaded
+    assert not Database._facets.loaded
+    assert Database._entities.get("tag", 3) is None
+
+def test_an_exception_before_any_write_keeps_the_indexes(pool):
+    with pytest.raises(ValueError):
+        with Database.batch():
+            raise ValueError()
+    assert pool.sessions[0].log == ["ROLLBACK"]
+    assert Database._tags.loaded
+    assert Database._facets.loaded
+
+def test_a_nested_batch_joins_the_open_one(pool):
+    with Database.batch():
+        Database.delete_tag(1)
+        with Database.batch():
+            Database.delete_tag(2)
+        assert Database._batch_session() is pool.sessions[0]
+    assert len(pool.sessions) == 1
+    assert pool.sessions[0].log.count("COMMIT") == 3
+
+def test_batched_returns_what_the_work_returns(pool):
+    assert Database.batched(lambda ids: [Database.delete_tag(id) for id in ids], [1, 2]) == [None, None]
+    assert len(pool.sessions) == 1
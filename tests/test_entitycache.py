@@ -0,0 +1,93 @@
+import json
+from api.entitycache import EntityCache
+
+# USAGE:
+# python -m pytest tests   (from the project root)
+
+def size(entity):
+    return len(json.dumps(entity))
+
+def test_a_hit_is_a_copy():
+    cache = EntityCache()
+    cache.put("product", "UA00001", {"id": "UA00001", "variations": [{"extension": "A"}]})
+    product = cache.get("product", "UA00001")
+    product["variations"].append({"extension": "B"})
+    assert cache.get("product", "UA00001") == {"id": "UA00001", "variations": [{"extension": "A"}]}
+
+def test_ids_are_keyed_as_text():
+    cache = EntityCache()
+    cache.put("tag", 7, {"id": 7})
+    assert cache.get("tag", "7") == {"id": 7}
+    cache.invalidate("tag", "7")
+    assert cache.get("tag", 7) is None
+
+def test_kinds_are_kept_apart():
+    cache = EntityCache()
+    cache.put("stock", 1, {"kind": "stock"})
+    cache.put("custom", 1, {"kind": "custom"})
+    assert cache.get("stock", 1) == {"kind": "stock"}
+    assert cache.get("custom", 1) == {"kind": "custom"}
+
+def test_the_least_recently_used_are_evicted_past_the_cap():
+    entity = {"name": "x" * 20}
+    cache = EntityCache(max_bytes = size(entity) * 3)
+    for id in [1, 2, 3]:
+        cache.put("tag", id, entity)
+    cache.get("tag", 1)
+    cache.put("tag", 4, entity)
+    assert cache.get("tag", 2) is None
+    assert [cache.get("tag", id) is not None for id in [1, 3, 4]] == [True, True, True]
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["bytes"] == size(entity) * 3
+
+def test_a_replaced_entry_is_counted_once():
+    cache = EntityCache()
+    cache.put("tag", 1, {"name": "Brass"})
+    cache.put("tag", 1, {"name": "Brushed Brass"})
+    assert cache.stats()["entries"] == 1
+    assert cache.stats()["bytes"] == size({"name": "Brushed Brass"})
+
+def test_an_entry_larger_than_the_cap_is_not_kept():
+    cache = EntityCache(max_bytes = 16)
+    cache.put("tag", 1, {"a": 1})
+    cache.put("tag", 1, {"name": "x" * 32})
+    assert cache.get("tag", 1) is None
+    assert cache.stats()["bytes"] == 0
+
+def test_an_entity_that_is_not_json_is_not_kept():
+    cache = EntityCache()
+    cache.put("tag", 1, {"when": object()})
+    assert cache.get("tag", 1) is None
+
+def test_invalidate_one_a_kind_or_everything():
+    cache = EntityCache()
+    for kind in ["product", "stock"]:
+        for id in [1, 2]:
+            cache.put(kind, id, {"id": id})
+    cache.invalidate("product", 1)
+    assert cache.get("product", 1) is None and cache.get("product", 2) is not None
+    cache.invalidate("product")
+    assert cache.get("product", 2) is None and cache.get("stock", 1) is not None
+    cache.invalidate()
+    assert cache.get("stock", 1) is None and cache.get("stock", 2) is None
+    assert cache.stats()["bytes"] == 0
+
+def test_a_load_started_before_an_invalidation_is_not_kept():
+    cache = EntityCache()
+    generation = cache.generation
+    cache.invalidate("product", "UA00001")
+    cache.put("product", "UA00001", {"id": "UA00001"}, generation)
+    assert cache.get("product", "UA00001") is None
+    cache.put("product", "UA00001", {"id": "UA00001"}, cache.generation)
+    assert cache.get("product", "UA00001") is not None
+
+def test_stats_count_hits_and_misses():
+    cache = EntityCache(max_bytes = 1024)
+    assert cache.stats()["hit_rate"] == 0
+    cache.put("tag", 1, {"id": 1})
+    cache.get("tag", 1)
+    cache.get("tag", 1)
+    cache.get("tag", 2)
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"], stats["max_bytes"]) == (2, 1, 1, 1024)
+    assert stats["hit_rate"] == 2 / 3
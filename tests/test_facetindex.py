@@ -0,0 +1,114 @@
+from api.facetindex import FacetIndex
+
+# USAGE:
+# python -m pytest tests   (from the project root)
+
+BRASS, BRONZE, LOFT, TORCH = 1, 2, 3, 4
+
+def loaded():
+    index = FacetIndex()
+    index.load(
+        [
+            {"id": BRASS, "name": "Brass", "category_id": 1},
+            {"id": BRONZE, "name": "Bronze", "category_id": 1},
+            {"id": LOFT, "name": "Loft", "category_id": 2},
+            {"id": TORCH, "name": "Torch", "category_id": 2}
+        ],
+        [
+            ("UA00001", "A", BRASS), ("UA00001", "A", LOFT),
+            ("UA00001", "B", BRONZE),
+            ("UA00002", "A", BRONZE), ("UA00002", "A", TORCH),
+            ("UA00003", "A", BRASS), ("UA00003", "A", TORCH)
+        ]
+    )
+    return index
+
+def test_tags_are_ored_within_a_category_and_anded_across():
+    index = loaded()
+    assert index.listings(index.filter({"Finish": [BRASS, BRONZE]})) == {"UA00001", "UA00002", "UA00003"}
+    assert index.listings(index.filter({"Finish": [BRASS], "Style": [TORCH]})) == {"UA00003"}
+    assert index.listings(index.filter({"Finish": [BRONZE], "Style": [LOFT]})) == set()
+
+def test_filter_takes_ids_as_text():
+    index = loaded()
+    assert index.filter({"Finish": [str(BRASS)]}) == index.filter({"Finish": [BRASS]})
+
+def test_no_filters_match_every_tagged_variation():
+    index = loaded()
+    assert index.counts(index.filter()) == {BRASS: 2, BRONZE: 2, LOFT: 1, TORCH: 2}
+
+def test_counts_are_of_the_matching_variations():
+    index = loaded()
+    assert index.counts(index.filter({"Style": [TORCH]})) == {BRASS: 1, BRONZE: 1, TORCH: 2}
+
+def test_within_narrows_the_filter():
+    index = loaded()
+    within = index.mask([("UA00001", "A"), ("UA00001", "B"), ("UA00009", "A")])
+    assert index.listings(index.filter({"Finish": [BRONZE]}, within)) == {"UA00001"}
+
+def test_a_listing_matches_each_category_with_any_of_its_variations():
+    index = loaded()
+    # UA00001 is bronze on B and loft on A, no single variation is both
+    assert index.filter_listings({"Finish": [BRONZE], "Style": [LOFT]}) == {"UA00001"}
+    assert index.filter_listings({}) == {"UA00001", "UA00002", "UA00003"}
+
+def test_set_listing_replaces_its_variations():
+    index = loaded()
+    index.set_listing("UA00001", {"A": [TORCH], "B": []})
+    assert index.counts(index.filter()) == {BRASS: 1, BRONZE: 1, TORCH: 3}
+    assert index.listings(index.mask([("UA00001", "B")])) == set()
+
+def test_set_listing_with_a_changed_id_drops_the_old_one():
+    index = loaded()
+    index.set_listing("UA00010", {"A": [BRASS]}, "UA00001")
+    assert index.listings(index.filter({"Finish": [BRASS]})) == {"UA00003", "UA00010"}
+    assert "UA00001" not in index.filter_listings({})
+
+def test_remove_listing_frees_its_ordinals_for_reuse():
+    index = loaded()
+    removed = index.mask([("UA00002", "A")])
+    index.remove_listing("UA00002")
+    assert index.counts(index.filter()) == {BRASS: 2, BRONZE: 1, LOFT: 1, TORCH: 1}
+    index.set_listing("UA00004", {"A": [LOFT]})
+    assert index.mask([("UA00004", "A")]) == removed
+
+def test_put_and_remove_tag():
+    index = loaded()
+    index.put_tag({"id": BRASS, "name": "Brushed Brass", "category_id": 1})
+    index.put_tag({"id": 5, "name": "Globe", "category_id": 2})
+    assert {tag["id"]: tag["name"] for tag in index.tags()}[BRASS] == "Brushed Brass"
+    assert index.counts(index.filter({"Finish": [BRASS]})) == {BRASS: 2, LOFT: 1, TORCH: 1}
+    index.set_listing("UA00002", {"A": [5]})
+    assert index.listings(index.filter({"Style": [5]})) == {"UA00002"}
+    index.remove_tag(BRASS)
+    assert BRASS not in [tag["id"] for tag in index.tags()]
+    assert index.filter({"Finish": [BRASS]}) == 0
+
+def test_links_to_unknown_tags_are_skipped():
+    index = FacetIndex()
+    index.load([{"id": BRASS, "name": "Brass", "category_id": 1}], [("UA00001", "A", BRASS), ("UA00002", "A", 99)])
+    assert index.counts(index.filter()) == {BRASS: 1}
+    assert index.listings(index.filter()) == {"UA00001", "UA00002"}
+
+def test_a_load_started_before_a_change_is_not_kept():
+    index = FacetIndex()
+    generation = index.generation
+    index.remove_listing("UA00001")
+    index.load([{"id": BRASS, "name": "Brass", "category_id": 1}], [("UA00001", "A", BRASS)], generation)
+    assert not index.loaded
+    index.load([{"id": BRASS, "name": "Brass", "category_id": 1}], [("UA00001", "A", BRASS)], index.generation)
+    assert index.loaded
+
+def test_changes_before_a_load_are_not_applied():
+    index = FacetIndex()
+    index.put_tag({"id": BRASS, "name": "Brass", "category_id": 1})
+    index.set_listing("UA00001", {"A": [BRASS]})
+    assert index.tags() == []
+    assert index.filter() == 0
+
+def test_clear_empties_the_index():
+    index = loaded()
+    index.clear()
+    assert not index.loaded
+    assert index.tags() == []
+    assert index.filter_listings({}) == set()
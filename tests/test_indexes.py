@@ -0,0 +1,208 @@
+import os
+import pytest
+from contextlib import contextmanager
+from api.database import Database, PygresSession
+
+# Checks that the Database read methods are served by index scans on a catalog of realistic size.
+# The catalog is generated inside one transaction that is rolled back at the end. Every read method
+# is run against that transaction with its queries swapped for EXPLAIN, with sequential scans priced out
+# so the plans show whether an index can serve each query rather than whether it wins at this size.
+# A method fails the check when its plans use no index at all, or when they still filter one of the
+# catalog tables with a sequential scan, which is what a missing index looks like. A sequential scan without a filter is the planner choosing
+# to hash join against the whole table, that is listed but allowed.
+# It migrates the database it is given and fills it with thousands of rows before rolling them back,
+# so it only runs when URBARCH_TEST_DATABASE names the env file of a throwaway database.
+#
+# USAGE:
+# URBARCH_TEST_DATABASE=./sessions/test-env.json python -m pytest tests/test_indexes.py   (from the project root)
+
+ENV_FILE = os.environ.get("URBARCH_TEST_DATABASE")
+pytestmark = pytest.mark.skipif(ENV_FILE is None, reason = "URBARCH_TEST_DATABASE does not name a throwaway database")
+
+PRODUCTS = 5000
+TAGS = 400
+STOCK = 2000
+SALVAGE = 2000
+CUSTOM = 2000
+
+# this stands in for a PygresSession while a read method runs,
+# it keeps the plan of each query instead of its rows
+class ExplainSession(PygresSession):
+    def __init__(self, connection):
+        super(ExplainSession, self).__init__(connection)
+        self.plans = []
+
+    def __call__(self, query: str, parameters = None):
+        super(ExplainSession, self).__call__("EXPLAIN (FORMAT JSON) " + query, parameters)
+        self.plans.append(self._cursor.fetchone()[0][0]["Plan"])
+
+    def execute(self, statement, parameters: tuple = ()):
+        if statement.name not in self._connection.prepared:
+            super(ExplainSession, self).__call__(f"PREPARE {statement.name} AS {statement.query}")
+            self._connection.prepared.add(statement.name)
+        self.__call__(f"EXECUTE {statement.name}({", ".join(["%s"] * len(parameters))});", parameters)
+
+    def fetch(self):
+        return []
+
+    # a failing query only undoes its own check
+    def rollback(self):
+        super(ExplainSession, self).__call__("ROLLBACK TO SAVEPOINT checking;")
+
+    def commit(self):
+        pass
+
+def seed(pygres):
+    pygres(f'''
+        INSERT INTO product_listing(id, name, description)
+        SELECT 'UA' || LPAD(i::TEXT, 5, '0'), 'Fixture ' || i, 'A cast brass fixture in the ' || (ARRAY['torch', 'loft', 'globe', 'bell'])[i % 4 + 1] || ' family'
+        FROM generate_series(1, {PRODUCTS}) AS i;
+    ''')
+    pygres('''
+        INSERT INTO product_variation(listing_id, extension, subname, featured, price, display, overview)
+        SELECT id, extension, 'Finish ' || extension || ' ' || substr(md5(id || extension), 1, 6), FALSE, 100, TRUE, '{}'
+        FROM product_listing, unnest(ARRAY['A', 'B', 'C']) AS extension;
+    ''')
+    pygres(f'''
+        INSERT INTO tag(name, category_id)
+        SELECT 'Tag ' || i, (SELECT MIN(id) FROM tag_category) + i % 8
+        FROM generate_series(1, {TAGS}) AS i;
+    ''')
+    pygres("INSERT INTO tag(name, category_id) SELECT 'Replacement', MIN(id) FROM tag_category;")
+    pygres(f'''
+        INSERT INTO product_variation__tag(listing_id, variation_extension, tag_id)
+        SELECT DISTINCT listing_id, extension, (SELECT MIN(id) FROM tag) + (hashtext(listing_id || extension || n) & 2147483647) % {TAGS + 1}
+        FROM product_variation, generate_series(1, 4) AS n;
+    ''')
+    pygres(f'''
+        INSERT INTO instock_listing(sale, price, listing_id, variation_extension)
+        SELECT FALSE, 100, 'UA' || LPAD((i % {PRODUCTS} + 1)::TEXT, 5, '0'), 'A'
+        FROM generate_series(1, {STOCK}) AS i;
+    ''')
+    pygres('''
+        INSERT INTO instock_item(listing_id, serial, display, overview)
+        SELECT id, serial, TRUE, '{}' FROM instock_listing, generate_series(1, 2) AS serial;
+    ''')
+    pygres(f'''
+        INSERT INTO instock_item__tag(listing_id, item_serial, tag_id)
+        SELECT listing_id, serial, (SELECT MIN(id) FROM tag) + listing_id % {TAGS} FROM instock_item;
+    ''')
+    pygres(f'''
+        INSERT INTO salvage_listing(id, name, description)
+        SELECT 'S' || LPAD(i::TEXT, 5, '0'), 'Salvage ' || i, 'A reclaimed mantel'
+        FROM generate_series(1, {SALVAGE}) AS i;
+    ''')
+    pygres('''
+        INSERT INTO salvage_item(listing_id, serial, price, display, overview)
+        SELECT id, serial, 100, TRUE, '{}' FROM salvage_listing, generate_series(1, 2) AS serial;
+    ''')
+    pygres(f'''
+        INSERT INTO salvage_item__tag(listing_id, item_serial, tag_id)
+        SELECT listing_id, serial, (SELECT MIN(id) FROM tag) + serial FROM salvage_item;
+    ''')
+    pygres(f'''
+        INSERT INTO custom_item(name, description, customer, display, listing_id, variation_extension)
+        SELECT 'Custom ' || i, 'A commissioned piece', 'Customer ' || i, TRUE, 'UA00001', 'A'
+        FROM generate_series(1, {CUSTOM}) AS i;
+    ''')
+    # rows inserted in bulk wait in the GIN pending lists, flush them the way autovacuum would
+    for index in ["product_listing_index", "product_variation_index", "salvage_listing_index", "custom_item_index", "tag_index",
+        "product_listing_trigram", "product_variation_trigram", "salvage_listing_trigram", "custom_item_trigram", "tag_trigram"]:
+        pygres(f"SELECT gin_clean_pending_list('{index}');")
+    for view in ["tag_facet_count", "product_summary"]:
+        pygres(f"REFRESH MATERIALIZED VIEW {view};")
+    pygres("ANALYZE;")
+
+# every node of a plan, depth first
+def nodes(plan):
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from nodes(child)
+
+# tag and tag_category stay a few pages long, reading them whole is the right plan
+CATALOG = ["product_listing", "product_variation", "product_variation__tag", "instock_listing", "instock_item", "instock_item__tag",
+    "salvage_listing", "salvage_item", "salvage_item__tag", "custom_item", "custom_item__tag", "product_summary"]
+
+# the lookups by key, the searches and the pages have to use an index, the unfiltered lists read every row by design,
+# the arguments are made from the ids the seeded rows were given
+CHECKS = [
+    ("get_tag", lambda seeded: (seeded["tag"],)),
+    ("get_tag_list", lambda seeded: ("7",)),
+    ("get_filter_list", lambda seeded: ("products", "4217", {"Style": [seeded["tag"]]})),
+    ("get_replacement", lambda seeded: ("UA00042", "B")),
+    ("get_replacement_list", lambda seeded: ("4217",)),
+    ("get_product", lambda seeded: ("UA00042",)),
+    ("get_product_list", lambda seeded: ("4217",)),
+    ("get_product_list", lambda seeded: ("", {"Style": [seeded["tag"]]})),
+    ("get_tag_list", lambda seeded: ("Tga 7", True)),
+    ("get_product_list", lambda seeded: ("Fixtrue 4217", {}, True)),
+    ("get_replacement_list", lambda seeded: ("UA0042", True)),
+    ("get_stock", lambda seeded: (seeded["stock"],)),
+    ("get_salvage", lambda seeded: ("S00042",)),
+    ("get_custom", lambda seeded: (seeded["custom"],)),
+    ("get_product_page", lambda seeded: (Database._encode_cursor(["UA02500"]),)),
+    ("get_product_page", lambda seeded: (Database._encode_cursor(["UA02500"]), 50, "", {"Style": [seeded["tag"]]})),
+    ("get_tag_page", lambda seeded: (Database._encode_cursor(["Tag 250", 0]),)),
+    ("get_stock_page", lambda seeded: (Database._encode_cursor([seeded["stock"] + 1000]),)),
+    ("get_salvage_page", lambda seeded: (Database._encode_cursor(["S01000"]),)),
+    ("get_custom_page", lambda seeded: (Database._encode_cursor([seeded["custom"] + 1000]),))
+]
+
+# seeds the catalog once for the module and points the read methods at an EXPLAIN session on top of it
+@pytest.fixture(scope = "module")
+def catalog():
+    Database.connect(ENV_FILE)
+    Database.initialize()
+    with Database._pygres.session() as pygres:
+        seed(pygres)
+        pygres("SELECT id FROM tag WHERE name = 'Tag 7';")
+        tag = pygres.fetch()[0][0]
+        pygres("SELECT MIN(id) FROM instock_listing;")
+        stock = pygres.fetch()[0][0]
+        pygres("SELECT MIN(id) FROM custom_item;")
+        custom = pygres.fetch()[0][0]
+
+        # the planner reads a few percent of a table faster without its index, that is not what is checked
+        pygres("SET LOCAL enable_seqscan = off;")
+        explain = ExplainSession(pygres._connection)
+
+        @contextmanager
+        def seeded(cls):
+            yield pygres
+
+        @contextmanager
+        def explained(cls):
+            yield explain
+
+        # the filters are worked out in memory, the facet index is read from the seeded catalog before the checks
+        session = Database._session
+        Database._session = classmethod(seeded)
+        try:
+            Database.get_product_list("", {"Style": [tag]})
+            Database._session = classmethod(explained)
+            yield pygres, explain, {"tag": tag, "stock": stock, "custom": custom}
+        finally:
+            Database._session = session
+            pygres.rollback()
+            # nothing read from the rolled back rows outlives them
+            Database._entities.invalidate()
+            Database._tags.clear()
+            Database._facets.clear()
+    Database.disconnect()
+
+@pytest.mark.parametrize("method, arguments", CHECKS, ids = [f"{method}-{index}" for index, (method, _) in enumerate(CHECKS)])
+def test_read_method_uses_index_scans(catalog, method, arguments):
+    pygres, explain, seeded = catalog
+    explain.plans = []
+    pygres("SAVEPOINT checking;")
+    try:
+        getattr(Database, method)(*arguments(seeded))
+    except IndexError:
+        # the lookups index into their (empty) rows, by then the plan is already kept
+        pass
+    scans = [node for plan in explain.plans for node in nodes(plan) if "Relation Name" in node]
+    indexed = [node for plan in explain.plans for node in nodes(plan) if "Index Name" in node]
+    filtered = [node for node in scans if node["Node Type"] == "Seq Scan" and node["Relation Name"] in CATALOG and "Filter" in node]
+    plan = "\n".join([f"{node["Node Type"]} on {node["Relation Name"]}{" filtering " + node["Filter"] if "Filter" in node else ""}" for node in scans])
+    assert len(indexed) != 0, plan
+    assert len(filtered) == 0, plan
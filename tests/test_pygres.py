@@ -0,0 +1,137 @@
+import os
+import json
+import itertools
+import pytest
+import psycopg2 as postgres
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+from api.database import Pygres
+
+# Runs Pygres over psycopg2's own pool, with psycopg2.connect handing out stand-in connections the tests
+# can drop the way a server restart or an idle timeout would. The live test does the same to real
+# connections, so it only runs when URBARCH_TEST_DATABASE names the env file of a throwaway database.
+#
+# USAGE:
+# python -m pytest tests   (from the project root)
+# URBARCH_TEST_DATABASE=./sessions/test-env.json python -m pytest tests/test_pygres.py
+
+ENV_FILE = os.environ.get("URBARCH_TEST_DATABASE")
+
+class DroppableCursor:
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def execute(self, query, parameters = None):
+        if self.connection.closed:
+            raise postgres.InterfaceError("connection already closed")
+        if self.connection.dropped:
+            # psycopg2 marks a connection whose server went away as closed
+            self.connection.closed = 2
+            raise postgres.OperationalError("server closed the connection unexpectedly")
+
+    def close(self):
+        pass
+
+class DroppableConnection:
+    pids = itertools.count(1000)
+
+    def __init__(self):
+        self.pid = next(DroppableConnection.pids)
+        self.prepared = set()
+        self.closed = 0
+        self.dropped = False
+        self.info = self
+
+    @property
+    def transaction_status(self):
+        return TRANSACTION_STATUS_IDLE
+
+    def cursor(self):
+        return DroppableCursor(self)
+
+    def get_backend_pid(self):
+        if self.closed:
+            raise postgres.InterfaceError("connection already closed")
+        return self.pid
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.closed = 1
+
+@pytest.fixture
+def connections(monkeypatch):
+    connections = []
+    def connect(*args, **kwargs):
+        connections.append(DroppableConnection())
+        return connections[-1]
+    monkeypatch.setattr(postgres, "connect", connect)
+    return connections
+
+def pygres(**pool):
+    return Pygres("catalog", "user", "password", "localhost", "5432", "disable", **pool)
+
+def checked_out(pool):
+    with pool.session() as session:
+        return session._connection
+
+def test_a_dropped_connection_is_swapped_for_a_fresh_one(connections):
+    pool = pygres(max_connections = 2)
+    for kill in range(2):
+        dropped = checked_out(pool)
+        dropped.dropped = True
+        connection = checked_out(pool)
+        assert connection is not dropped and not connection.closed
+        assert dropped.closed
+        assert dropped.pid not in pool._pids
+    # the dropped connections gave their slots back, the pool never runs dry
+    for _ in range(10):
+        with pool.session() as first, pool.session() as second:
+            assert first._connection is not second._connection
+
+@pytest.mark.skipif(ENV_FILE is None, reason = "URBARCH_TEST_DATABASE does not name a throwaway database")
+def test_a_terminated_backend_is_swapped_for_a_fresh_one():
+    env = json.load(open(ENV_FILE, 'r'))
+    env.pop("pool", None)
+    env.pop("cache", None)
+    pool = Pygres(*env.values(), max_connections = 2)
+    try:
+        for kill in range(2):
+            pid = checked_out(pool).pid
+            killer = postgres.connect(pool._connection_string)
+            killer.autocommit = True
+            with killer.cursor() as cursor:
+                # waits until the backend is gone
+                cursor.execute("SELECT pg_terminate_backend(%s, 5000);", (pid,))
+            killer.close()
+            with pool.session() as session:
+                session("SELECT 1;")
+                assert session._connection.pid != pid
+        for _ in range(10):
+            with pool.session() as first, pool.session() as second:
+                first("SELECT 1;")
+                second("SELECT 1;")
+    finally:
+        pool.close()
+
+def test_every_pooled_connection_is_kept_open(connections):
+    pool = pygres(max_connections = 4)
+    for _ in range(20):
+        with pool.session(), pool.session(), pool.session(), pool.session():
+            pass
+    assert len(connections) == 4
+    assert not any(connection.closed for connection in connections)
+    assert pool._pids == {connection.pid for connection in connections}
+
+def test_a_connection_the_pool_closes_is_forgotten(connections):
+    pool = pygres(min_connections = 1, max_connections = 2)
+    with pool.session() as first, pool.session() as second:
+        pids = {first._connection.pid, second._connection.pid}
+    assert pool._pids < pids
+    assert pool._pids == {connection.pid for connection in connections if not connection.closed}
@@ -0,0 +1,73 @@
+from api.querybuilder import Statement, QueryBuilder
+
+# USAGE:
+# python -m pytest tests   (from the project root)
+
+# the compiled shapes are kept for good, so every test names its builders after itself
+
+def sql(statement):
+    return " ".join(statement.query.split())
+
+def test_compile_numbers_the_parameters_in_the_order_they_appear():
+    query = QueryBuilder("test_numbers").select("SELECT id, name FROM tag").where("name = %(name)s", name = "Brass").where("id > %(id)s", id = 4)
+    statement, values = query.compile()
+    assert isinstance(statement, Statement)
+    assert sql(statement) == "SELECT * FROM (SELECT id, name FROM tag) AS results WHERE name = $1 AND id > $2"
+    assert values == ("Brass", 4)
+
+def test_a_parameter_used_twice_is_bound_once():
+    statement, values = QueryBuilder("test_twice").select("SELECT id FROM tag").where("(id = %(id)s OR category_id = %(id)s)", id = 7).compile()
+    assert "(id = $1 OR category_id = $1)" in sql(statement)
+    assert values == (7,)
+
+def test_double_percent_is_a_plain_percent():
+    statement, values = QueryBuilder("test_percent").select("SELECT id FROM tag WHERE name LIKE 'Br%%'").compile()
+    assert "LIKE 'Br%'" in sql(statement)
+    assert values == ()
+
+def test_the_same_shape_compiles_once():
+    first, first_values = QueryBuilder("test_shape").select("SELECT id FROM tag").where("id = %(id)s", id = 1).compile()
+    second, second_values = QueryBuilder("test_shape").select("SELECT id FROM tag").where("id = %(id)s", id = 2).compile()
+    assert first is second
+    assert (first_values, second_values) == ((1,), (2,))
+    assert first in QueryBuilder.statements()
+
+def test_another_shape_is_another_statement():
+    plain, _ = QueryBuilder("test_shapes").select("SELECT id FROM tag").compile()
+    ordered, _ = QueryBuilder("test_shapes").select("SELECT id FROM tag").order_by("id").compile()
+    assert plain is not ordered
+    assert plain.name != ordered.name
+    assert plain.name.startswith("test_shapes_") and ordered.name.startswith("test_shapes_")
+
+def test_a_none_limit_is_bound_like_any_limit():
+    statement, values = QueryBuilder("test_limit").select("SELECT id FROM tag").order_by("id").limit(None).compile()
+    assert sql(statement).endswith("ORDER BY id LIMIT $1")
+    assert values == (None,)
+    same, values = QueryBuilder("test_limit").select("SELECT id FROM tag").order_by("id").limit(20).compile()
+    assert same is statement
+    assert values == (20,)
+
+def test_after_compares_the_whole_key():
+    query = QueryBuilder("test_after").select("SELECT id, name FROM tag").after(["name", "id"], ["Loft", 12]).order_by("name", "id").limit(21)
+    statement, values = query.compile()
+    assert sql(statement) == "SELECT * FROM (SELECT id, name FROM tag) AS results WHERE (name, id) > ($1, $2) ORDER BY name, id LIMIT $3"
+    assert values == ("Loft", 12, 21)
+
+def test_with_queries_and_composed_selects():
+    query = QueryBuilder("test_compose")
+    query.with_query("search_filtered", "SELECT id, 1 AS rank FROM tag WHERE index @@ to_tsquery(%(search)s)", search = "'loft':*")
+    query.select_from("tag", "tag.id AS id", "tag.name AS name")
+    query.column("search_filtered.rank AS rank").join("INNER JOIN search_filtered USING(id)")
+    statement, values = query.order_by("rank DESC").compile()
+    assert sql(statement) == (
+        "WITH search_filtered AS (SELECT id, 1 AS rank FROM tag WHERE index @@ to_tsquery($1)) "
+        "SELECT * FROM (SELECT tag.id AS id, tag.name AS name, search_filtered.rank AS rank FROM tag INNER JOIN search_filtered USING(id)) AS results "
+        "ORDER BY rank DESC"
+    )
+    assert values == ("'loft':*",)
+
+def test_an_added_column_or_join_is_another_shape():
+    plain, _ = QueryBuilder("test_columns").select_from("tag", "tag.id AS id").compile()
+    wider, _ = QueryBuilder("test_columns").select_from("tag", "tag.id AS id").column("tag.name AS name").compile()
+    joined, _ = QueryBuilder("test_columns").select_from("tag", "tag.id AS id").join("INNER JOIN tag_category ON tag.category_id = tag_category.id").compile()
+    assert len({plain.name, wider.name, joined.name}) == 3
@@ -0,0 +1,59 @@
+import os
+import re
+import json
+import pytest
+import psycopg2 as postgres
+from api.database import Database
+
+# The stems search_stems works out have to be the ones the database searches for. The live test asks
+# to_tsquery for them, so it only runs when URBARCH_TEST_DATABASE names the env file of a throwaway database.
+#
+# USAGE:
+# python -m pytest tests   (from the project root)
+# URBARCH_TEST_DATABASE=./sessions/test-env.json python -m pytest tests/test_searchstems.py
+
+ENV_FILE = os.environ.get("URBARCH_TEST_DATABASE")
+
+SEARCHES = ["lady", "ladyship", "Hoping lamps", "the lamp", "th lamp", "UA00042 sconces", "lamps3", "globes of brass"]
+# the few words the two stemmers disagree on, the stem here is the longer one, so a result is only ever missed here
+# (and the database is asked) and never kept when the database would not find it
+LONGER = ["realizers", "cognizer"]
+
+def test_words_are_stemmed_like_the_database_does():
+    assert Database.search_stems("lady") == ["ladi"]
+    assert Database.search_stems("Hoping Lamps") == ["hope", "lamp"]
+
+def test_a_longer_word_can_have_a_stem_the_shorter_one_does_not_start():
+    assert not Database.search_stems("ladyship")[0].startswith(Database.search_stems("lady")[0])
+
+def test_stop_words_are_dropped():
+    assert Database.search_stems("the lamp") == [None, "lamp"]
+    assert Database.search_stems("th lamp") == ["th", "lamp"]
+
+def test_words_with_digits_are_kept_as_they_are():
+    assert Database.search_stems("UA00042s lamps3") == ["ua00042s", "lamps3"]
+
+def test_words_the_database_splits_differently_are_not_stemmed_here():
+    assert Database.search_stems("brass_lamp") is None
+    assert Database.search_stems("cafés") is None
+
+def database_stems(search):
+    env = json.load(open(ENV_FILE, 'r'))
+    connection = postgres.connect(f"postgresql://{env["user"]}:{env["password"]}@{env["host"]}:{env["port"]}/{env["database"]}?sslmode={env["ssl_mode"]}")
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT to_tsquery('english', %(search)s)::TEXT;", Database._search_parameters(search))
+            return re.findall(r"'([^']*)':\*", cursor.fetchone()[0])
+    finally:
+        connection.close()
+
+@pytest.mark.skipif(ENV_FILE is None, reason = "URBARCH_TEST_DATABASE does not name a throwaway database")
+@pytest.mark.parametrize("search", SEARCHES)
+def test_the_stems_are_the_ones_the_database_searches_for(search):
+    assert database_stems(search) == [stem for stem in Database.search_stems(search) if stem is not None]
+
+@pytest.mark.skipif(ENV_FILE is None, reason = "URBARCH_TEST_DATABASE does not name a throwaway database")
+@pytest.mark.parametrize("search", LONGER)
+def test_where_the_stemmers_differ_the_stem_here_is_longer(search):
+    [database], [here] = database_stems(search), Database.search_stems(search)
+    assert here != database and here.startswith(database)
@@ -0,0 +1,60 @@
+from api.tagindex import TagIndex
+
+# USAGE:
+# python -m pytest tests   (from the project root)
+
+def tag(id, name, uses = 0, category = "Style"):
+    return {"id": id, "name": name, "category": category, "uses": uses}
+
+def loaded(*tags):
+    index = TagIndex()
+    index.load(list(tags))
+    return index
+
+def ids(results):
+    return [result["id"] for result in results]
+
+def test_search_matches_every_word_by_prefix():
+    index = loaded(tag(1, "Wall Sconce"), tag(2, "Wall Lamp"), tag(3, "Sconce Arm"))
+    assert sorted(ids(index.search("wall"))) == [1, 2]
+    assert ids(index.search("wal sco")) == [1]
+    assert ids(index.search("lamp arm")) == []
+
+def test_search_ranks_the_most_used_first():
+    index = loaded(tag(1, "Brass", uses = 2), tag(2, "Bronze", uses = 9), tag(3, "Black", uses = 2))
+    assert ids(index.search("b")) == [2, 3, 1]
+    assert ids(index.search("b", limit = 2)) == [2, 3]
+
+def test_tags_without_a_name_are_only_listed_by_the_empty_search():
+    index = loaded(tag(1, None), tag(2, "Batch"), tag(3, None, uses = 4))
+    assert ids(index.search("Batch")) == [2]
+    assert ids(index.search("")) == [3, 1, 2]
+
+def test_put_and_remove_a_tag_without_a_name():
+    index = loaded(tag(1, "Batch"))
+    index.put({"id": 2, "name": None, "category": "Style"})
+    assert ids(index.search("batch")) == [1]
+    index.put({"id": 2, "name": "Batched", "category": "Style"})
+    assert sorted(ids(index.search("batch"))) == [1, 2]
+    index.put({"id": 1, "name": None, "category": "Style"})
+    assert ids(index.search("batch")) == [2]
+    index.remove(1)
+    assert ids(index.search("")) == [2]
+
+def test_renamed_tag_keeps_its_uses():
+    index = loaded(tag(1, "Brass", uses = 5), tag(2, "Bronze", uses = 1))
+    index.put({"id": 1, "name": "Brushed Brass", "category": "Finish"})
+    assert ids(index.search("br")) == [1, 2]
+    assert index.search("brushed")[0]["category"] == "Finish"
+
+def test_a_load_started_before_a_change_is_not_kept():
+    index = TagIndex()
+    generation = index.generation
+    index.clear()
+    index.load([tag(1, "Brass")], generation)
+    assert not index.loaded
+
+def test_set_uses_reranks_the_tags():
+    index = loaded(tag(1, "Brass", uses = 5), tag(2, "Bronze", uses = 1), tag(3, "Black", uses = 3))
+    index.set_uses({2: 7, 3: 1})
+    assert ids(index.search("b")) == [2, 3, 1]
@@ -0,0 +1,62 @@
+import threading
+from api.database import Database
+from api.tagindex import TagIndex
+
+# USAGE:
+# python -m pytest tests   (from the project root)
+
+# a catalog_data listener with the notifications that already arrived
+class Listener:
+    def __init__(self, *tables):
+        self.notifies = [Notification(table) for table in tables]
+
+    def poll(self):
+        pass
+
+class Notification:
+    def __init__(self, payload):
+        self.payload = payload
+        self.pid = 1
+
+class Pool:
+    def sent(self, notification):
+        return False
+
+def loaded(monkeypatch, listener):
+    index = TagIndex()
+    index.load([{"id": 1, "name": "Brass", "category": "Finish", "uses": 0}])
+    monkeypatch.setattr(Database, "_tags", index)
+    monkeypatch.setattr(Database, "_pygres", Pool())
+    monkeypatch.setattr(Database, "_catalog_listener", listener)
+    return index
+
+def test_a_loaded_index_answers_on_the_spot(monkeypatch):
+    loaded(monkeypatch, Listener())
+    assert Database.search_loaded_tags("bra") == [{"id": 1, "name": "Brass", "category": "Finish"}]
+
+def test_an_index_that_is_not_loaded_does_not_answer(monkeypatch):
+    loaded(monkeypatch, Listener()).clear()
+    assert Database.search_loaded_tags("bra") is None
+
+def test_another_clients_write_drops_the_index_before_it_answers(monkeypatch):
+    index = loaded(monkeypatch, Listener("tag"))
+    assert Database.search_loaded_tags("bra") is None
+    assert not index.loaded
+
+def test_it_does_not_wait_on_a_worker_polling(monkeypatch):
+    loaded(monkeypatch, Listener())
+    polling = threading.Event()
+    done = threading.Event()
+    def worker():
+        with Database._catalog_lock:
+            polling.set()
+            done.wait()
+    thread = threading.Thread(target = worker)
+    thread.start()
+    polling.wait()
+    try:
+        assert Database.search_loaded_tags("bra") is None
+    finally:
+        done.set()
+        thread.join()
+    assert Database.search_loaded_tags("bra") is not None
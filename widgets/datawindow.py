@@ -1,9 +1,14 @@
+import asynckivy
 from kivy.core.window import Window
-from kivymd.uix.scrollview import MDScrollView
+from kivy.metrics import dp
+from kivy.uix.recycleview import RecycleView
+from kivy.uix.recycleview.views import RecycleDataViewBehavior
+from kivy.uix.recycleboxlayout import RecycleBoxLayout
 from kivymd.uix.boxlayout import MDBoxLayout
 from kivymd.uix.gridlayout import MDGridLayout
 from kivymd.uix.label import MDLabel
 from kivymd.uix.button import MDIconButton
+from kivymd.uix.progressindicator import MDCircularProgressIndicator
 
 class DataHeader(MDGridLayout):
     def __init__(self, *args, columns: list, **kwargs):
@@ -19,28 +24,50 @@ class DataHeader(MDGridLayout):
         self.adaptive_height = True
         self.spacing = "5dp"
 
-class DataEntry(MDGridLayout):
-    def __init__(self, entry: dict, *args, on_press = None, on_delete = None, **kwargs):
-        super(DataEntry, self).__init__(**kwargs)
+# One row of the table. The RecycleView only builds as many of these as fit on screen
+# and hands them a different row (through refresh_view_attrs) as the list scrolls,
+# so the widget count stays the same no matter how many rows there are.
+class DataEntry(RecycleDataViewBehavior, MDGridLayout):
+    def __init__(self, *args, **kwargs):
+        super(DataEntry, self).__init__(*args, **kwargs)
 
-        self.data = entry
+        self.data = {}
+        self.__row = None
+        self.__labels = []
 
-        self.cols = len(entry) + 2
-        for text in self.data.values():
-            self.add_widget(MDLabel(text = str(text), md_bg_color = self.theme_cls.surfaceContainerLowColor, padding = "10dp"))
-        edit = MDIconButton(icon = "pencil")
-        edit.bind(on_release = lambda *args: on_press(self.data))
-        self.add_widget(edit)
-        delete = MDIconButton(icon = "window-close")
-        delete.bind(on_release = lambda *args: on_delete(self.data))
-        self.add_widget(delete)
+        # the callbacks are looked up on the row when pressed, the window can swap them without a refresh
+        self.__edit = MDIconButton(icon = "pencil")
+        self.__edit.bind(on_release = lambda *args: self.__row["on_press"](self.data))
+        self.__delete = MDIconButton(icon = "window-close")
+        self.__delete.bind(on_release = lambda *args: self.__row["on_delete"](self.data))
 
-        self.adaptive_height = True
         self.spacing = "5dp"
 
+    def refresh_view_attrs(self, recycle_view, index, data):
+        self.__row = data
+        self.data = data["entry"]
+
+        # the labels are only built the first time, every row of a window has the same columns
+        if len(self.__labels) != len(self.data):
+            self.clear_widgets()
+            self.__labels = [MDLabel(md_bg_color = self.theme_cls.surfaceContainerLowColor, padding = "10dp", shorten = True) for _ in self.data]
+            for label in self.__labels:
+                self.add_widget(label)
+            self.add_widget(self.__edit)
+            self.add_widget(self.__delete)
+            self.cols = len(self.data) + 2
+
+        for label, text in zip(self.__labels, self.data.values()):
+            label.text = str(text)
+
 class DataWindow(MDBoxLayout):
     def __init__(self, *args, **kwargs):
         self.__header = None
+        self.__page_task = None
+        self.__cursor = None
+        self.__has_more = False
+        self.__on_data_press = None
+        self.__on_delete_item = None
         super(DataWindow, self).__init__(*args, **kwargs)
 
         self.adaptive_height = True
@@ -52,25 +79,168 @@ class DataWindow(MDBoxLayout):
         Window.bind(on_resize = self._on_window_resize)
 
     def _on_window_resize(self, window, width, height):
-        self.__layout.parent.height = height - (1600 - 1300)
+        self.__table.height = height - (1600 - 1300)
 
     def add_widget(self, widget):
         if isinstance(widget, DataHeader):
             self.__header = widget
             super(DataWindow, self).add_widget(widget)
-            self.__layout = MDBoxLayout(
+
+            rows = RecycleBoxLayout(
                 orientation = "vertical",
-                adaptive_height = True,
+                default_size = (None, dp(48)),
+                default_size_hint = (1, None),
+                size_hint_y = None,
                 spacing = "5dp"
             )
-            return super(DataWindow, self).add_widget(MDScrollView(
-                self.__layout,
-                size_hint_y = None
-            )) 
+            rows.bind(minimum_height = rows.setter("height"))
+            self.__table = RecycleView(size_hint_y = None, bar_width = "5dp")
+            self.__table.viewclass = DataEntry
+            self.__table.add_widget(rows)
+            self.__table.bind(scroll_y = self._on_scroll)
+            super(DataWindow, self).add_widget(self.__table)
+
+            # sits under the rows and only takes up space while something is being fetched
+            self.__indicator = MDCircularProgressIndicator(
+                size_hint = (None, None),
+                size = ("48dp", "0dp"),
+                opacity = 0,
+                pos_hint = {"center_x": 0.5}
+            )
+            return super(DataWindow, self).add_widget(self.__indicator)
+
+    def __show_indicator(self, shown: bool):
+        self.__indicator.opacity = 1 if shown else 0
+        self.__indicator.height = dp(48) if shown else 0
+
+    # turns entries into the data the RecycleView hands to its DataEntry widgets,
+    # keeping only the header's columns, in the header's order
+    def __rows(self, data: list[dict], on_data_press, on_delete_item):
+        return [{
+            "entry": {column: entry[column] for column in self.__header.columns},
+            "on_press": on_data_press,
+            "on_delete": on_delete_item
+        } for entry in data]
+
+    # shown while the rows are being fetched in the background
+    def loading(self):
+        self.__table.data = []
+        self.__show_indicator(True)
+
+    # Shows the first page of rows and fetches the next one whenever the list is scrolled to its end.
+    # fetch_page is awaited with the cursor of the page before (None for the first one) and returns
+    # {"results": [...], "cursor": ...}, a None cursor meaning there are no more pages.
+    # Called again while rows are shown (coming back to a screen, after a save), it fetches as many
+    # rows as are loaded and patches them in place instead of starting over from an empty list.
+    #
+    # USAGE:
+    # data_window.paginate(AsyncDatabase.get_tag_page, on_data_press = edit, on_delete_item = delete)
+    def paginate(self, fetch_page, on_data_press = None, on_delete_item = None):
+        if self.__page_task is not None:
+            self.__page_task.cancel()
+        self.__fetch_page = fetch_page
+        self.__on_data_press = on_data_press
+        self.__on_delete_item = on_delete_item
+        self.__has_more = False
+        self.__page_task = asynckivy.start(self.__reload(len(self.__table.data)))
+
+    async def __reload(self, shown: int):
+        self.__show_indicator(True)
+        entries = []
+        cursor = None
+        while True:
+            page = await self.__fetch_page(cursor)
+            entries.extend(page["results"])
+            cursor = page["cursor"]
+            if cursor is None or len(entries) >= shown:
+                break
+        self.__show_indicator(False)
+
+        self.__patch(self.__rows(entries, self.__on_data_press, self.__on_delete_item))
+        self.__cursor = cursor
+        self.__has_more = cursor is not None
+        await self.__fill()
+
+    async def __load_page(self):
+        self.__has_more = False
+        self.__show_indicator(True)
+        page = await self.__fetch_page(self.__cursor)
+        self.__show_indicator(False)
+
+        self.__table.data.extend(self.__rows(page["results"], self.__on_data_press, self.__on_delete_item))
+        self.__cursor = page["cursor"]
+        self.__has_more = self.__cursor is not None
+        await self.__fill()
+
+    # a page that does not fill the window can not be scrolled, so the next one is fetched right away
+    # (the layout only takes its new height on the next frame)
+    async def __fill(self):
+        await asynckivy.sleep(0)
+        if self.__has_more and self.__table.layout_manager.height < self.__table.height:
+            self.__page_task = asynckivy.start(self.__load_page())
+
+    def _on_scroll(self, recycle_view, scroll_y):
+        # scroll_y goes from 1 at the top of the list to 0 at its end
+        if self.__has_more and scroll_y <= 0.05:
+            self.__page_task = asynckivy.start(self.__load_page())
+
+    # Brings the shown rows in line with the new ones, keyed by their "id" column: rows that are gone are removed,
+    # rows that moved are taken out and put back where they belong, new rows are inserted, and rows whose
+    # values changed are relabelled. Every change goes through the RecycleView's data list one index at a time,
+    # so only the views of the rows that changed are refreshed.
+    def __patch(self, new_rows: list[dict]):
+        rows = self.__table.data
+        ids = {row["entry"]["id"] for row in new_rows}
+        for index in reversed(range(len(rows))):
+            if rows[index]["entry"]["id"] not in ids:
+                del rows[index]
+
+        for index, row in enumerate(new_rows):
+            if index < len(rows) and rows[index]["entry"]["id"] == row["entry"]["id"]:
+                if rows[index]["entry"] != row["entry"]:
+                    rows[index] = row
+                else:
+                    # same labels, only the callbacks can differ and the views read those when pressed
+                    rows[index].update(row)
+                continue
+
+            moved = next((later for later in range(index + 1, len(rows)) if rows[later]["entry"]["id"] == row["entry"]["id"]), None)
+            if moved is not None:
+                del rows[moved]
+            rows.insert(index, row)
+
+        if len(rows) > len(new_rows):
+            del rows[len(new_rows):]
 
     def update(self, data: list[dict], on_data_press = None, on_delete_item = None):
-        self.__layout.clear_widgets()
-        if len(data) > 0:
-            data = [{column: entry[column] for column in self.__header.columns} for entry in data]
-            for entry in data:
-                self.__layout.add_widget(DataEntry(entry, on_press = on_data_press, on_delete = on_delete_item))
+        if self.__page_task is not None:
+            self.__page_task.cancel()
+        self.__on_data_press = on_data_press
+        self.__on_delete_item = on_delete_item
+        self.__has_more = False
+        self.__show_indicator(False)
+        self.__patch(self.__rows(data, on_data_press, on_delete_item))
+
+    # Local patches, for after a Database.update_* or delete_* that went through:
+    # the row with the entry's id is relabelled (or added to the end when there is none),
+    # or removed, without fetching the list again.
+    #
+    # USAGE:
+    # if await AsyncDatabase.delete_tag(id) is None:
+    #     data_window.remove(id)
+    def patch(self, entry: dict):
+        entry = {column: entry[column] for column in self.__header.columns}
+        rows = self.__table.data
+        for index, row in enumerate(rows):
+            if row["entry"]["id"] == entry["id"]:
+                if row["entry"] != entry:
+                    rows[index] = dict(row, entry = entry)
+                return
+        rows.append({"entry": entry, "on_press": self.__on_data_press, "on_delete": self.__on_delete_item})
+
+    def remove(self, id):
+        rows = self.__table.data
+        for index, row in enumerate(rows):
+            if row["entry"]["id"] == id:
+                del rows[index]
+                return
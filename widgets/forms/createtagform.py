@@ -1,9 +1,10 @@
+import asynckivy
 from kivymd.uix.label import MDLabel
 from kivymd.uix.textfield import MDTextFieldHintText, MDTextFieldHelperText
 from kivymd.uix.button import MDIconButton
 from kivymd.uix.dialog import MDDialog, MDDialogHeadlineText, MDDialogSupportingText, MDDialogContentContainer, MDDialogButtonContainer
 from widgets.forms.form import FormStructure, Form, TextInput, DropdownInput
-from api.database import Database
+from api.asyncdatabase import AsyncDatabase
 
 class CreateTagForm(MDDialog, FormStructure):
     def __init__(self, *args, on_submit = None, **kwargs):
@@ -12,20 +13,9 @@ class CreateTagForm(MDDialog, FormStructure):
         self.__old_tag_id = None
         self.__on_submit = on_submit
 
-        categories = [{
-            "value": category["id"],
-            "text": category["name"]
-        } for category in Database.get_tag_category_list()]
-
-        self.__form = Form(
-            TextInput(
-                MDTextFieldHintText(text = "Tag Name"),
-                MDTextFieldHelperText(text = "This is the name displayed in tag lists."),
-                form_id = "name"),
-            DropdownInput(form_id = "category_id", data = categories),
-            orientation = "vertical",
-            adaptive_height = True
-        )
+        # the category dropdown is filled from the database, so the form is made the first time it opens
+        self.__form = None
+        self.__content = MDDialogContentContainer()
 
         cancel = MDIconButton(icon = "window-close")
         cancel.bind(on_press = lambda *args: self.dismiss())
@@ -34,31 +24,67 @@ class CreateTagForm(MDDialog, FormStructure):
         complete.bind(on_press = lambda *args: self.submit())
 
         self.add_widget(MDDialogHeadlineText(text = "Tag Information"))
-        self.add_widget(MDDialogContentContainer(
-            self.__form
-        ))
+        self.add_widget(self.__content)
         self.add_widget(MDDialogButtonContainer(
             MDLabel(text = " "),
             cancel,
             complete
         ))
 
+    async def __build(self):
+        categories = [{
+            "value": category["id"],
+            "text": category["name"]
+        } for category in await AsyncDatabase.get_tag_category_list()]
+        # another open may have made the form while the categories loaded
+        if self.__form is not None:
+            return True
+        if len(categories) == 0:
+            return False
+
+        self.__form = Form(
+            TextInput(
+                MDTextFieldHintText(text = "Tag Name"),
+                MDTextFieldHelperText(text = "This is the name displayed in tag lists."),
+                form_id = "name"),
+            DropdownInput(form_id = "category_id", data = categories),
+            orientation = "vertical",
+            adaptive_height = True
+        )
+        self.__content.add_widget(self.__form)
+        return True
+
     def default(self):
+        asynckivy.start(self.__default())
+
+    async def __default(self):
+        if self.__form is None and not await self.__build():
+            return
         self.__form.default()
         self.open()
 
     def prefill(self, id):
         self.__old_tag_id = id
-        self.__form.prefill(Database.get_tag(id))
+        asynckivy.start(self.__load(id))
+
+    async def __load(self, id):
+        if self.__form is None and not await self.__build():
+            return
+        self.__form.prefill(await AsyncDatabase.get_tag(id))
         self.open()
 
     def submit(self):
-        if self.__old_tag_id:
-            Database.update_tag(self.__old_tag_id, self.__form.submit()[1])
+        asynckivy.start(self.__save(self.__form.submit()[1]))
+
+    # on_submit is called with the id of the tag that was edited (None for a new one) and the saved data,
+    # and only when the save went through
+    async def __save(self, data):
+        self.dismiss()
+        id = self.__old_tag_id
+        if id:
+            error = await AsyncDatabase.update_tag(id, data)
         else:
-            print(self.__form.submit()[1])
-            Database.create_tag(self.__form.submit()[1])
+            error = await AsyncDatabase.create_tag(data)
         self.__old_tag_id = None
-        if self.__on_submit:
-            self.__on_submit()
-        self.dismiss()
\ No newline at end of file
+        if self.__on_submit and error is None:
+            self.__on_submit(id, data)
\ No newline at end of file
@@ -1,10 +1,11 @@
+import asynckivy
 from kivymd.uix.screen import MDScreen
 from kivymd.theming import ThemableBehavior
 from kivymd.uix.scrollview import MDScrollView
 from kivymd.uix.boxlayout import MDBoxLayout
 from kivymd.uix.label import MDLabel
 from kivymd.uix.button import MDIconButton
-from api.database import Database
+from api.asyncdatabase import AsyncDatabase
 from kivymd.uix.textfield import MDTextFieldHintText, MDTextFieldHelperText, MDTextFieldLeadingIcon
 from widgets.forms.form import FormStructure, Form, TextInput, SwitchInput, CheckboxInput, CheckGroup
 from widgets.forms.overviewforms import TagForm
@@ -94,15 +95,24 @@ class CustomForm(FormStructure, MDBoxLayout):
 
     def prefill(self, id):
         self.__old_custom_id = id
-        self.__form.prefill(Database.get_custom(self.__old_custom_id))
+        asynckivy.start(self.__load(id))
+
+    async def __load(self, id):
+        # the form stays disabled while the custom is on its way
+        self.disabled = True
+        self.__form.prefill(await AsyncDatabase.get_custom(id))
+        self.disabled = False
 
     def submit(self):
+        asynckivy.start(self.__save(self.__form.submit()[1]))
+
+    async def __save(self, data):
+        self.disabled = True
         if self.__old_custom_id:
-            Database.update_custom(self.__old_custom_id, self.__form.submit()[1])
-            print(self.__form.submit()[1])
+            await AsyncDatabase.update_custom(self.__old_custom_id, data)
         else:
-            Database.create_custom(self.__form.submit()[1])
-            print(self.__form.submit()[1])
+            await AsyncDatabase.create_custom(data)
         self.__old_custom_id = None
+        self.disabled = False
         if self.__on_submit:
             self.__on_submit()
\ No newline at end of file
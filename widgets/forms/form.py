@@ -1,3 +1,6 @@
+import re
+import asynckivy
+from collections import OrderedDict
 from kivy.clock import Clock
 from kivy.core.window import Window
 from kivy.metrics import dp
@@ -433,15 +436,34 @@ class SearchResults(MDDropdownMenu):
                 "on_release": self.__create_tag
             })
         self.on_items(self, data)
-        self.open()
+        # live search refills the menu while it is showing
+        if self.parent is None:
+            self.open()
 
 # This class is the form that houses all of the
-# other pieces to create a dialog that allows search
+# other pieces to create a dialog that allows search.
+# With live_search on, the text is also searched as it is typed, once it has
+# stayed the same for search_delay seconds. Only the latest search is kept:
+# a newer one cancels the one before it, along with its query on the server.
 class SearchForm(FormStructure, MDBoxLayout):
+    live_search = False
+    search_delay = 0.3
+    # the most results query_database asks for, fewer than this means it got every match
+    search_limit = 20
+    # how many searches the memo remembers
+    memo_size = 64
+
     def __init__(self, *args, **kwargs):
         super(SearchForm, self).__init__(*args, **kwargs)
 
-        self.search_box = TextInput(MDTextFieldHintText(text = "Search"), on_validate = self.search)
+        self.__search_task = None
+        self.__memo = OrderedDict()
+
+        self.search_box = TextInput(
+            MDTextFieldHintText(text = "Search"),
+            on_validate = self.search,
+            on_text_change = self.__on_text_change if self.live_search else None
+        )
         search_button = MDIconButton(icon = "magnify", pos_hint = {"center_y": 0.5})
         search_button.bind(on_press = self.search)
         search_bar = MDBoxLayout(self.search_box, search_button, adaptive_height = True, spacing = "10dp")
@@ -476,14 +498,100 @@ class SearchForm(FormStructure, MDBoxLayout):
             icon.bind(on_press = lambda *args: self.remove_chip(chip))
             self._container.add_widget(chip)
 
-    def search_database(self):
+    # This function is inherited and implemented by
+    # this classes children, it is awaited so the query
+    # can run off of the main loop. By default it goes
+    # through the memo to query_database.
+    async def search_database(self, text):
+        return await self.remembered_search(text)
+
+    # Children that implement these instead of search_database get the memo:
+    # query_database asks for at most search_limit results, search_terms tells the terms
+    # the database looks up for each word of a search (None for a word it drops, and None
+    # for the whole search when that cannot be told here), and matches tells whether one
+    # of the results has every one of those terms, so the database finds it for them too
+    async def query_database(self, text):
         return []
 
-    def search(self, *args):
-        self.results.fill(self.search_database(self.search_box.text))
+    def search_terms(self, text):
+        return None
 
+    def matches(self, entry, terms: list[str]):
+        return False
+
+    @staticmethod
+    def _words(text: str):
+        return re.findall(r"\w+", text.lower())
+
+    # Searches are remembered by their text. One that extends a remembered search whose results were
+    # complete (fewer than search_limit, so nothing was cut off) is answered with those results when
+    # it is certain to find the same ones, and goes to the database otherwise. That is when each term
+    # of the remembered search is the start of the term in its place now (a longer word can have a
+    # different stem, lady is 'ladi' and ladyship 'ladyship', or be a stop word the database drops,
+    # and then it finds what the shorter one did not), and every result still matches. The results
+    # are never filtered down here.
+    async def remembered_search(self, text):
+        key = " ".join(self._words(text))
+        if key in self.__memo:
+            self.__memo.move_to_end(key)
+            return self.__memo[key][0]
+
+        # the longest remembered search is the narrowest one
+        for searched in sorted(self.__memo, key = len, reverse = True):
+            results, complete = self.__memo[searched]
+            if complete and key.startswith(searched):
+                terms = self.search_terms(key)
+                if self.__narrows(self.search_terms(searched), terms) and len(results) != 0:
+                    if all(self.matches(entry, [term for term in terms if term is not None]) for entry in results):
+                        return self.__remember(key, results, True)
+                break
+
+        results = await self.query_database(text)
+        return self.__remember(key, results, len(results) < self.search_limit)
+
+    # whether every term of the earlier search starts the term in its place in the later one
+    @staticmethod
+    def __narrows(before, terms):
+        if before is None or terms is None:
+            return False
+        return all(old is None or (new is not None and new.startswith(old)) for old, new in zip(before, terms))
+
+    def __remember(self, key, results, complete):
+        self.__memo[key] = (results, complete)
+        if len(self.__memo) > self.memo_size:
+            self.__memo.popitem(last = False)
+        return results
+
+    def forget_searches(self):
+        self.__memo.clear()
+
+    def search(self, *args):
+        self.__restart(self.__search(self.search_box.text))
+
+    def __on_text_change(self, text):
+        if text.strip() == "":
+            # an emptied box lists nothing until the search is asked for
+            self.__restart(None)
+        else:
+            self.__restart(self.__search(text, delay = self.search_delay))
+
+    def __restart(self, search):
+        if self.__search_task is not None:
+            self.__search_task.cancel()
+        self.__search_task = asynckivy.start(search) if search is not None else None
+
+    async def __search(self, text, delay = 0):
+        if delay > 0:
+            await asynckivy.sleep(delay)
+        results = await self.search_database(text)
+        # a cancelled search never gets here, this drops one whose text was changed without a new search
+        if text == self.search_box.text:
+            self.results.fill(results)
+
+    # the results may have changed since the form was last open
     def default(self):
         self._container.clear_widgets()
+        self.forget_searches()
 
     def submit(self):
         return self.form_id, [child.submit()[1] for child in self._container.children]
@@ -1,3 +1,4 @@
+import asynckivy
 from kivymd.uix.boxlayout import MDBoxLayout
 from kivymd.uix.scrollview import MDScrollView
 from kivymd.uix.label import MDLabel
@@ -5,6 +6,8 @@ from kivymd.uix.button import MDButton, MDIconButton
 from kivymd.uix.textfield import MDTextFieldHintText, MDTextFieldHelperText
 from kivymd.uix.dialog import MDDialog, MDDialogButtonContainer, MDDialogContentContainer, MDDialogHeadlineText
 from api.database import Database
+from api.asyncdatabase import AsyncDatabase
+from api.batchloader import BatchLoader, LoadError
 from widgets.forms.createtagform import CreateTagForm
 from .form import FormStructure, Form, TextInput, NumberInput, CheckboxInput, SearchForm, TableForm, DropdownInput, TableEntry
 
@@ -83,7 +86,6 @@ class OptionsForm(FormStructure, MDBoxLayout):
     def prefill(self, data):
         for key, value in data.items():
             if isinstance(value, dict):
-                print(value['link'])
                 self.add_form({"option_name": key, "link": value["link"], "link_name": value["link_name"], "option_content": value["content"]})
             else:
                 self.add_form({"option_name": key,  "option_content": value})
@@ -101,53 +103,121 @@ class FinishesForm(TableForm):
 
         self.form_id = "finishes"
 
+    def prefill(self, entries):
+        asynckivy.start(self.__add_entries(entries))
+
     def add_entry(self, entry = None):
-        finishes = [{"value": entry["id"], "text": entry["name"]} for entry in Database.get_metal_finishes_list()]
-        table_entry = TableEntry(
-            DropdownInput(form_id = "finish", data = finishes),
-            NumberInput(MDTextFieldHintText(text = "Price Difference"), form_id = "difference", role = "medium"),
-            CheckboxInput(form_id = "default", size_hint_x = 0.2),
-            on_remove = self.remove_entry
-        )
+        asynckivy.start(self.__add_entries([entry]))
+
+    # the finishes are loaded once for the whole batch so prefilled
+    # entries keep their order no matter when the query returns
+    async def __add_entries(self, entries):
+        finishes = [{"value": finish["id"], "text": finish["name"]} for finish in await AsyncDatabase.get_metal_finishes_list()]
+        for entry in entries:
+            table_entry = TableEntry(
+                DropdownInput(form_id = "finish", data = finishes),
+                NumberInput(MDTextFieldHintText(text = "Price Difference"), form_id = "difference", role = "medium"),
+                CheckboxInput(form_id = "default", size_hint_x = 0.2),
+                on_remove = self.remove_entry
+            )
 
-        if entry is not None:
-            table_entry.prefill(entry)
+            if entry is not None:
+                table_entry.prefill(entry)
 
-        self._container.add_widget(table_entry)
+            self._container.add_widget(table_entry)
 
 class ReplacementForm(SearchForm):
+    live_search = True
+
+    # shared by every replacement form, so prefilling all the variations of a product is one query
+    __replacements = BatchLoader(AsyncDatabase.get_replacements, key = lambda row: (row["id"]["id"], row["id"]["extension"]))
+
     def __init__(self, *args, **kwargs):
         super(ReplacementForm, self).__init__(*args, **kwargs)
 
         self.form_id = "replacements"
     
-    def search_database(self, text):
-        return Database.get_replacement_list(text)
+    # a typo finds nothing by prefix, so the closest matches are looked up instead
+    async def search_database(self, text):
+        return await super(ReplacementForm, self).search_database(text) or await AsyncDatabase.get_replacement_list(text, fuzzy = True)
+
+    async def query_database(self, text):
+        return await AsyncDatabase.get_replacement_list(text, limit = self.search_limit)
+
+    # the stems the database looks up for the words
+    def search_terms(self, text):
+        return Database.search_stems(text)
+
+    # The database finds a replacement when every stem starts one of the terms of its listing,
+    # or every stem starts one of the terms of its variation
+    def matches(self, replacement, stems):
+        return any(
+            all(any(term.startswith(stem) for term in terms) for stem in stems)
+            for terms in [replacement["listing_terms"], replacement["variation_terms"]]
+        )
 
     def prefill(self, replacements):
-        replacements = [Database.get_replacement(replacement["id"], replacement["extension"]) for replacement in replacements]
-        for replacement in replacements:
-            self.append({"id": replacement["id"]["id"], "extension": replacement["id"]["extension"]}, replacement["name"])
+        self.forget_searches()
+        asynckivy.start(self.__load(replacements))
+
+    async def __load(self, replacements):
+        try:
+            loaded = await self.__replacements.load_many([(replacement["id"], replacement["extension"]) for replacement in replacements])
+        except LoadError as error:
+            # the names could not be read, the replacements are still listed by id so a save keeps them
+            print("Error while loading replacements: " + str(error))
+            for replacement in replacements:
+                self.append({"id": replacement["id"], "extension": replacement["extension"]}, f"{replacement["id"]} {replacement["extension"]}")
+            return
+        for replacement in loaded:
+            if replacement is not None:
+                self.append({"id": replacement["id"]["id"], "extension": replacement["id"]["extension"]}, replacement["name"])
 
     def submit(self):
         return self.form_id, [child.submit()[1] for child in self._container.children]
 
 class TagForm(SearchForm):
+    live_search = True
+
+    # shared by every tag form, so prefilling all the variations of a product is one query
+    __tags = BatchLoader(AsyncDatabase.get_tags)
+
     def __init__(self, *args, **kwargs):
         super(TagForm, self).__init__(*args, **kwargs)
 
         self.form_id = "tags"
-
-    def search_database(self, text):
-        return Database.get_tag_list(text)
-
+        self.__create_tag_form = None
+
+    # Once the tag index is loaded the search is answered from memory on the spot, otherwise
+    # (the first search, or after the index was dropped) a worker reads it. A typo finds nothing
+    # by prefix, so the closest matches are looked up in the database instead.
+    async def search_database(self, text):
+        tags = Database.search_loaded_tags(text)
+        if tags is None:
+            tags = await AsyncDatabase.search_tags(text)
+        return tags or await AsyncDatabase.get_tag_list(text, fuzzy = True)
+
+    # the dialog is built on the first click and reused after that
     def create_tag(self):
-        CreateTagForm().open()
+        if self.__create_tag_form is None:
+            self.__create_tag_form = CreateTagForm()
+        self.__create_tag_form.default()
 
     def prefill(self, tags):
-        tags = [Database.get_tag(tag) for tag in tags]
-        for tag in tags:
-            self.append(tag["id"], tag["name"])
+        asynckivy.start(self.__load(tags))
+
+    async def __load(self, tags):
+        try:
+            loaded = await self.__tags.load_many(tags)
+        except LoadError as error:
+            # the names could not be read, the tags are still listed by id so a save keeps their links
+            print("Error while loading tags: " + str(error))
+            for id in tags:
+                self.append(id, str(id))
+            return
+        for tag in loaded:
+            if tag is not None:
+                self.append(tag["id"], tag["name"])
 
 class ProductVariationForm(SearchForm):
     def __init__(self, *args, **kwargs):
@@ -155,8 +225,8 @@ class ProductVariationForm(SearchForm):
 
         self.form_id = "__form"
 
-    def search_database(self, text):
-        return Database.search_products(text)
+    async def search_database(self, text):
+        return await AsyncDatabase.search_products(text)
 
     def prefill(self, data):
         data = [Database.get_product(id)[0] for id in ids]
@@ -1,10 +1,11 @@
+import asynckivy
 from kivymd.theming import ThemableBehavior
 from kivymd.uix.boxlayout import MDBoxLayout
 from kivymd.uix.scrollview import MDScrollView
 from kivymd.uix.label import MDLabel
 from kivymd.uix.textfield import MDTextFieldHelperText, MDTextFieldHintText, MDTextFieldLeadingIcon
 from kivymd.uix.button import MDIconButton
-from api.database import Database
+from api.asyncdatabase import AsyncDatabase
 from widgets.forms.form import FormStructure, Form, TextInput, CheckboxInput, CheckGroup, SwitchInput, TabForm, NumberInput, DropdownInput
 from widgets.forms.overviewforms import ReplacementForm, TagForm, FinishesForm, OptionsForm
 
@@ -373,15 +374,26 @@ class ProductForm(FormStructure, MDBoxLayout):
     def prefill(self, id):
         self.__reset()
         self.__old_product_id = id
-        self.__form.prefill(Database.get_product(self.__old_product_id))
+        asynckivy.start(self.__load(id))
+
+    async def __load(self, id):
+        # the form stays disabled while the product is on its way
+        self.disabled = True
+        self.__form.prefill(await AsyncDatabase.get_product(id))
 
         self.variation_number = VariationForm.get_variation_number()
+        self.disabled = False
 
     def submit(self):
+        asynckivy.start(self.__save(self.__form.submit()[1]))
+
+    async def __save(self, data):
+        self.disabled = True
         if self.__old_product_id:
-            Database.update_product(self.__old_product_id, self.__form.submit()[1])
+            await AsyncDatabase.update_product(self.__old_product_id, data)
         else:
-            Database.create_product(self.__form.submit()[1])
+            await AsyncDatabase.create_product(data)
         self.__old_product_id = None
+        self.disabled = False
         if self.__on_submit:
             self.__on_submit()